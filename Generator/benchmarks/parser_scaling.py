@@ -0,0 +1,100 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from generate import FootprintParser  # noqa: E402
+
+
+REPO_ROOT = Path(__file__).resolve().parent.parent.parent
+
+
+class LegacyFootprintParser:
+    # The recursive, char-by-char parser that FootprintParser replaced; kept here for comparison only
+
+    def __init__(self, input_string):
+        input_string = input_string.replace('\n', ' ').replace('\r', ' ').replace('\t', ' ')
+        self.processed_list = self.parse_list(input_string, 1)["item"]
+
+    def parse_list(self, input_string, start_index):
+        ret_list = []
+        loop_index = start_index
+        while True:
+            if input_string[loop_index] == '(':
+                ret = self.parse_list(input_string, loop_index + 1)
+                ret_list.append(ret["item"])
+                loop_index = ret["end_index"] + 1
+                continue
+            elif input_string[loop_index] == ')':
+                return {"item": ret_list, "end_index": loop_index}
+            elif input_string[loop_index] != ' ':
+                ret = self.parse_literal(input_string, loop_index)
+                ret_list.append(ret["item"])
+                loop_index = ret["end_index"]
+                continue
+            loop_index += 1
+
+    def parse_literal(self, input_string, start_index):
+        token = ""
+        loop_index = start_index
+        within_quotes = False
+        while True:
+            if input_string[loop_index] == '"':
+                within_quotes = not within_quotes
+            elif input_string[loop_index] in ' )' and not within_quotes:
+                return {"item": token, "end_index": loop_index}
+            token += input_string[loop_index]
+            loop_index += 1
+
+
+# Builds a board-sized s-expression by repeating the body of a template until it reaches target_size bytes
+def synthesize_input(template_path, target_size):
+    template = template_path.read_text()
+    head, _, body = template.partition("\n")
+    body = body.rstrip().rstrip(")")
+    repeats = max(1, target_size // max(1, len(body)))
+    return head + "\n" + body * repeats + ")\n"
+
+
+def time_call(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == '__main__':
+
+    description_cmd = "Compares FootprintParser against the legacy recursive parser on inputs of growing size."
+    arg_parser = argparse.ArgumentParser(
+        description=description_cmd, formatter_class=argparse.RawTextHelpFormatter)
+    arg_parser.add_argument("-i", "--input-file", dest="input_file",
+                            help="Optional: Template used to synthesize inputs.",
+                            default=str(REPO_ROOT / "Template.pretty" / "MX-Hotswap-Template.kicad_mod"))
+    arg_parser.add_argument("-s", "--sizes", dest="sizes", help="Optional: Input sizes in KiB.",
+                            type=int, nargs="+", default=[64, 256, 1024, 4096])
+    arg_parser.add_argument("--legacy-limit", dest="legacy_limit",
+                            help="Optional: Largest input size in KiB to run the legacy parser on.",
+                            type=int, default=1024)
+    arg_parser.add_argument("-r", "--repeat", dest="repeat", help="Optional: Runs per measurement (best is kept).",
+                            type=int, default=3)
+    args = arg_parser.parse_args()
+
+    print(f"{'size KiB':>10} {'new ms':>10} {'new ns/B':>10} {'legacy ms':>10} {'legacy ns/B':>12} {'speedup':>8}")
+    for size_kib in args.sizes:
+        input_string = synthesize_input(Path(args.input_file), size_kib * 1024)
+        input_bytes = input_string.encode()
+
+        new_time = time_call(lambda: FootprintParser(input_bytes), args.repeat)
+        row = f"{len(input_bytes) / 1024:>10.0f} {new_time * 1000:>10.1f} {new_time * 1e9 / len(input_bytes):>10.1f}"
+
+        if size_kib <= args.legacy_limit:
+            legacy_time = time_call(lambda: LegacyFootprintParser(input_string), args.repeat)
+            row += f" {legacy_time * 1000:>10.1f} {legacy_time * 1e9 / len(input_bytes):>12.1f} {legacy_time / new_time:>7.1f}x"
+        else:
+            row += f" {'-':>10} {'-':>12} {'-':>8}"
+        print(row)
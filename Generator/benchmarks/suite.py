@@ -0,0 +1,280 @@
+import argparse
+import gc
+import json
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import families  # noqa: E402
+from generate import (CompiledTemplate, FootprintEncoder, FootprintParser, FootprintsGenerator,  # noqa: E402
+                      KEYSIZES_TYPES, SpanParser, parse_footprint_file)
+from generate_all import build_all, resolve_families  # noqa: E402
+from parser_scaling import synthesize_input  # noqa: E402
+from transform import FootprintTransformer, step_angles  # noqa: E402
+
+
+REPO_ROOT = Path(__file__).resolve().parent.parent.parent
+
+DEFAULT_BASELINE_FILE = Path(__file__).resolve().parent / "baselines.json"
+
+# Percent a case may get slower (or use more peak memory) than its baseline before the run fails
+DEFAULT_THRESHOLD = 10
+
+# Used by the keysize cases for tables no family in families.py uses
+DEFAULT_TEMPLATE = REPO_ROOT / "Template.pretty" / "MX-Hotswap-Template.kicad_mod"
+
+
+# Benchmark case
+# function: Runs one measured iteration
+# work: Amount of work done per iteration, in unit (bytes, footprints), for throughput
+def create_case(name, function, work, unit):
+    return {"name": name, "function": function, "work": work, "unit": unit}
+
+
+# FootprintParser, SpanParser and FootprintEncoder on every template, and on synthetic board-sized inputs
+def create_template_cases(template_paths, synthetic_sizes):
+    inputs = [(template_path.name, template_path.read_bytes()) for template_path in template_paths]
+    for size_kib in synthetic_sizes:
+        synthetic_input = synthesize_input(DEFAULT_TEMPLATE, size_kib * 1024).encode()
+        inputs.append((f"synthetic-{size_kib}KiB", synthetic_input))
+
+    cases = []
+    for input_name, input_data in inputs:
+        footprint = FootprintParser(input_data).processed_list
+        cases.append(create_case(f"parse/{input_name}", lambda input_data=input_data: FootprintParser(input_data),
+                                 len(input_data), "B"))
+        cases.append(create_case(f"span_parse/{input_name}", lambda input_data=input_data: SpanParser(input_data),
+                                 len(input_data), "B"))
+        cases.append(create_case(f"encode/{input_name}",
+                                 lambda footprint=footprint: FootprintEncoder(footprint=footprint, debug=False),
+                                 len(input_data), "B"))
+    return cases
+
+
+# FootprintTransformer applying a full set of 5 degree steps to every template (coordinates only, no encoding)
+def create_transform_cases(template_paths):
+    angles = step_angles(5)
+    cases = []
+    for template_path in template_paths:
+        transformer = FootprintTransformer(FootprintParser(template_path.read_bytes()).processed_list,
+                                           convert_rectangles=True)
+
+        def apply_angles(transformer=transformer):
+            for angle in angles:
+                transformer.apply(angle=angle)
+
+        cases.append(create_case(f"transform/{template_path.name}", apply_angles, len(angles), "footprints"))
+    return cases
+
+
+# In-memory generation of every keysize of each KEYSIZES_* table (no disk writes)
+# keysizes/<type> starts each iteration from a new generator, so geometry columns and fragments are computed
+# again; keysizes/<type>/warm reuses one generator and its FragmentCache, timing cache lookups and UUID filling
+def create_keysize_cases(family_defs):
+    templates = {family_def["keysizes_type"]: family_def for family_def in reversed(family_defs)}
+    cases = []
+    for keysizes_type, keysize_defs in KEYSIZES_TYPES.items():
+        family_def = templates.get(keysizes_type, {"template": DEFAULT_TEMPLATE, "family_name": "Benchmark",
+                                                   "unit_width": 19.05, "unit_height": 19.05})
+        compiled_template = CompiledTemplate(parse_footprint_file(input_file=family_def["template"], debug=False))
+
+        def create_generator(compiled_template=compiled_template, keysizes_type=keysizes_type,
+                             keysize_defs=keysize_defs, family_def=family_def):
+            return FootprintsGenerator(
+                input_file=None, output_dir=None, keysizes_type=keysizes_type, family_name=family_def["family_name"],
+                unit_width=family_def["unit_width"], unit_height=family_def["unit_height"], debug=False,
+                footprint=compiled_template, keysize_defs=keysize_defs, deterministic=True)
+
+        def render_table(footprints_generator, compiled_template=compiled_template, keysizes_type=keysizes_type,
+                         keysize_defs=keysize_defs, family_def=family_def):
+            return sum(len(footprints_generator.render_keysize(
+                compiled_template=compiled_template, keysize_def=keysize_def, keysizes_type=keysizes_type,
+                unit_width=family_def["unit_width"], unit_height=family_def["unit_height"]))
+                for keysize_def in keysize_defs)
+
+        warm_generator = create_generator()
+        footprint_count = render_table(warm_generator)
+
+        def render_cold(create_generator=create_generator, render_table=render_table):
+            render_table(create_generator())
+
+        def render_warm(warm_generator=warm_generator, render_table=render_table):
+            render_table(warm_generator)
+
+        cases.append(create_case(f"keysizes/{keysizes_type}", render_cold, footprint_count, "footprints"))
+        cases.append(create_case(f"keysizes/{keysizes_type}/warm", render_warm, footprint_count, "footprints"))
+    return cases
+
+
+# Equivalent of generate-all.sh: every family from families.py, from template parsing to written files
+# Each iteration writes into a fresh temporary tree so nothing is skipped as unchanged
+def create_end_to_end_case(family_defs, jobs):
+    def generate_all():
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output_defs = []
+            for family_def in family_defs:
+                output_dir = Path(temp_dir) / family_def["output_dir"].name
+                output_dir.mkdir(exist_ok=True)
+                output_defs.append({**family_def, "output_dir": output_dir})
+            return build_all(family_defs=output_defs, jobs=jobs, debug=False, deterministic=True)
+
+    footprint_count = sum(len(result[1]) for result in generate_all())
+    return create_case(f"generate_all/jobs={jobs}", generate_all, footprint_count, "footprints")
+
+
+# Best wall time over repeat iterations, then peak traced allocation of one more iteration
+# (tracing slows Python down, so it never overlaps the timed runs; worker processes are not traced)
+def measure(case, repeat):
+    function = case["function"]
+    best_time = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best_time = elapsed if best_time is None else min(best_time, elapsed)
+
+    gc.collect()
+    tracemalloc.start()
+    function()
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "seconds": best_time,
+        "throughput": case["work"] / best_time if best_time else 0,
+        "unit": case["unit"],
+        "peak_memory": peak_memory,
+    }
+
+
+# Returns a list of (case name, metric, baseline value, current value) for each metric over the threshold
+def find_regressions(results, baselines, threshold):
+    regressions = []
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        if baseline is None:
+            continue
+        for metric in ("seconds", "peak_memory"):
+            if baseline[metric] and result[metric] > baseline[metric] * (1 + threshold / 100):
+                regressions.append((name, metric, baseline[metric], result[metric]))
+    return regressions
+
+
+def load_baselines(baseline_path):
+    try:
+        with baseline_path.open() as baseline_file:
+            return json.load(baseline_file)["results"]
+    except FileNotFoundError:
+        return {}
+
+
+def save_baselines(baseline_path, results):
+    with baseline_path.open(mode='w') as baseline_file:
+        json.dump({
+            "python": platform.python_version(),
+            "machine": platform.platform(),
+            "results": results,
+        }, baseline_file, indent=4, sort_keys=True)
+
+
+def format_throughput(throughput, unit):
+    if unit == "B":
+        return f"{throughput / 1e6:.2f} MB/s"
+    return f"{throughput:.0f} {unit}/s"
+
+
+if __name__ == '__main__':
+
+    # Parse args
+
+    description_cmd = "Times the parser, the encoder, footprint transforms, per-table keysize generation and a full library build,\n" \
+                      "and fails when a case regresses past its saved baseline."
+    arg_parser = argparse.ArgumentParser(
+        description=description_cmd, formatter_class=argparse.RawTextHelpFormatter)
+
+    description_filter = "Optional: Only run cases whose name contains one of these strings (i.e. parse/ keysizes/)."
+    arg_parser.add_argument("-f", "--filter", dest="filter", help=description_filter, nargs="+")
+
+    description_sizes = "Optional: Synthetic board-sized parser/encoder inputs in KiB."
+    arg_parser.add_argument("-s", "--sizes", dest="sizes", help=description_sizes,
+                            type=int, nargs="*", default=[256, 2048])
+
+    description_jobs = "Optional: Worker processes of the end-to-end build. Defaults to 1 (in-process)."
+    arg_parser.add_argument("-j", "--jobs", dest="jobs", help=description_jobs, type=int, default=1)
+
+    description_repeat = "Optional: Runs per case (best time is kept)."
+    arg_parser.add_argument("-r", "--repeat", dest="repeat", help=description_repeat, type=int, default=5)
+
+    description_baseline_file = f"Optional: Baselines file. Defaults to {DEFAULT_BASELINE_FILE.name} next to this script."
+    arg_parser.add_argument("-b", "--baseline-file", dest="baseline_file",
+                            help=description_baseline_file, default=str(DEFAULT_BASELINE_FILE))
+
+    description_save = "Optional: Store this run's results as the new baselines (merged with existing ones)."
+    arg_parser.add_argument("--save-baseline", dest="save_baseline", help=description_save, action="store_true")
+
+    description_threshold = f"Optional: Allowed regression in percent. Defaults to {DEFAULT_THRESHOLD}."
+    arg_parser.add_argument("-t", "--threshold", dest="threshold", help=description_threshold,
+                            type=float, default=DEFAULT_THRESHOLD)
+
+    description_json = "Optional: Also write this run's results to a JSON file."
+    arg_parser.add_argument("--json", dest="json_file", help=description_json)
+
+    args = arg_parser.parse_args()
+
+    if args.repeat < 1 or args.jobs < 1:
+        print("Repeat and job counts must be positive", file=sys.stderr)
+        sys.exit(1)
+
+    # Collect cases
+
+    family_defs = resolve_families(families.FAMILIES, REPO_ROOT)
+    template_paths = sorted({family_def["template"] for family_def in family_defs})
+
+    def selected(name):
+        return not args.filter or any(pattern in name for pattern in args.filter)
+
+    cases = create_template_cases(template_paths, args.sizes) + create_transform_cases(template_paths) + \
+        create_keysize_cases(family_defs)
+    # The end-to-end case runs a full build while being set up, so it is only created when selected
+    if selected(f"generate_all/jobs={args.jobs}"):
+        cases.append(create_end_to_end_case(family_defs, args.jobs))
+    cases = [case for case in cases if selected(case["name"])]
+
+    # Measure
+
+    baseline_path = Path(args.baseline_file)
+    baselines = load_baselines(baseline_path)
+    results = {}
+
+    print(f"{'case':<52} {'time ms':>10} {'throughput':>18} {'peak KiB':>10} {'vs baseline':>12}")
+    for case in cases:
+        result = measure(case, args.repeat)
+        results[case["name"]] = result
+        row = f"{case['name']:<52} {result['seconds'] * 1000:>10.2f} " \
+              f"{format_throughput(result['throughput'], result['unit']):>18} {result['peak_memory'] / 1024:>10.0f}"
+        if case["name"] in baselines:
+            row += f" {(result['seconds'] / baselines[case['name']]['seconds'] - 1) * 100:>+11.1f}%"
+        print(row)
+
+    if args.json_file:
+        with open(args.json_file, mode='w') as json_file:
+            json.dump(results, json_file, indent=4, sort_keys=True)
+
+    if args.save_baseline:
+        save_baselines(baseline_path, {**baselines, **results})
+        print(f"Saved baselines to {baseline_path}")
+        sys.exit(0)
+
+    # Fail on regressions
+
+    regressions = find_regressions(results, baselines, args.threshold)
+    for name, metric, baseline_value, value in regressions:
+        print(f"Regression: {name} {metric} {baseline_value:.6g} -> {value:.6g} "
+              f"({(value / baseline_value - 1) * 100:+.1f}%, threshold {args.threshold:g}%)", file=sys.stderr)
+    if regressions:
+        sys.exit(1)
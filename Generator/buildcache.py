@@ -0,0 +1,97 @@
+import hashlib
+import json
+import os
+from generate import GENERATOR_VERSION
+
+
+# Build-state cache for incremental rebuilds
+# Each family/keysize pair is stored under an ID with the hash of every input that affects its output
+# (template content, keysize entry, generator version, generation options and rewritten model references)
+# and the stat of each written file.
+# A pair is fresh when that hash matches and every recorded file still exists unmodified.
+#
+# File format:
+# {
+#     "generator_version": GENERATOR_VERSION,
+#     "entries": {
+#         entry ID: {
+#             "key": input hash,
+#             "outputs": { output path: [size, mtime_ns], ... }
+#         },
+#         ...
+#     }
+# }
+class BuildCache:
+
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self.entries = {}
+        self.changed = False
+        self.load()
+
+    def load(self):
+        try:
+            with self.cache_path.open() as cache_file:
+                cache_data = json.load(cache_file)
+        except (FileNotFoundError, ValueError):
+            return
+        if cache_data.get("generator_version") == GENERATOR_VERSION:
+            self.entries = cache_data.get("entries", {})
+
+    def save(self):
+        if not self.changed:
+            return
+        temp_path = self.cache_path.with_name(self.cache_path.name + ".tmp")
+        with temp_path.open(mode='w') as cache_file:
+            json.dump({"generator_version": GENERATOR_VERSION, "entries": self.entries}, cache_file)
+        os.replace(temp_path, self.cache_path)
+        self.changed = False
+
+    # Hashes everything that affects the output of one family/keysize pair
+    @staticmethod
+    def build_key(template_hash, family_def, keysize_def, deterministic):
+        key_data = {
+            "generator_version": GENERATOR_VERSION,
+            "template_hash": template_hash,
+            "keysize_def": keysize_def,
+            "keysizes_type": family_def["keysizes_type"],
+            "family_name": family_def["family_name"],
+            "unit_width": family_def["unit_width"],
+            "unit_height": family_def["unit_height"],
+            "deterministic": deterministic,
+            "models": family_def.get("models", {}),
+        }
+        return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode()).hexdigest()
+
+    @staticmethod
+    def entry_id(family_def, keysize_def):
+        return f"{family_def['output_dir']}/{family_def['family_name']}/{keysize_def.get('keysize')}"
+
+    def is_fresh(self, entry_id, key):
+        entry = self.entries.get(entry_id)
+        if entry is None or entry["key"] != key:
+            return False
+        for output_path, recorded_stat in entry["outputs"].items():
+            try:
+                stat = os.stat(output_path)
+            except FileNotFoundError:
+                return False
+            if [stat.st_size, stat.st_mtime_ns] != recorded_stat:
+                return False
+        return True
+
+    def record(self, entry_id, key, output_paths):
+        outputs = {}
+        for output_path in output_paths:
+            stat = os.stat(output_path)
+            outputs[str(output_path)] = [stat.st_size, stat.st_mtime_ns]
+        self.entries[entry_id] = {"key": key, "outputs": outputs}
+        self.changed = True
+
+
+def hash_file(file_path):
+    file_hash = hashlib.sha256()
+    with file_path.open(mode='rb') as hashed_file:
+        for chunk in iter(lambda: hashed_file.read(1 << 20), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
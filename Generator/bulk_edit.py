@@ -0,0 +1,260 @@
+import argparse
+import json
+import os
+import sys
+from fnmatch import fnmatchcase
+from pathlib import Path
+from footprint_tree import unquote
+from generate import FootprintParseError, SpanParser, logger
+from instrumentation import configure_logging
+
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Libraries searched by default, relative to the root
+DEFAULT_LIBRARY_GLOB = "*.pretty"
+
+# Characters of each match printed by queries
+QUERY_PREVIEW_LENGTH = 100
+
+
+# Queries and rewrites footprints across every library in a single process pool
+# Files are parsed with generate.SpanParser; each rule edit replaces one byte range of the original file and
+# every untouched range is passed through as a memoryview slice, so formatting, comments and unrelated
+# tokens stay byte-identical and files without changes are never written
+#
+# Rules (JSON list, applied to every list they match, in order; the first rule to touch a byte range wins):
+# [
+#     {
+#         "match": List path, i.e. "layer", "pad/layers" or "footprint/*/layer"; each part is an fnmatch pattern
+#                  for a list name and the path only has to match the end of the list's ancestry,
+#         "where": Optional {atom index: value or [values]} that matching lists must hold
+#                  (index 0 is the name; values are compared without quotes),
+#         One of
+#         "replace": {old value: new value} for atoms (quotes are kept as they were),
+#         "set": [raw tokens] replacing every atom between the name and the first sub-list,
+#         "remove": true to delete the list (and the whitespace before it)
+#     },
+#     ...
+# ]
+#
+# Example (KiCad 7 -> 8 layer names and file version):
+#   [{"match": "layer", "replace": {"F.SilkS": "F.Silkscreen", "B.SilkS": "B.Silkscreen"}},
+#    {"match": "footprint/version", "set": ["20240108"]}]
+
+
+class RuleError(Exception):
+    pass
+
+
+RULE_ACTIONS = ("replace", "set", "remove")
+
+
+# Validates rules and splits their match paths
+def compile_rules(rules):
+    if not isinstance(rules, list):
+        raise RuleError("Rules must be a JSON list")
+    compiled_rules = []
+    for rule_index, rule in enumerate(rules):
+        if not isinstance(rule, dict) or not isinstance(rule.get("match"), str):
+            raise RuleError(f"Rule {rule_index + 1}: match path missing")
+        actions = [action for action in RULE_ACTIONS if action in rule]
+        if len(actions) > 1:
+            raise RuleError(f"Rule {rule_index + 1}: only one of {', '.join(RULE_ACTIONS)} allowed")
+        where = {}
+        for atom_index, values in rule.get("where", {}).items():
+            where[int(atom_index)] = set(values) if isinstance(values, list) else {values}
+        compiled_rules.append({**rule, "path": rule["match"].split("/"), "where": where,
+                               "action": actions[0] if actions else None})
+    return compiled_rules
+
+
+def rule_matches(rule, node, ancestry):
+    path = rule["path"]
+    if len(path) > len(ancestry) or not all(
+            fnmatchcase(name or "", pattern) for name, pattern in zip(ancestry[-len(path):], path)):
+        return False
+    for atom_index, values in rule["where"].items():
+        if atom_index >= len(node) or isinstance(node[atom_index], list) or unquote(node[atom_index]) not in values:
+            return False
+    return True
+
+
+# Edits rules make to a parsed file
+# Returns (matching lists, [(start, end, replacement bytes), ...])
+def collect_edits(data, root, rules):
+    matches = []
+    edits = []
+    stack = [(root, [root.name])]
+    while stack:
+        node, ancestry = stack.pop()
+        removed = False
+        for rule in rules:
+            if not rule_matches(rule, node, ancestry):
+                continue
+            matches.append(node)
+            if rule["action"] == "replace":
+                for element, (start, end) in zip(node, node.spans):
+                    if isinstance(element, list):
+                        continue
+                    new_value = rule["replace"].get(unquote(element))
+                    if new_value is not None:
+                        quoted = element.startswith('"')
+                        edits.append((start, end, (f'"{new_value}"' if quoted else new_value).encode()))
+            elif rule["action"] == "set":
+                atoms_span = node.atoms_span()
+                new_atoms = " ".join(rule["set"]).encode()
+                if atoms_span is not None:
+                    edits.append((atoms_span[0], atoms_span[1], new_atoms))
+                else:
+                    name_end = node.spans[0][1]
+                    edits.append((name_end, name_end, b" " + new_atoms))
+            elif rule["action"] == "remove":
+                start = node.start
+                while start > 0 and data[start - 1] in b" \t\r\n":
+                    start -= 1
+                edits.append((start, node.end, b""))
+                removed = True
+        if not removed:
+            stack.extend((element, ancestry + [element.name])
+                         for element in reversed(node) if isinstance(element, list))
+    return matches, edits
+
+
+# Chunks of the rewritten file: memoryview slices of the original data around each replacement
+# Edits overlapping an earlier one (by position, then rule order) and edits that change nothing are dropped
+def apply_edits(data, edits):
+    view = memoryview(data)
+    chunks = []
+    position = 0
+    for start, end, replacement in sorted(edits, key=lambda edit: (edit[0], edit[1])):
+        if start < position or view[start:end] == replacement:
+            continue
+        chunks.append(view[position:start])
+        chunks.append(replacement)
+        position = end
+    if not chunks:
+        return None
+    chunks.append(view[position:])
+    return chunks
+
+
+# Pool task: queries or rewrites one file
+# Returns (file path, [(line, column, preview), ...] for every match, whether the file changed)
+def process_file(task):
+    file_path, rules, dry_run = task
+    data = file_path.read_bytes()
+    try:
+        root = SpanParser(data).processed_list
+    except FootprintParseError as e:
+        raise FootprintParseError(f"{file_path}: {e.message}", e.line, e.column)
+    matches, edits = collect_edits(data, root, rules)
+    results = []
+    for node in matches:
+        line = data.count(b"\n", 0, node.start) + 1
+        column = node.start - (data.rfind(b"\n", 0, node.start) + 1) + 1
+        preview = " ".join(str(data[node.start:node.end], "utf-8").split())
+        results.append((line, column, preview[:QUERY_PREVIEW_LENGTH]))
+
+    chunks = apply_edits(data, edits)
+    if chunks is not None and not dry_run:
+        temp_path = file_path.with_name(file_path.name + ".tmp")
+        with temp_path.open(mode='wb') as output_file:
+            output_file.writelines(chunks)
+        os.replace(temp_path, file_path)
+    return file_path, results, chunks is not None
+
+
+# Runs rules over every file, in a process pool unless jobs is 1
+# Returns a list of process_file results, in file order
+def process_files(file_paths, rules, jobs, dry_run=False):
+    tasks = [(file_path, rules, dry_run) for file_path in file_paths]
+    if jobs == 1 or len(tasks) < 2:
+        return [process_file(task) for task in tasks]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(process_file, tasks, chunksize=16))
+
+
+def find_footprint_files(root, library_glob):
+    return sorted(file_path for library_path in sorted(root.glob(library_glob)) if library_path.is_dir()
+                  for file_path in library_path.glob("*.kicad_mod"))
+
+
+if __name__ == '__main__':
+
+    # Parse args
+
+    description_cmd = "Queries and rewrites lists in every footprint of every library in place, keeping all\n" \
+                      "untouched bytes (formatting included) as they are. See the comment at the top for the rule format."
+    arg_parser = argparse.ArgumentParser(
+        description=description_cmd, formatter_class=argparse.RawTextHelpFormatter)
+
+    description_rules = "Specify a JSON file with a list of rules, or a JSON list of rules directly."
+    description_query = "Specify a list path to print every match of (i.e. \"pad/layers\"); nothing is modified."
+    rules_group = arg_parser.add_mutually_exclusive_group(required=True)
+    rules_group.add_argument("-s", "--rules", dest="rules", help=description_rules)
+    rules_group.add_argument("-q", "--query", dest="query", help=description_query)
+
+    description_root = "Optional: Directory holding the libraries. Defaults to the repository root."
+    arg_parser.add_argument("-r", "--root", dest="root", help=description_root, default=str(REPO_ROOT))
+
+    description_libraries = f"Optional: Glob of the library directories to process. Defaults to {DEFAULT_LIBRARY_GLOB}."
+    arg_parser.add_argument("-l", "--libraries", dest="libraries", help=description_libraries,
+                            default=DEFAULT_LIBRARY_GLOB)
+
+    description_jobs = "Optional: Number of worker processes. Defaults to the CPU count; 1 runs in-process."
+    arg_parser.add_argument("-j", "--jobs", dest="jobs", help=description_jobs, type=int, default=os.cpu_count() or 1)
+
+    description_dry_run = "Optional: Only list the files the rules would change."
+    arg_parser.add_argument("-n", "--dry-run", dest="dry_run", help=description_dry_run, action="store_true")
+
+    description_debug = "Optional: Enable debug mode."
+    arg_parser.add_argument("-d", "--debug", dest="debug",
+                            help=description_debug, action="store_true")
+
+    args = arg_parser.parse_args()
+    configure_logging(args.debug)
+
+    # Sanity check args
+
+    root = Path(args.root)
+    if not root.is_dir():
+        print("Root dir invalid", file=sys.stderr)
+        sys.exit(1)
+
+    if args.jobs < 1:
+        print("Job count invalid", file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        if args.query:
+            rules = compile_rules([{"match": args.query}])
+        elif Path(args.rules).is_file():
+            rules = compile_rules(json.loads(Path(args.rules).read_text()))
+        else:
+            rules = compile_rules(json.loads(args.rules))
+    except (RuleError, ValueError) as e:
+        print(f"Rules invalid: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    # Process footprints
+
+    file_paths = find_footprint_files(root, args.libraries)
+    logger.debug("Processing %d footprints", len(file_paths))
+    try:
+        results = process_files(file_paths, rules, args.jobs, dry_run=args.dry_run or bool(args.query))
+    except FootprintParseError as e:
+        print(f"Footprint parsing failed: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.query:
+        for file_path, matches, _ in results:
+            for line, column, preview in matches:
+                print(f"{file_path.relative_to(root)}:{line}:{column}: {preview}")
+        sys.exit(0)
+
+    changed_paths = [file_path for file_path, _, changed in results if changed]
+    for file_path in changed_paths:
+        print(f"{'would change' if args.dry_run else 'changed'}: {file_path.relative_to(root)}")
+    print(f"{len(changed_paths)} of {len(file_paths)} footprints {'would change' if args.dry_run else 'changed'}")
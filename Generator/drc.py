@@ -0,0 +1,269 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+import families
+from footprint_tree import child_numbers, find_child
+from generate import CompiledTemplate, FootprintParseError, FootprintsGenerator, get_keysizes, parse_footprint_file
+from generate_all import REPO_ROOT, load_manifest, resolve_families
+from instrumentation import configure_logging
+from spatial import GridIndex, circle, oval, rectangle, shape_bounds, shape_distance, rotate_point
+
+
+# Design-rule check of generated footprints: copper-to-copper clearance between pads, clearance between drills
+# and clearance between drills and the copper of other pads (i.e. stabilizer holes placed onto a socket pad or
+# switch pin of a tight template)
+# Pads sharing a number are one net: their copper and drills may touch (the merged MX/Alps pins of hybrid templates)
+#
+# Pads of the template are extracted and checked against each other once per template; only the generated pads
+# of each variant are then checked against them, through a GridIndex so each pad is compared with its
+# neighbours only. Variants with identical generated pads share one result, so a whole family (or a large
+# parametric sweep) costs little more than its distinct stabilizer layouts
+
+# Minimum distance between the copper of two pads of different nets, in mm
+DEFAULT_CLEARANCE = 0.2
+
+# Minimum distance between a drill and another drill or the copper of a pad of a different net, in mm
+DEFAULT_HOLE_CLEARANCE = 0.25
+
+# Grid cell size of the neighbour search, about the size of a switch pin hole
+FEATURE_CELL_SIZE = 5.0
+
+
+# Pad shape as a spatial shape; circles, ovals and rectangles are exact, every other shape
+# (roundrect, trapezoid, custom) is checked as its bounding rectangle
+def pad_shape(shape_name, x, y, width, height, angle):
+    if shape_name == "circle":
+        return circle(x, y, width / 2)
+    if shape_name == "oval":
+        return oval(x, y, width, height, angle)
+    return rectangle(x, y, width, height, angle)
+
+
+# Copper and drill of every pad among elements (footprint tree or generated elements)
+# Returns a list of
+# {
+#     "label": Human readable pad description (i.e. pad "1" at (7.085, -2.54)),
+#     "net": Pad number, or None for unnumbered pads (each counted as its own net),
+#     "copper": Copper shape, or None for non-plated holes,
+#     "hole": Drill shape, or None for SMD pads
+# }
+def pad_features(elements):
+    features = []
+    for element in elements:
+        if not (isinstance(element, list) and element and element[0] == "pad"):
+            continue
+        position = find_child(element, "at")
+        size = find_child(element, "size")
+        if position is None or size is None:
+            continue
+        x, y, *angle = child_numbers(position)
+        angle = angle[0] if angle else 0
+        width, height = child_numbers(size)[:2]
+        pad_type, shape_name = element[2], element[3]
+
+        copper = None if pad_type == "np_thru_hole" else pad_shape(shape_name, x, y, width, height, angle)
+
+        hole = None
+        drill = find_child(element, "drill")
+        if drill is not None:
+            drill_size = child_numbers(drill)
+            drill_width = drill_size[0]
+            drill_height = drill_size[1] if len(drill_size) > 1 else drill_width
+            offset = find_child(drill, "offset")
+            offset_x, offset_y = rotate_point(*child_numbers(offset), angle) if offset is not None else (0, 0)
+            hole = oval(x + offset_x, y + offset_y, drill_width, drill_height, angle)
+
+        net = element[1].strip('"') or None
+        features.append({"label": f"pad {element[1]} at ({x:g}, {y:g})", "net": net, "copper": copper,
+                         "hole": hole})
+    return features
+
+
+def feature_bounds(feature):
+    shapes = [shape for shape in (feature["copper"], feature["hole"]) if shape is not None]
+    bounds = [shape_bounds(shape) for shape in shapes]
+    return (min(bound[0] for bound in bounds), min(bound[1] for bound in bounds),
+            max(bound[2] for bound in bounds), max(bound[3] for bound in bounds))
+
+
+def create_violation(rule, feature_a, feature_b, distance, required):
+    return {"rule": rule, "items": [feature_a["label"], feature_b["label"]], "distance": round(distance, 6),
+            "required": required}
+
+
+# Rule violations between two pads
+def check_pair(feature_a, feature_b, clearance, hole_clearance):
+    violations = []
+    if feature_a["net"] is not None and feature_a["net"] == feature_b["net"]:
+        return violations
+    if feature_a["hole"] is not None and feature_b["hole"] is not None:
+        distance = shape_distance(feature_a["hole"], feature_b["hole"])
+        if distance < hole_clearance:
+            violations.append(create_violation("hole_to_hole", feature_a, feature_b, distance, hole_clearance))
+    for hole_feature, copper_feature in ((feature_a, feature_b), (feature_b, feature_a)):
+        if hole_feature["hole"] is not None and copper_feature["copper"] is not None:
+            distance = shape_distance(hole_feature["hole"], copper_feature["copper"])
+            if distance < hole_clearance:
+                violations.append(create_violation("hole_clearance", hole_feature, copper_feature,
+                                                   distance, hole_clearance))
+    if feature_a["copper"] is not None and feature_b["copper"] is not None:
+        distance = shape_distance(feature_a["copper"], feature_b["copper"])
+        if distance < clearance:
+            violations.append(create_violation("clearance", feature_a, feature_b, distance, clearance))
+    return violations
+
+
+# Rule violations among features, or only between features and other_features when given
+def find_violations(features, other_features=None, clearance=DEFAULT_CLEARANCE,
+                    hole_clearance=DEFAULT_HOLE_CLEARANCE):
+    all_features = features + (other_features or [])
+    grid_index = GridIndex(cell_size=FEATURE_CELL_SIZE, margin=max(clearance, hole_clearance))
+    for feature_index, feature in enumerate(all_features):
+        grid_index.insert(feature_index, feature_bounds(feature))
+
+    violations = []
+    for index_a, index_b in sorted(grid_index.candidate_pairs()):
+        if other_features is not None and (index_a < len(features)) == (index_b < len(features)):
+            continue
+        violations.extend(check_pair(all_features[index_a], all_features[index_b], clearance, hole_clearance))
+    return violations
+
+
+# Checks every variant of every keysize of one family
+# templates: Optional {template path: CompiledTemplate} shared between families; template_violations caches
+#            the template-only results the same way
+# Returns {footprint name: [violation, ...]} with an entry for every footprint; each violation is
+# {"rule", "items": [pad label, pad label], "distance", "required", "source": "template" or "generated"}
+def check_family(family_def, clearance=DEFAULT_CLEARANCE, hole_clearance=DEFAULT_HOLE_CLEARANCE, templates=None,
+                 template_violations=None):
+    templates = {} if templates is None else templates
+    template_violations = {} if template_violations is None else template_violations
+
+    template_path = family_def["template"]
+    if template_path not in templates:
+        templates[template_path] = CompiledTemplate(parse_footprint_file(input_file=template_path, debug=False))
+    compiled_template = templates[template_path]
+    template_features = pad_features(compiled_template.footprint)
+    if template_path not in template_violations:
+        template_violations[template_path] = [
+            {**violation, "source": "template"}
+            for violation in find_violations(template_features, clearance=clearance, hole_clearance=hole_clearance)]
+
+    footprints_generator = FootprintsGenerator(
+        input_file=None, output_dir=None, keysizes_type=family_def["keysizes_type"],
+        family_name=family_def["family_name"], unit_width=family_def["unit_width"],
+        unit_height=family_def["unit_height"], debug=False, footprint=compiled_template, deterministic=True)
+
+    reports = {}
+    variant_violations = {}
+    for keysize_def in get_keysizes(family_def["keysizes_type"]):
+        for key_variant_name, elements in footprints_generator.create_keysize_variants(
+                keysize_def=keysize_def, keysizes_type=family_def["keysizes_type"],
+                unit_width=family_def["unit_width"], unit_height=family_def["unit_height"]):
+            generated_features = pad_features(elements)
+            variant_key = repr(generated_features)
+            if variant_key not in variant_violations:
+                violations = find_violations(generated_features, template_features, clearance=clearance,
+                                             hole_clearance=hole_clearance)
+                violations += find_violations(generated_features, clearance=clearance,
+                                              hole_clearance=hole_clearance)
+                variant_violations[variant_key] = [{**violation, "source": "generated"} for violation in violations]
+            reports[f"{family_def['family_name']}-{key_variant_name}"] = \
+                template_violations[template_path] + variant_violations[variant_key]
+    return reports
+
+
+# check_family over every family, sharing parsed templates and template results
+# Returns {footprint name: [violation, ...]} over all families
+def check_families(family_defs, clearance=DEFAULT_CLEARANCE, hole_clearance=DEFAULT_HOLE_CLEARANCE):
+    templates = {}
+    template_violations = {}
+    reports = {}
+    for family_def in family_defs:
+        reports.update(check_family(family_def, clearance=clearance, hole_clearance=hole_clearance,
+                                    templates=templates, template_violations=template_violations))
+    return reports
+
+
+def format_violation(violation):
+    item_a, item_b = violation["items"]
+    return f"{violation['rule']}: {item_a} / {item_b} ({violation['distance']:.3f}mm, " \
+           f"required {violation['required']:g}mm, {violation['source']})"
+
+
+if __name__ == '__main__':
+
+    # Parse args
+
+    description_cmd = "Checks pad clearances and drill spacing of every generated footprint without writing any files."
+    arg_parser = argparse.ArgumentParser(
+        description=description_cmd, formatter_class=argparse.RawTextHelpFormatter)
+
+    description_manifest = "Optional: JSON manifest file with the same schema as families.py. Defaults to families.FAMILIES."
+    arg_parser.add_argument("-m", "--manifest", dest="manifest", help=description_manifest)
+
+    description_root = "Optional: Directory that manifest paths are relative to. Defaults to the repository root."
+    arg_parser.add_argument("-r", "--root", dest="root", help=description_root, default=str(REPO_ROOT))
+
+    description_family = "Optional: Only check these families (as named in the manifest)."
+    arg_parser.add_argument("-f", "--family", dest="family", help=description_family, nargs="+")
+
+    description_clearance = f"Optional: Minimum copper clearance in mm. Defaults to {DEFAULT_CLEARANCE}."
+    arg_parser.add_argument("-c", "--clearance", dest="clearance", help=description_clearance,
+                            type=float, default=DEFAULT_CLEARANCE)
+
+    description_hole_clearance = f"Optional: Minimum drill to drill/copper clearance in mm. Defaults to {DEFAULT_HOLE_CLEARANCE}."
+    arg_parser.add_argument("--hole-clearance", dest="hole_clearance", help=description_hole_clearance,
+                            type=float, default=DEFAULT_HOLE_CLEARANCE)
+
+    description_generated_only = "Optional: Ignore violations between template pads (only check what the generator adds)."
+    arg_parser.add_argument("--generated-only", dest="generated_only", help=description_generated_only,
+                            action="store_true")
+
+    description_report = "Optional: Write the per-footprint results (including clean footprints) to this JSON file."
+    arg_parser.add_argument("-o", "--report", dest="report", help=description_report)
+
+    description_debug = "Optional: Enable debug mode."
+    arg_parser.add_argument("-d", "--debug", dest="debug",
+                            help=description_debug, action="store_true")
+
+    args = arg_parser.parse_args()
+    configure_logging(args.debug)
+
+    # Sanity check args
+
+    root = Path(args.root)
+    family_defs = resolve_families(load_manifest(Path(args.manifest)) if args.manifest else families.FAMILIES, root)
+    if args.family:
+        unknown_families = set(args.family) - {family_def["family_name"] for family_def in family_defs}
+        if unknown_families:
+            print(f"Unknown families: {', '.join(sorted(unknown_families))}", file=sys.stderr)
+            sys.exit(1)
+        family_defs = [family_def for family_def in family_defs if family_def["family_name"] in args.family]
+
+    # Check footprints
+
+    try:
+        reports = check_families(family_defs, clearance=args.clearance, hole_clearance=args.hole_clearance)
+    except FootprintParseError as e:
+        print(f"Footprint parsing failed: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.generated_only:
+        reports = {footprint_name: [violation for violation in violations if violation["source"] == "generated"]
+                   for footprint_name, violations in reports.items()}
+
+    if args.report:
+        Path(args.report).write_text(json.dumps(reports, indent=4))
+
+    failed_footprints = 0
+    for footprint_name, violations in reports.items():
+        if violations:
+            failed_footprints += 1
+            print(footprint_name)
+            for violation in violations:
+                print(f"\t{format_violation(violation)}")
+    if failed_footprints:
+        print(f"{failed_footprints} of {len(reports)} footprints violate design rules", file=sys.stderr)
+        sys.exit(1)
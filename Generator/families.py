@@ -0,0 +1,83 @@
+# Schema
+# [
+#     {
+#         "template": Template footprint path (relative to the repository root),
+#         "keysizes_type": Key sizes type as accepted by generate.py --keysizes-type,
+#         "family_name": Output footprint family name (i.e. the MX-Hotswap part of MX-Hotswap-1U),
+#         "output_dir": Output .pretty directory (relative to the repository root),
+#         "unit_width": Optional unit width override (defaults to 19.05mm),
+#         "unit_height": Optional unit height override (defaults to 19.05mm)
+#     },
+#     ...
+# ]
+#
+# Used by generate_all.py to rebuild the whole library in a single process pool.
+# Add a line here when creating a new footprint family.
+
+
+FAMILIES = [
+
+    # MX
+    {
+        "template": "Template.pretty/MX-Hotswap-Template.kicad_mod",
+        "keysizes_type": "mx",
+        "family_name": "MX-Hotswap",
+        "output_dir": "MX_Hotswap.pretty"
+    },
+    {
+        "template": "Template.pretty/MX-Solderable-Template.kicad_mod",
+        "keysizes_type": "mx",
+        "family_name": "MX-Solderable",
+        "output_dir": "MX_Solderable.pretty"
+    },
+
+    # Alps SKCM/SKCL
+    {
+        "template": "Template.pretty/Alps-Solderable.kicad_mod",
+        "keysizes_type": "alps",
+        "family_name": "Alps-Solderable",
+        "output_dir": "Alps_Solderable.pretty"
+    },
+    {
+        "template": "Template.pretty/Alps-Solderable.kicad_mod",
+        "keysizes_type": "alps_mx_stabilizers",
+        "family_name": "Alps-MX-Stabilizers",
+        "output_dir": "Alps_MX_Stabilizers.pretty"
+    },
+
+    # MX-Alps Hybrid
+    {
+        "template": "Template.pretty/MX-Alps-Hybrid-Template.kicad_mod",
+        "keysizes_type": "mx_alps",
+        "family_name": "MX-Alps-Hybrid",
+        "output_dir": "MX_Alps_Hybrid.pretty"
+    },
+
+    # Gateron KS33 (Low Profile 2.0)
+    {
+        "template": "Template.pretty/Gateron-KS33-Hotswap-Template.kicad_mod",
+        "keysizes_type": "gateron_ks33",
+        "family_name": "Gateron-KS33-Hotswap",
+        "output_dir": "Gateron_KS33_Hotswap.pretty"
+    },
+    {
+        "template": "Template.pretty/Gateron-KS33-Solderable-Template.kicad_mod",
+        "keysizes_type": "gateron_ks33",
+        "family_name": "Gateron-KS33-Solderable",
+        "output_dir": "Gateron_KS33_Solderable.pretty"
+    },
+
+    # Kailh PG1353 (Choc V2)
+    {
+        "template": "Template.pretty/Kailh-PG1353-Hotswap-Template.kicad_mod",
+        "keysizes_type": "kailh_pg1353",
+        "family_name": "Kailh-PG1353-Hotswap",
+        "output_dir": "Kailh_PG1353_Hotswap.pretty"
+    },
+    {
+        "template": "Template.pretty/Kailh-PG1353-Solderable-Template.kicad_mod",
+        "keysizes_type": "kailh_pg1353",
+        "family_name": "Kailh-PG1353-Solderable",
+        "output_dir": "Kailh_PG1353_Solderable.pretty"
+    },
+]
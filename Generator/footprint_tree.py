@@ -0,0 +1,163 @@
+from fnmatch import fnmatchcase
+
+
+# Parsed s-expression list, i.e. (at 0 3.175 0) -> Node(["at", "0", "3.175", "0"])
+# Subclasses list without adding per-instance storage, so parsed trees cost the same memory as plain lists
+# and keep working with everything that walks nested lists (FootprintEncoder, CompiledTemplate)
+# Atoms stay as the original token strings; numbers are only decoded when asked for
+class Node(list):
+    __slots__ = ()
+
+    # Leading atom (i.e. "pad" for (pad "1" thru_hole ...)), None for an empty or nameless list
+    @property
+    def name(self):
+        if self and isinstance(self[0], str):
+            return self[0]
+        return None
+
+    # Atoms after the name
+    def atoms(self):
+        return [element for element in self[1:] if isinstance(element, str)]
+
+    # Sub-lists, optionally only those with the given name
+    def children(self, name=None):
+        return [element for element in self
+                if isinstance(element, list) and (name is None or (element and element[0] == name))]
+
+    # First sub-list with the given name, or None
+    def child(self, name):
+        return find_child(self, name)
+
+    # Atom at index (counted after the name) decoded as a number
+    def number(self, index=0):
+        return to_number(self.atoms()[index])
+
+    # Every numeric atom after the name, i.e. (at 1 2 90) -> [1.0, 2.0, 90.0]
+    def numbers(self):
+        return child_numbers(self)
+
+    # Atom at index (counted after the name) with surrounding quotes removed
+    def text(self, index=0):
+        return unquote(self.atoms()[index])
+
+
+# Node that also records where it came from in the parsed input (see generate.SpanParser)
+# start/end: Byte offsets of its opening parenthesis and just past its closing parenthesis
+# spans: (start, end) byte offsets of each element, in element order (sub-lists included)
+class SpanNode(Node):
+    __slots__ = ("start", "end", "spans")
+
+    # Byte range of the atoms between the name and the first sub-list, or None without such atoms
+    def atoms_span(self):
+        last = None
+        for element, span in zip(self[1:], self.spans[1:]):
+            if isinstance(element, list):
+                break
+            last = span if last is None else (last[0], span[1])
+        return last
+
+
+def to_number(token):
+    return float(token)
+
+
+# Node.child and Node.numbers for plain nested lists as well (i.e. elements built by the generator)
+def find_child(element, name):
+    for child in element:
+        if isinstance(child, list) and child and child[0] == name:
+            return child
+    return None
+
+
+def child_numbers(element):
+    numbers = []
+    for atom in element[1:]:
+        if isinstance(atom, list):
+            continue
+        try:
+            numbers.append(to_number(atom))
+        except (TypeError, ValueError):
+            pass
+    return numbers
+
+
+def unquote(token):
+    if len(token) >= 2 and token[0] == '"' and token[-1] == '"':
+        return token[1:-1].replace('\\"', '"')
+    return token
+
+
+# Names of the lists that assign their parent to layers
+LAYER_NODE_NAMES = ("layer", "layers")
+
+
+# Whether a concrete layer (i.e. F.Cu) is covered by a layer entry, including KiCad's layer sets:
+# wildcards (*.Cu) and front-and-back (F&B.Cu)
+def layer_matches(layer, layer_entry):
+    if layer == layer_entry:
+        return True
+    if "*" in layer_entry:
+        return fnmatchcase(layer, layer_entry)
+    if layer_entry.startswith("F&B."):
+        return layer in ("F." + layer_entry[4:], "B." + layer_entry[4:])
+    return False
+
+
+class FootprintIndex:
+    # Name and layer index over a parsed footprint (or board), built with a single iterative traversal
+    # Works on Node trees as well as plain nested lists; every result keeps document order
+    #
+    # Examples:
+    #   index.find("pad")              -> every pad
+    #   index.coordinates("at")        -> [(x, y), ...] of every (at x y ...)
+    #   index.on_layer("Dwgs.User")    -> every element on Dwgs.User
+    #   index.on_layer("F.Cu")         -> also matches elements on layer sets such as *.Cu and F&B.Cu
+
+    def __init__(self, root):
+        self.root = root
+        self.by_name = {}
+        self.by_layer = {}
+
+        # by_layer entries carry the document position of the element so merged results can be ordered
+        position = 0
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if node and isinstance(node[0], str):
+                self.by_name.setdefault(node[0], []).append(node)
+            sub_lists = [element for element in node if isinstance(element, list)]
+            for sub_list in sub_lists:
+                if sub_list and sub_list[0] in LAYER_NODE_NAMES:
+                    for layer in sub_list[1:]:
+                        if isinstance(layer, str):
+                            self.by_layer.setdefault(unquote(layer), []).append((position, node))
+            stack.extend(reversed(sub_lists))
+            position += 1
+
+    # Every list with the given name
+    def find(self, name):
+        return self.by_name.get(name, [])
+
+    # (x, y) of every list with the given name that holds at least two numbers
+    def coordinates(self, name="at"):
+        coordinates = []
+        for node in self.find(name):
+            if len(node) >= 3:
+                try:
+                    coordinates.append((to_number(node[1]), to_number(node[2])))
+                except (TypeError, ValueError):
+                    pass
+        return coordinates
+
+    # Every element assigned to the layer, directly or through a layer set (i.e. *.Cu, *.Mask, F&B.Cu)
+    def on_layer(self, layer):
+        matches = {}
+        for indexed_layer, entries in self.by_layer.items():
+            if layer_matches(layer, indexed_layer):
+                for position, node in entries:
+                    matches[position] = node
+        return [matches[position] for position in sorted(matches)]
+
+    # Every layer name used in the tree
+    def layers(self):
+        return list(self.by_layer)
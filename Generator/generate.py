@@ -1,288 +1,768 @@
 import argparse
+import gc
+import io
+import logging
+import re
 import sys
 from pathlib import Path
+import itertools
 import uuid
+from collections import OrderedDict
+from footprint_tree import Node, SpanNode
+import geometry
+from geometry import format_number
+from instrumentation import NULL_INSTRUMENTATION, Instrumentation, Profiler, configure_logging
 import keysizes
 
 
+# Bump whenever generated output changes for identical inputs (invalidates incremental build caches)
+GENERATOR_VERSION = 4
+
+# Namespace for UUIDs derived in deterministic mode
+GENERATOR_UUID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "https://github.com/ai03-2725/MX_V2")
+
+# Debug output of every generator module; -d/--debug enables it, otherwise each call is a cheap level check
+logger = logging.getLogger("generator")
+
+
+class FootprintParseError(Exception):
+    # Raised on malformed footprint input; line and column are 1-based
+
+    def __init__(self, message, line, column):
+        super().__init__(f"{message} (line {line}, column {column})")
+        self.message = message
+        self.line = line
+        self.column = column
+
+    # Pickled with all three arguments, so errors raised in pool workers reach the parent intact
+    def __reduce__(self):
+        return self.__class__, (self.message, self.line, self.column)
+
+
+# Quoted strings (parentheses and spaces are legal within quotes; backslash-escaped quotes do not end a string)
+QUOTED_STRING_REGEX = re.compile(r'("[^"\\]*(?:\\.[^"\\]*)*")', re.DOTALL)
+
+# Parentheses and whole literal/quoted tokens, used to locate structural errors
+STRUCTURE_REGEX = re.compile(r'[()]|"[^"\\]*(?:\\.[^"\\]*)*"|[^\s()"]+', re.DOTALL)
+
+DELIMITERS = frozenset(" \t\r\n\f\v()")
+
+
 class FootprintParser:
     # Parses footprint files (and similar lisp-like notations)
+    # Accepts str, bytes, bytearray or memoryview input
+    # Quoted strings are cut out by one regex pass, everything between them is split with str builtins,
+    # and the nested lists (footprint_tree.Node) are then built in a single pass with an explicit stack
 
-    def __init__(self, input_string, debug):
+    def __init__(self, input_data, debug=False):
         self.debug = debug
         if self.debug:
-            print("Footprint parser launching with given string:")
-            print(input_string)
-        self.processed_list = self.parse_list(input_string, 1)["item"]
+            logger.debug("Footprint parser launching with %d long input", len(input_data))
+        if not isinstance(input_data, str):
+            input_data = str(input_data, "utf-8")
+
+        # Building millions of small lists would otherwise trigger repeated full GC passes over the growing tree
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            self.processed_list = self.build_lists(input_data, self.tokenize(input_data))
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+    def tokenize(self, input_string):
+        tokens = []
+        glue = False
+        segments = QUOTED_STRING_REGEX.split(input_string)
+        for index, segment in enumerate(segments):
+
+            # Odd segments = quoted strings
+            if index & 1:
+                if glue:
+                    tokens[-1] += segment
+                else:
+                    tokens.append(segment)
+                glue = True
+                continue
 
-    def parse_list(self, input_string, start_index):
-        ret_list = []
-        loop_index = start_index
-        while True:
-            if loop_index >= len(input_string):
-                print("Footprint parsing failed: Unexpected end of file",
-                      file=sys.stderr)
-                sys.exit(1)
+            # Even segments = everything between quoted strings
+            if '"' in segment:
+                offset = sum(len(previous) for previous in segments[:index]) + segment.index('"')
+                self.raise_error(input_string, offset, "Unterminated quoted string")
+            # Bare tokens repeat heavily (keywords, layer names, common values), so share one copy of each
+            segment_tokens = list(map(sys.intern, segment.replace("(", " ( ").replace(")", " ) ").split()))
+
+            # A literal directly touching a quoted string (i.e. abc"d e"f) is a single token
+            if glue and segment and segment[0] not in DELIMITERS:
+                tokens[-1] += segment_tokens.pop(0)
+            tokens.extend(segment_tokens)
+            glue = bool(segment) and segment[-1] not in DELIMITERS or (not segment and glue)
+        return tokens
+
+    def build_lists(self, input_string, tokens):
+        root = None
+        current = None
+        stack = []
+        for token in tokens:
 
             # Opening parenthesis = start of a list
-            if input_string[loop_index] == '(':
-                ret = self.parse_list(input_string, loop_index + 1)
-                ret_list.append(ret["item"])
-                loop_index = ret["end_index"] + 1
-                continue
+            if token == "(":
+                new_list = Node()
+                if current is not None:
+                    current.append(new_list)
+                    stack.append(current)
+                elif root is None:
+                    root = new_list
+                else:
+                    self.raise_structure_error(input_string, "Unexpected data after end of footprint")
+                current = new_list
 
             # Closing parenthesis = end of a list
-            elif input_string[loop_index] == ')':
-                if self.debug:
-                    print("Returning the following list:")
-                    print(ret_list)
-                return {"item": ret_list, "end_index": loop_index}
-
-            # Non-space char = beginning of a literal token
-            elif input_string[loop_index] != ' ':
-                ret = self.parse_literal(input_string, loop_index)
-                ret_list.append(ret["item"])
-                loop_index = ret["end_index"]
-                continue
+            elif token == ")":
+                if current is None:
+                    self.raise_structure_error(input_string, "Unexpected closing parenthesis")
+                current = stack.pop() if stack else None
+
+            # Literal token
+            elif current is not None:
+                current.append(token)
+            else:
+                self.raise_structure_error(input_string, "Unexpected token outside of a list")
+
+        if current is not None:
+            self.raise_error(input_string, len(input_string), "Unexpected end of file")
+        if root is None:
+            self.raise_error(input_string, len(input_string), "No list found in input")
+
+        return root
+
+    # Tokens carry no positions, so structural errors rescan the input (failure path only) to find the offending offset
+    def raise_structure_error(self, input_string, message):
+        depth = 0
+        closed = False
+        position = 0
+        for match in STRUCTURE_REGEX.finditer(input_string):
+            position = match.start()
+            char = match.group()
+            if char == "(":
+                if closed:
+                    break
+                depth += 1
+            elif char == ")":
+                if depth == 0:
+                    break
+                depth -= 1
+                closed = depth == 0
+            elif depth == 0:
+                break
+        self.raise_error(input_string, position, message)
+
+    def raise_error(self, input_string, offset, message):
+        line = input_string.count("\n", 0, offset) + 1
+        column = offset - (input_string.rfind("\n", 0, offset) + 1) + 1
+        raise FootprintParseError(message, line, column)
+
+
+# Tokens with their positions: parentheses, literals/quoted strings (glued together, i.e. abc"d e"f) and,
+# as the last resort, a stray quote that starts an unterminated string
+SPAN_TOKEN_REGEX = re.compile(rb'[()]|(?:"[^"\\]*(?:\\.[^"\\]*)*"|[^\s()"]+)+|"', re.DOTALL)
+
+
+class SpanParser:
+    # FootprintParser variant that keeps the byte position of every list and atom (footprint_tree.SpanNode),
+    # so tools can rewrite single tokens or lists in place and pass everything else through untouched,
+    # formatting and comments included
+    # Accepts bytes, bytearray or memoryview input (str is encoded as UTF-8); offsets index into that data
+    #
+    # Example:
+    #   root = SpanParser(data).processed_list
+    #   version = root.child("version")
+    #   start, end = version.spans[1]  -> byte range of the version number
+
+    def __init__(self, input_data, debug=False):
+        self.debug = debug
+        if isinstance(input_data, str):
+            input_data = input_data.encode()
+        self.input_data = input_data
+        if self.debug:
+            logger.debug("Span parser launching with %d long input", len(input_data))
+
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            self.processed_list = self.build_lists(input_data)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+    def build_lists(self, input_data):
+        root = None
+        current = None
+        stack = []
+        for match in SPAN_TOKEN_REGEX.finditer(input_data):
+            token = match.group()
+            if token == b"(":
+                new_list = SpanNode()
+                new_list.start = match.start()
+                new_list.spans = []
+                if current is not None:
+                    current.append(new_list)
+                    current.spans.append(None)
+                    stack.append(current)
+                elif root is None:
+                    root = new_list
+                else:
+                    self.raise_error(input_data, match.start(), "Unexpected data after end of footprint")
+                current = new_list
+            elif token == b")":
+                if current is None:
+                    self.raise_error(input_data, match.start(), "Unexpected closing parenthesis")
+                current.end = match.end()
+                if stack:
+                    parent = stack.pop()
+                    parent.spans[-1] = (current.start, current.end)
+                    current = parent
+                else:
+                    current = None
+            elif token == b'"':
+                self.raise_error(input_data, match.start(), "Unterminated quoted string")
+            elif current is not None:
+                current.append(sys.intern(str(token, "utf-8")) if token[0] != 34 else str(token, "utf-8"))
+                current.spans.append(match.span())
+            else:
+                self.raise_error(input_data, match.start(), "Unexpected token outside of a list")
 
-            # Space = pass
-            loop_index += 1
-            continue
-
-    def parse_literal(self, input_string, start_index):
-        token = ""
-        loop_index = start_index
-        within_quotes = False
-        while True:
-            if loop_index >= len(input_string):
-                print("Footprint parsing failed: Unexpected end of file",
-                      file=sys.stderr)
-                sys.exit(1)
-
-            # Quote = invert within_quotes (allow space)
-            if input_string[loop_index] == '"':
-                within_quotes = not within_quotes
-
-            # Space + not within_quotes = end of a token
-            elif input_string[loop_index] == ' ' and not within_quotes:
-                if self.debug:
-                    print("Creating the following token (at delimiter space):")
-                    print(token)
-                return {"item": token, "end_index": loop_index}
-
-            # End parenthesis + not within_quotes = end of a token
-            elif input_string[loop_index] == ')' and not within_quotes:
-                if self.debug:
-                    print(
-                        "Creating the following token (at delimiter closing parenthesis):")
-                    print(token)
-                return {"item": token, "end_index": loop_index}
-
-            # Other = Add to built string and continue on
-            token += input_string[loop_index]
-            loop_index += 1
+        if current is not None:
+            self.raise_error(input_data, len(input_data), "Unexpected end of file")
+        if root is None:
+            self.raise_error(input_data, len(input_data), "No list found in input")
+        return root
 
+    def raise_error(self, input_data, offset, message):
+        line = bytes(input_data[:offset]).count(b"\n") + 1
+        column = offset - (bytes(input_data[:offset]).rfind(b"\n") + 1) + 1
+        raise FootprintParseError(message, line, column)
 
-class FootprintEncoder:
 
-    def __init__(self, footprint, debug):
-        self.debug = debug
-        self.encoded_footprint = self.list_to_string(footprint)
-        if self.debug:
-            print("Encoded footprint:")
-            print(self.encoded_footprint)
+# Line layout limits used by KiCad's own s-expression formatter (tabs count as one column)
+TOKEN_WRAP_COLUMN = 72
+XY_COLUMN_LIMIT = 99
+
 
-    def list_to_string(self, input_list):
-        string_elements = []
-        for element in input_list:
+class FootprintEncoder:
+    # Streams a footprint (nested list style) to a text file handle using KiCad's indented multi-line layout:
+    # atoms stay on the list's opening line, every sub-list starts a new line one tab deeper,
+    # and lists containing sub-lists close on their own line
+    # Output is always normalized to the KiCad 8 layout, whatever the source file used: KiCad 8 templates
+    # round-trip byte for byte, while templates saved in the KiCad 6 layout (space-indented, i.e. MX-Solderable,
+    # Alps-Solderable, MX-Alps-Hybrid, Gateron-KS33-Solderable) come out re-indented with tabs
+    # output_file: Optional writable text handle; encoded_footprint holds the whole string when omitted
+    # replacements: Optional {old: new} substitutions applied to each literal token (i.e. {"Template": "1U"})
+    # indent: Nesting depth the footprint is written at (non-zero for single elements spliced into a footprint,
+    #         which are written without the trailing newline)
+
+    def __init__(self, footprint, debug, output_file=None, replacements=None, indent=0):
+        self.debug = debug
+        self.replacements = replacements or {}
+        self.encoded_footprint = None
+
+        if output_file is None:
+            string_buffer = io.StringIO()
+            self.encode(footprint, string_buffer.write, indent)
+            self.encoded_footprint = string_buffer.getvalue()
+            if self.debug:
+                logger.debug("Encoded footprint:\n%s", self.encoded_footprint)
+        else:
+            self.encode(footprint, output_file.write, indent)
+
+    def encode(self, footprint, write, indent):
+        self.write = write
+        self.column = indent
+        self.write_list(footprint, indent)
+        if not indent:
+            self.write("\n")
+
+    def write_list(self, input_list, indent):
+        write = self.write
+        child_indent = "\n" + "\t" * (indent + 1)
+        write("(")
+        column = self.column + 1
+        multiline = False
+        previous_xy = False
+        for index, element in enumerate(input_list):
             if isinstance(element, list):
-                return_string = self.list_to_string(element)
-                string_elements.append(return_string)
-            elif isinstance(element, str):
-                string_elements.append(element)
-        return f"({' '.join(string_elements)})"
+                is_xy = bool(element) and element[0] == "xy"
 
+                # Runs of (xy ...) points share a line up to XY_COLUMN_LIMIT
+                if is_xy and previous_xy and column < XY_COLUMN_LIMIT:
+                    write(" ")
+                    self.column = column + 1
+                else:
+                    write(child_indent)
+                    self.column = indent + 1
+                    multiline = True
+                self.write_list(element, indent + 1)
+                column = self.column
+                previous_xy = is_xy
+            else:
+                token = self.substitute(element)
+
+                # Long runs of atoms (i.e. group members) wrap one tab deeper; points never do
+                if index and column >= TOKEN_WRAP_COLUMN and input_list[0] != "xy":
+                    write(child_indent)
+                    column = indent + 1
+                    multiline = True
+                elif index:
+                    write(" ")
+                    column += 1
+                write(token)
+                column += len(token)
+                previous_xy = False
+        if multiline:
+            write("\n" + "\t" * indent)
+            column = indent
+        self.column = column + 1
+        write(")")
+
+    def substitute(self, token):
+        for old, new in self.replacements.items():
+            if old in token:
+                token = token.replace(old, new)
+        return token
+
+
+class CompiledTemplate:
+    # Template footprint encoded once into byte segments with splice points, so each generated variant is
+    # assembled by concatenation instead of re-encoding the whole template:
+    #   - Every token containing the placeholder (the footprint name, the Value and Footprint properties)
+    #     splits the encoded template; the variant name is spliced in between the segments
+    #   - Generated elements (outlines, stabilizer holes) are spliced in at the tail, before the closing parenthesis
+
+    def __init__(self, footprint, placeholder="Template"):
+        self.footprint = footprint
+        self.placeholder = placeholder
+        encoded_template = FootprintEncoder(
+            footprint=footprint, debug=False, replacements={placeholder: SPLICE_SENTINEL}).encoded_footprint
+        if not encoded_template.endswith(TAIL):
+            raise ValueError("Template footprint has no elements to splice after")
+        self.segments = [segment.encode() for segment in encoded_template[:-len(TAIL)].split(SPLICE_SENTINEL)]
+
+    def render(self, name, elements=()):
+        return self.render_encoded(name, [encode_elements(elements)])
+
+    # render with elements that are already encoded (i.e. filled Fragments), each as written by encode_elements
+    def render_encoded(self, name, encoded_elements):
+        encoded_name = name.encode()
+        parts = [self.segments[0]]
+        for segment in self.segments[1:]:
+            parts.append(encoded_name)
+            parts.append(segment)
+        parts.extend(encoded_elements)
+        parts.append(TAIL_BYTES)
+        return b"".join(parts)
+
+    # Tree equivalent of render: a footprint_tree.Node copy of the template with the placeholder replaced by name
+    # in every token and the elements appended (nothing is shared with the template, so the result can be modified)
+    def instantiate(self, name, elements=()):
+        placeholder = self.placeholder
+
+        def copy_list(input_list):
+            return Node(copy_list(element) if isinstance(element, list)
+                        else element.replace(placeholder, name) if placeholder in element else element
+                        for element in input_list)
+
+        footprint = copy_list(self.footprint)
+        footprint.extend(copy_list(element) for element in elements)
+        return footprint
 
-class FootprintsGenerator:
 
-    def __init__(self, input_file, output_dir, keysizes_type, family_name, unit_width, unit_height, debug):
-        self.debug = debug
+# Stand-in for the placeholder while compiling (cannot occur in footprint files)
+SPLICE_SENTINEL = "\x00"
 
-        # Choose which unit sizes to generate
-        if keysizes_type == "mx":
-            self.keysizes = keysizes.KEYSIZES_MX
-        elif keysizes_type == "alps":
-            self.keysizes = keysizes.KEYSIZES_ALPS
-        elif keysizes_type == "alps_mx_stabilizers":
-            self.keysizes = keysizes.KEYSIZES_ALPS_MX_STABILIZERS
-        elif keysizes_type == "gateron_ks33":
-            self.keysizes = keysizes.KEYSIZES_GATERON_KS33
-        elif keysizes_type == "kailh_pg1353":
-            self.keysizes = keysizes.KEYSIZES_KAILH_PG1353
-        else:  # mx_alps
-            self.keysizes = keysizes.KEYSIZES_MX_ALPS
+# How every encoded footprint ends: its last element, then the root's closing parenthesis
+TAIL = "\n)\n"
+TAIL_BYTES = TAIL.encode()
 
-        # Generate footprint data
-        footprint = self.parse_input(input_file=input_file)
-        if self.debug:
-            print("Generated footprint data:")
-            print(footprint)
 
-        # For each keysize, inject outlines and necessary addons (stabilizer holes and similar)
-        for keysize_def in self.keysizes:
+# Encodes elements the way CompiledTemplate splices them in: each on its own line, one tab deep
+def encode_elements(elements):
+    return "".join("\n\t" + FootprintEncoder(footprint=element, debug=False, indent=1).encoded_footprint
+                   for element in elements).encode()
 
-            # Inject outline and stabilizers
-            footprint_with_outlines = self.generate_footprint_outlines(
-                base_footprint=footprint, keysize_def=keysize_def, unit_width=unit_width, unit_height=unit_height)
-            final_footprints = self.generate_footprint_stabilizers(
-                base_footprint=footprint_with_outlines, keysize_def=keysize_def, keysizes_type=keysizes_type)
-            
-            # Write each created variant
-            for final_footprint in final_footprints:
-                encoded_footprint = FootprintEncoder(
-                    footprint=final_footprint['footprint'], debug=self.debug)
-                keysize_human_readable = keysize_def.get('keysize')
-                if isinstance(keysize_def.get('keysize'), (int, float)):
-                    keysize_human_readable = f"{keysize_def.get('keysize')}U"
-                key_variant_name = f"{keysize_human_readable}{final_footprint['variant_name'] or ''}"
-                save_path = output_dir / \
-                    f"{family_name}-{key_variant_name}.kicad_mod"
-
-                output_data = encoded_footprint.encoded_footprint.replace("Template", key_variant_name)
-                
-                with save_path.open(mode='w') as save_file:
-                    save_file.write(output_data)
-                    save_file.close()
 
-    def parse_input(self, input_file):
+# Stand-in for element UUIDs while encoding fragments (cannot occur in footprint files)
+UUID_SENTINEL = "\x01"
+
+
+class Fragment:
+    # Generated elements encoded once, with splice points where their UUIDs go
+    # fill(new_uuid) assembles the bytes with one new_uuid() per splice point, in element order,
+    # so a fragment shared across families still gets each family's own (deterministic or random) UUIDs
+
+    __slots__ = ("segments",)
+
+    def __init__(self, elements):
+        self.segments = encode_elements(elements).split(UUID_SENTINEL.encode())
+
+    def fill(self, new_uuid):
+        segments = self.segments
+        parts = [segments[0]]
+        for segment in segments[1:]:
+            parts.append(str(new_uuid()).encode())
+            parts.append(segment)
+        return b"".join(parts)
+
+
+class FragmentCache:
+    # Bounded LRU of encoded outline and stabilizer fragments, shared by every FootprintsGenerator it is passed to
+    # Keys only hold the inputs a fragment depends on, so identical shapes are built once across families
+    # (i.e. MX-Hotswap and MX-Solderable, or the KS-33 and PG1353 families sharing one keysize table):
+    #   - outlines: keysize and unit size
+    #   - stabilizers: keysizes type and stabilizer placement (2U and 2.25U both use 11.938mm on MX)
+    # Safe to share between threads; the worst case of a race is building a fragment twice
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
 
-        # Parse input file - More or less Lisp format
-        # Can contain parentheses legally within quotes
-        input_file_opened = input_file.open()
+    # Returns the cached value for key, or stores and returns create()
+    def get(self, key, create):
+        value = self.entries.get(key)
+        if value is not None:
+            self.hits += 1
+            try:
+                self.entries.move_to_end(key)
+            except KeyError:
+                pass
+            return value
+        self.misses += 1
+        value = create()
+        self.entries[key] = value
+        while len(self.entries) > self.max_entries:
+            try:
+                self.entries.popitem(last=False)
+            except KeyError:
+                break
+        return value
 
-        # Read and convert to single line
-        input_string = input_file_opened.read().replace('\n', ' ').replace('\r', ' ').replace('\t', ' ')
 
-        # Use FootprintParser to convert to a tokenized list
+def parse_footprint_file(input_file, debug, instrumentation=NULL_INSTRUMENTATION):
+
+    # Parse input file - More or less Lisp format
+    # Use FootprintParser to convert the raw file contents to a tokenized list
+    with instrumentation.stage("parse", input_file.name):
         footprint_elements = FootprintParser(
-            input_string=input_string, debug=self.debug).processed_list
+            input_data=input_file.read_bytes(), debug=debug).processed_list
+    if debug:
+        logger.debug("Parsed footprint: %s", footprint_elements)
+
+    return footprint_elements
+
+
+# Writes output_data (bytes) to save_path unless the file already holds exactly that content
+# Returns whether the file was written
+def write_if_changed(save_path, output_data):
+    try:
+        if save_path.read_bytes() == output_data:
+            return False
+    except FileNotFoundError:
+        pass
+    save_path.write_bytes(output_data)
+    return True
+
+
+# Outline line element on Dwgs.User
+def create_outline_line(start_x, start_y, end_x, end_y, tstamp):
+    return ["fp_line", ["start", format_number(start_x), format_number(start_y)],
+            ["end", format_number(end_x), format_number(end_y)],
+            ["layer", '"Dwgs.User"'], ["width", "0.15"], ["tstamp", f"{tstamp}"]]
+
+
+# Non-plated stabilizer hole element
+def create_stabilizer_hole(x, y, diameter, tstamp):
+    return ["pad", '""', "np_thru_hole", "circle", ["at", format_number(x), format_number(y)],
+            ["size", format_number(diameter), format_number(diameter)], ["drill", format_number(diameter)],
+            ["layers", "*.Cu", "*.Mask"], ["tstamp", f"{tstamp}"]]
+
+
+# Human readable keysize as used in footprint names (i.e. 1.25 -> 1.25U, ISO -> ISO)
+def keysize_name(keysize):
+    if isinstance(keysize, (int, float)):
+        return f"{keysize}U"
+    return keysize
+
+
+# Key sizes tables selectable via --keysizes-type
+KEYSIZES_TYPES = {
+    "mx": keysizes.KEYSIZES_MX,
+    "alps": keysizes.KEYSIZES_ALPS,
+    "mx_alps": keysizes.KEYSIZES_MX_ALPS,
+    "alps_mx_stabilizers": keysizes.KEYSIZES_ALPS_MX_STABILIZERS,
+    "gateron_ks33": keysizes.KEYSIZES_GATERON_KS33,
+    "kailh_pg1353": keysizes.KEYSIZES_KAILH_PG1353,
+}
+
+# Name of the table in keysizes.py behind each keysizes type, to find it again when keysizes.py is reloaded
+# (tables may be aliases of each other, i.e. KEYSIZES_KAILH_PG1353 = KEYSIZES_GATERON_KS33)
+KEYSIZES_TABLE_NAMES = {
+    "mx": "KEYSIZES_MX",
+    "alps": "KEYSIZES_ALPS",
+    "mx_alps": "KEYSIZES_MX_ALPS",
+    "alps_mx_stabilizers": "KEYSIZES_ALPS_MX_STABILIZERS",
+    "gateron_ks33": "KEYSIZES_GATERON_KS33",
+    "kailh_pg1353": "KEYSIZES_KAILH_PG1353",
+}
+
+
+# Inputs the stabilizer holes of a keysize definition depend on
+def stabilizer_key(keysize_def):
+    return (keysize_def.get("stabilizer_dist"), keysize_def.get("stabilizer_dist_right"),
+            bool(keysize_def.get("stabilizer_vert")))
+
+
+def get_keysizes(keysizes_type):
+    # Unknown types fall back to mx_alps like the original if/elif chain did
+    return KEYSIZES_TYPES.get(keysizes_type, keysizes.KEYSIZES_MX_ALPS)
+
+
+class FootprintsGenerator:
+
+    # footprint: Optional already-parsed (or compiled) template (skips reading input_file)
+    # keysize_defs: Optional subset of keysize definitions to generate (defaults to the whole table)
+    # deterministic: Derive element UUIDs from family, variant and element index instead of uuid4,
+    #                so regenerating unchanged footprints produces identical files (which are then not rewritten)
+    # instrumentation: Optional instrumentation.Instrumentation collecting per-stage timings
+    # output_sink: Optional sinks.OutputSink receiving every footprint (defaults to a sinks.DirectorySink writing
+    #              files to output_dir); with an archive sink output_dir only names the library folder
+    #              and does not have to exist
+    # fragment_cache: Optional FragmentCache to share encoded outlines and stabilizers with other generators
+    # Without output_dir and output_sink nothing is generated up front; footprints are then produced on demand
+    # by iter_footprints / iter_footprint_matrix (i.e. for consuming large sweeps as a stream)
+    #
+    # Example:
+    #   footprints_generator = FootprintsGenerator(input_file=Path("Template.pretty/MX-Hotswap-Template.kicad_mod"),
+    #                                              output_dir=None, keysizes_type="mx", family_name="MX-Hotswap",
+    #                                              unit_width=19.05, unit_height=19.05, debug=False, deterministic=True)
+    #   for name, output_data in footprints_generator.iter_footprints():
+    #       ...
+    def __init__(self, input_file, output_dir, keysizes_type, family_name, unit_width, unit_height, debug,
+                 footprint=None, keysize_defs=None, deterministic=False, instrumentation=None, output_sink=None,
+                 fragment_cache=None):
+        self.debug = debug
+        self.family_name = family_name
+        self.keysizes_type = keysizes_type
+        self.unit_width = unit_width
+        self.unit_height = unit_height
+        self.deterministic = deterministic
+        self.instrumentation = instrumentation or NULL_INSTRUMENTATION
+        self.output_sink = output_sink
+        self.fragment_cache = fragment_cache or FragmentCache()
+        self.output_paths = []
+
+        # Choose which unit sizes to generate
+        self.keysizes = list(keysize_defs) if keysize_defs is not None else get_keysizes(keysizes_type)
+
+        # Outlines and stabilizer holes of the whole table, computed as one geometry column per family
+        self.outline_column = {}
+        self.stabilizer_column = {}
+        self.add_geometry_column(self.keysizes, unit_width, unit_height)
+
+        # Generate footprint data
+        if footprint is None:
+            footprint = self.parse_input(input_file=input_file)
+
+        # Encode the template once; every variant is then assembled from its segments
+        if isinstance(footprint, CompiledTemplate):
+            compiled_template = footprint
+        else:
+            compiled_template = CompiledTemplate(footprint)
+        self.compiled_template = compiled_template
         if self.debug:
-            print(footprint_elements)
-
-        return footprint_elements
-
-    # Takes footprint object (nested list style) and injects outline box
-    def generate_footprint_outlines(self, base_footprint, keysize_def, unit_width, unit_height):
-        # (fp_line (start -66.675 -9.525) (end 66.675 -9.525) (layer Dwgs.User) (width 0.15) (tstamp 4de36ae6-8d67-4c45-bd5c-19be16f828ed))
-        keysize = keysize_def.get('keysize')
-        footprint = base_footprint[:]
-        if keysize == "ISO":
-            # TODO: Scale ISO based on unit size
-            footprint.append(
-                f"(fp_line (start -11.90625 19.05) (end -11.90625 0) (layer Dwgs.User) (width 0.15) (tstamp {uuid.uuid4()}))")
-            footprint.append(
-                f"(fp_line (start -11.90625 0) (end -16.66875 0) (layer Dwgs.User) (width 0.15) (tstamp {uuid.uuid4()}))")
-            footprint.append(
-                f"(fp_line (start -16.66875 -19.05) (end 11.90625 -19.05) (layer Dwgs.User) (width 0.15) (tstamp {uuid.uuid4()}))")
-            footprint.append(
-                f"(fp_line (start 11.90625 -19.05) (end 11.90625 19.05) (layer Dwgs.User) (width 0.15) (tstamp {uuid.uuid4()}))")
-            footprint.append(
-                f"(fp_line (start -11.90625 19.05) (end 11.90625 19.05) (layer Dwgs.User) (width 0.15) (tstamp {uuid.uuid4()}))")
-            footprint.append(
-                f"(fp_line (start -16.66875 -19.05) (end -16.66875 0) (layer Dwgs.User) (width 0.15) (tstamp {uuid.uuid4()}))")
-        elif keysize == "ISO-Rotated":
-            footprint.append(
-                f'(fp_line (start 19.05 11.90625) (end 19.05 -11.90625) (layer "Dwgs.User") (width 0.15) (tstamp {uuid.uuid4()}))')
-            footprint.append(
-                f'(fp_line (start 0 11.90625) (end 0 16.66875) (layer "Dwgs.User") (width 0.15) (tstamp {uuid.uuid4()}))')
-            footprint.append(
-                f'(fp_line (start -19.05 -11.90625) (end 19.05 -11.90625) (layer "Dwgs.User") (width 0.15) (tstamp {uuid.uuid4()}))')
-            footprint.append(
-                f'(fp_line (start -19.05 16.66875) (end -19.05 -11.90625) (layer "Dwgs.User") (width 0.15) (tstamp {uuid.uuid4()}))')
-            footprint.append(
-                f'(fp_line (start 19.05 11.90625) (end 0 11.90625) (layer "Dwgs.User") (width 0.15) (tstamp {uuid.uuid4()}))')
-            footprint.append(
-                f'(fp_line (start -19.05 16.66875) (end 0 16.66875) (layer "Dwgs.User") (width 0.15) (tstamp {uuid.uuid4()}))')
-        elif keysize == "6U-Offcenter":
-            footprint.append(
-                f"(fp_line (start {unit_width * -3.5} {unit_height / 2}) (end {unit_width * 2.5} {unit_height / 2}) (layer Dwgs.User) (width 0.15) (tstamp {uuid.uuid4()}))")
-            footprint.append(
-                f"(fp_line (start {unit_width * -3.5} {unit_height / -2}) (end {unit_width * 2.5} {unit_height / -2}) (layer Dwgs.User) (width 0.15) (tstamp {uuid.uuid4()}))")
-            footprint.append(
-                f"(fp_line (start {unit_width * -3.5} {unit_height / 2}) (end {unit_width * -3.5} {unit_height / -2}) (layer Dwgs.User) (width 0.15) (tstamp {uuid.uuid4()}))")
-            footprint.append(
-                f"(fp_line (start {unit_width * 2.5} {unit_height / 2}) (end {unit_width * 2.5} {unit_height / -2}) (layer Dwgs.User) (width 0.15) (tstamp {uuid.uuid4()}))")
-        elif keysize == "2U-Vertical":
-            footprint.append(
-                f"(fp_line (start {unit_width / 2} {unit_height * 2 / 2}) (end {unit_width / -2} {unit_height * 2 / 2}) (layer Dwgs.User) (width 0.15) (tstamp {uuid.uuid4()}))")
-            footprint.append(
-                f"(fp_line (start {unit_width / 2} {unit_height * 2 / -2}) (end {unit_width / -2} {unit_height * 2 / -2}) (layer Dwgs.User) (width 0.15) (tstamp {uuid.uuid4()}))")
-            footprint.append(
-                f"(fp_line (start {unit_width / 2} {unit_height * 2 / 2}) (end {unit_width / 2} {unit_height * 2 / -2}) (layer Dwgs.User) (width 0.15) (tstamp {uuid.uuid4()}))")
-            footprint.append(
-                f"(fp_line (start {unit_width / -2} {unit_height * 2 / 2}) (end {unit_width / -2} {unit_height * 2 / -2}) (layer Dwgs.User) (width 0.15) (tstamp {uuid.uuid4()}))")
-        else:  # Numerical value
-            footprint.append(
-                f"(fp_line (start {unit_width * keysize / 2} {unit_height / 2}) (end {unit_width * keysize / -2} {unit_height / 2}) (layer Dwgs.User) (width 0.15) (tstamp {uuid.uuid4()}))")
-            footprint.append(
-                f"(fp_line (start {unit_width * keysize / 2} {unit_height / -2}) (end {unit_width * keysize / -2} {unit_height / -2}) (layer Dwgs.User) (width 0.15) (tstamp {uuid.uuid4()}))")
-            footprint.append(
-                f"(fp_line (start {unit_width * keysize / 2} {unit_height / 2}) (end {unit_width * keysize / 2} {unit_height / -2}) (layer Dwgs.User) (width 0.15) (tstamp {uuid.uuid4()}))")
-            footprint.append(
-                f"(fp_line (start {unit_width * keysize / -2} {unit_height / 2}) (end {unit_width * keysize / -2} {unit_height / -2}) (layer Dwgs.User) (width 0.15) (tstamp {uuid.uuid4()}))")
+            logger.debug("Template of %s (%s): %d elements, %d name splice points", family_name,
+                         input_file.name if input_file is not None else "pre-parsed",
+                         len(compiled_template.footprint), len(compiled_template.segments) - 1)
 
-        return footprint
+        if output_dir is None and output_sink is None:
+            return
+        if self.output_sink is None:
+            # Imported here as sinks itself imports this module
+            from sinks import DirectorySink
+            self.output_sink = DirectorySink(deterministic=deterministic)
 
-    # Takes footprint object and injects stabilizer holes
+        # For each keysize, inject outlines and necessary addons (stabilizer holes and similar)
+        for keysize_def in self.keysizes:
+            self.generate_keysize(compiled_template=compiled_template, keysize_def=keysize_def,
+                                  output_dir=output_dir, keysizes_type=keysizes_type, family_name=family_name,
+                                  unit_width=unit_width, unit_height=unit_height)
+
+    # Generates and writes every variant of a single keysize
+    def generate_keysize(self, compiled_template, keysize_def, output_dir, keysizes_type, family_name, unit_width, unit_height):
+
+        # Write each created variant
+        for key_variant_name, output_data in self.render_keysize(
+                compiled_template=compiled_template, keysize_def=keysize_def, keysizes_type=keysizes_type,
+                unit_width=unit_width, unit_height=unit_height):
+            file_name = f"{family_name}-{key_variant_name}.kicad_mod"
+
+            with self.instrumentation.stage("write", family_name, keysize_name(keysize_def.get('keysize'))):
+                save_path = self.output_sink.write(output_dir, file_name, output_data)
+            self.output_paths.append(save_path)
+
+    # Lazily yields (footprint name (i.e. MX-Hotswap-2U-ReversedStabilizers), footprint) for every variant of
+    # each keysize definition, rendering one keysize at a time so memory stays constant however long the table is
+    # keysize_defs: Optional keysize definitions (defaults to the generator's table); any iterable, i.e. a generator
+    # unit_width/unit_height: Optional pitch overrides (default to the generator's)
+    # as_tree: Yield footprint_tree.Node trees instead of encoded bytes
+    def iter_footprints(self, keysize_defs=None, unit_width=None, unit_height=None, as_tree=False):
+        unit_width = unit_width or self.unit_width
+        unit_height = unit_height or self.unit_height
+        # Lists get a geometry column up front; other iterables (i.e. generators) are computed keysize by keysize
+        if keysize_defs is None or isinstance(keysize_defs, (list, tuple)):
+            column = self.keysizes if keysize_defs is None else keysize_defs
+            if any((keysize_def.get('keysize'), unit_width, unit_height) not in self.outline_column
+                   for keysize_def in column):
+                self.add_geometry_column(column, unit_width, unit_height)
+        for keysize_def in self.keysizes if keysize_defs is None else keysize_defs:
+            if as_tree:
+                for key_variant_name, elements in self.create_keysize_variants(
+                        keysize_def=keysize_def, keysizes_type=self.keysizes_type, unit_width=unit_width,
+                        unit_height=unit_height):
+                    yield f"{self.family_name}-{key_variant_name}", self.compiled_template.instantiate(
+                        name=key_variant_name, elements=elements)
+            else:
+                for key_variant_name, output_data in self.render_keysize(
+                        compiled_template=self.compiled_template, keysize_def=keysize_def,
+                        keysizes_type=self.keysizes_type, unit_width=unit_width, unit_height=unit_height):
+                    yield f"{self.family_name}-{key_variant_name}", output_data
+
+    # iter_footprints over every pitch of unit_sizes ([(unit width, unit height), ...]), pitch by pitch
+    # Yields (unit width, unit height, footprint name, footprint)
+    def iter_footprint_matrix(self, unit_sizes, keysize_defs=None, as_tree=False):
+        for unit_width, unit_height in unit_sizes:
+            for name, footprint in self.iter_footprints(keysize_defs=keysize_defs, unit_width=unit_width,
+                                                        unit_height=unit_height, as_tree=as_tree):
+                yield unit_width, unit_height, name, footprint
+
+    # Renders every variant of a single keysize without touching the disk
+    # Returns a list of (key variant name (i.e. 2U-ReversedStabilizers), encoded footprint bytes)
+    # Outlines and stabilizers come from the fragment cache; only their UUIDs are filled in per variant
+    def render_keysize(self, compiled_template, keysize_def, keysizes_type, unit_width, unit_height):
+        keysize_human_readable = keysize_name(keysize_def.get('keysize'))
+        instrumentation = self.instrumentation
+
+        with instrumentation.stage("outlines", self.family_name, keysize_human_readable):
+            outline_fragment = self.fragment_cache.get(
+                ("outlines", keysize_def.get('keysize'), unit_width, unit_height),
+                lambda: Fragment(self.generate_footprint_outlines(
+                    keysize_def=keysize_def, unit_width=unit_width, unit_height=unit_height,
+                    new_uuid=lambda: UUID_SENTINEL)))
+        with instrumentation.stage("stabilizers", self.family_name, keysize_human_readable):
+            stabilizer_fragments = self.fragment_cache.get(
+                ("stabilizers", keysizes_type, *stabilizer_key(keysize_def)),
+                lambda: [(stabilizer_variant['variant_name'], Fragment(stabilizer_variant['elements']))
+                         for stabilizer_variant in self.generate_footprint_stabilizers(
+                             keysize_def=keysize_def, keysizes_type=keysizes_type, keysize_name=keysize_human_readable,
+                             create_uuid_generator=lambda variant_name: lambda: UUID_SENTINEL)])
+
+        rendered_variants = []
+        with instrumentation.stage("encode", self.family_name, keysize_human_readable):
+            for variant_name, stabilizer_fragment in stabilizer_fragments:
+                key_variant_name = f"{keysize_human_readable}{variant_name or ''}"
+                encoded_outline = outline_fragment.fill(self.create_uuid_generator(f"{key_variant_name}/outline"))
+                encoded_stabilizers = stabilizer_fragment.fill(
+                    self.create_uuid_generator(f"{key_variant_name}/stabilizers"))
+                rendered_variants.append((key_variant_name, compiled_template.render_encoded(
+                    name=key_variant_name, encoded_elements=[encoded_outline, encoded_stabilizers])))
+        return rendered_variants
+
+    # Creates the generated elements of every variant of a single keysize
+    # Returns a list of (key variant name, elements to add to the template)
+    def create_keysize_variants(self, keysize_def, keysizes_type, unit_width, unit_height):
+        keysize_human_readable = keysize_name(keysize_def.get('keysize'))
+        instrumentation = self.instrumentation
+
+        # Create stabilizers, then an outline per variant (outline UUIDs are keyed by the full variant name)
+        with instrumentation.stage("stabilizers", self.family_name, keysize_human_readable):
+            stabilizer_variants = self.generate_footprint_stabilizers(
+                keysize_def=keysize_def, keysizes_type=keysizes_type, keysize_name=keysize_human_readable)
+
+        keysize_variants = []
+        for stabilizer_variant in stabilizer_variants:
+            key_variant_name = f"{keysize_human_readable}{stabilizer_variant['variant_name'] or ''}"
+            with instrumentation.stage("outlines", self.family_name, keysize_human_readable):
+                outline_elements = self.generate_footprint_outlines(
+                    keysize_def=keysize_def, unit_width=unit_width, unit_height=unit_height,
+                    new_uuid=self.create_uuid_generator(f"{key_variant_name}/outline"))
+            keysize_variants.append((key_variant_name, outline_elements + stabilizer_variant['elements']))
+        return keysize_variants
+
+    # Returns a function creating the UUIDs of one footprint's generated elements
+    def create_uuid_generator(self, variant_name):
+        if not self.deterministic:
+            return uuid.uuid4
+        element_index = itertools.count()
+        return lambda: uuid.uuid5(GENERATOR_UUID_NAMESPACE, f"{self.family_name}/{variant_name}/{next(element_index)}")
+
+    def parse_input(self, input_file):
+        return parse_footprint_file(input_file=input_file, debug=self.debug, instrumentation=self.instrumentation)
+
+    # Computes the outlines (at one unit size) and stabilizer holes of keysize_defs in one batched pass each
+    def add_geometry_column(self, keysize_defs, unit_width, unit_height):
+        keysizes = [keysize_def.get('keysize') for keysize_def in keysize_defs]
+        for keysize, outline in zip(keysizes, geometry.batch_outlines(keysizes, unit_width, unit_height)):
+            self.outline_column[(keysize, unit_width, unit_height)] = outline
+        for keysize_def, hole_variants in zip(keysize_defs, geometry.batch_stabilizer_holes(keysize_defs)):
+            self.stabilizer_column[stabilizer_key(keysize_def)] = hole_variants
+
+    # Creates the outline box elements (nested list style)
+    # Special shapes (ISO, 6U-Offcenter, ...) are polygons in geometry.SPECIAL_SHAPES, scaled by the unit size
+    # Keysizes outside the geometry columns (i.e. streamed sweeps) are computed on their own and not kept
+    def generate_footprint_outlines(self, keysize_def, unit_width, unit_height, new_uuid):
+        outline = self.outline_column.get((keysize_def.get('keysize'), unit_width, unit_height))
+        if outline is None:
+            outline = geometry.batch_outlines([keysize_def.get('keysize')], unit_width, unit_height)[0]
+        return [create_outline_line(start[0], start[1], end[0], end[1], new_uuid())
+                for start, end in geometry.polygon_edges(outline)]
+
+    # Creates the stabilizer hole elements of each stabilizer variant
+    # create_uuid_generator: Optional replacement for self.create_uuid_generator (called with each variant's name)
     # Returns a list of
     # {
-    #     "footprint": footprint,
+    #     "elements": elements to add to the footprint,
     #     "variant_name": variant name (appendable to footprint name)
     # }
-    def generate_footprint_stabilizers(self, base_footprint, keysize_def, keysizes_type):
+    def generate_footprint_stabilizers(self, keysize_def, keysizes_type, keysize_name, create_uuid_generator=None):
+        create_uuid_generator = create_uuid_generator or self.create_uuid_generator
 
         if not keysize_def.get("stabilizer_dist"):
             return [{
-                "footprint": base_footprint[:],
+                "elements": [],
                 "variant_name": None
             }]
 
-        stabilizer_dist_left = keysize_def.get("stabilizer_dist")
-        stabilizer_dist_right = keysize_def.get("stabilizer_dist_right") or keysize_def.get("stabilizer_dist")
-        stabilizer_vert = keysize_def.get("stabilizer_vert")
-
         ret_list = []
 
         if keysizes_type in ["mx", "mx_alps", "alps_mx_stabilizers"]:
-            for variant in [None, "-ReversedStabilizers"]:
-                footprint_variant_copy = base_footprint[:]
-                flip_multiplier = 1
-                if variant:
-                    flip_multiplier = -1
-                if stabilizer_vert:
-                    footprint_variant_copy.append(f'(pad "" np_thru_hole circle (at {6.985 * flip_multiplier} {stabilizer_dist_left}) (size 3.048 3.048) (drill 3.048) (layers *.Cu *.Mask) (tstamp {uuid.uuid4()}))')
-                    footprint_variant_copy.append(f'(pad "" np_thru_hole circle (at {6.985 * flip_multiplier} {stabilizer_dist_right * -1}) (size 3.048 3.048) (drill 3.048) (layers *.Cu *.Mask) (tstamp {uuid.uuid4()}))')
-                    footprint_variant_copy.append(f'(pad "" np_thru_hole circle (at {-8.255 * flip_multiplier} {stabilizer_dist_left}) (size 3.9878 3.9878) (drill 3.9878) (layers *.Cu *.Mask) (tstamp {uuid.uuid4()}))')
-                    footprint_variant_copy.append(f'(pad "" np_thru_hole circle (at {-8.255 * flip_multiplier} {stabilizer_dist_right * -1}) (size 3.9878 3.9878) (drill 3.9878) (layers *.Cu *.Mask) (tstamp {uuid.uuid4()}))')
-                else:
-                    footprint_variant_copy.append(f'(pad "" np_thru_hole circle (at {stabilizer_dist_left * -1} {-6.985 * flip_multiplier}) (size 3.048 3.048) (drill 3.048) (layers *.Cu *.Mask) (tstamp {uuid.uuid4()}))')
-                    footprint_variant_copy.append(f'(pad "" np_thru_hole circle (at {stabilizer_dist_right} {-6.985 * flip_multiplier}) (size 3.048 3.048) (drill 3.048) (layers *.Cu *.Mask) (tstamp {uuid.uuid4()}))')
-                    footprint_variant_copy.append(f'(pad "" np_thru_hole circle (at {stabilizer_dist_left * -1} {8.255 * flip_multiplier}) (size 3.9878 3.9878) (drill 3.9878) (layers *.Cu *.Mask) (tstamp {uuid.uuid4()}))')
-                    footprint_variant_copy.append(f'(pad "" np_thru_hole circle (at {stabilizer_dist_right} {8.255 * flip_multiplier}) (size 3.9878 3.9878) (drill 3.9878) (layers *.Cu *.Mask) (tstamp {uuid.uuid4()}))')
-                    
+            hole_variants = self.stabilizer_column.get(stabilizer_key(keysize_def))
+            if hole_variants is None:
+                hole_variants = geometry.batch_stabilizer_holes([keysize_def])[0]
+            for (variant, _), holes in zip(geometry.STABILIZER_VARIANTS, hole_variants):
+                new_uuid = create_uuid_generator(f"{keysize_name}{variant or ''}/stabilizers")
                 ret_list.append({
-                    "footprint": footprint_variant_copy,
+                    "elements": [create_stabilizer_hole(x, y, diameter, new_uuid()) for x, y, diameter in holes],
                     "variant_name": variant
                 })
         elif keysizes_type in [""]:
             # TODO: Generate plate-mount stabilizer keepout zones for KS-33 footprint types
             ret_list = [{
-                "footprint": base_footprint[:],
+                "elements": [],
                 "variant_name": None
             }]
         else:
             ret_list = [{
-                "footprint": base_footprint[:],
+                "elements": [],
                 "variant_name": None
             }]
         
@@ -313,7 +793,7 @@ if __name__ == '__main__':
   - gateron_ks33: Generate gateron KS-33 (low-profile v2.0) sizes
   - kailh_pg1353: Generate kailh PG1353 (choc V2) sizes"""
     arg_parser.add_argument("-t", "--keysizes-type", dest="keysizes_type",
-                            help=description_keysizes_type, choices=["mx", "alps", "mx_alps", "alps_mx_stabilizers", "gateron_ks33", "kailh_pg1353"], required=True)
+                            help=description_keysizes_type, choices=list(KEYSIZES_TYPES), required=True)
 
     description_family_name = "Specify the output footprint family name (i.e. the MX-Hotswap part of MX-Hotswap-1U.pretty)."
     arg_parser.add_argument(
@@ -333,13 +813,36 @@ if __name__ == '__main__':
     arg_parser.add_argument("-uh", "--unit-height", dest="unit_height",
                             help=description_unit_height, type=float, default=19.05)
 
+    description_deterministic = "Optional: Derive element UUIDs from family, variant and element index so unchanged footprints are not rewritten."
+    arg_parser.add_argument("--deterministic", dest="deterministic",
+                            help=description_deterministic, action="store_true")
+
+    description_archive = "Optional: Write the library into this archive (.zip, .tar, .tar.gz, .tar.xz, ...) with a manifest instead of\n" \
+                          "the output directory, which then only names the library folder and does not have to exist."
+    arg_parser.add_argument("-a", "--archive", dest="archive", help=description_archive)
+
+    description_watch = "Optional: Keep running and regenerate the library (with deterministic UUIDs) whenever the template\n" \
+                        "or keysizes.py changes."
+    arg_parser.add_argument("--watch", dest="watch", help=description_watch, action="store_true")
+
+    description_report = "Optional: Write per-stage timings and net memory blocks to this file (.json or .csv)."
+    arg_parser.add_argument("--report", dest="report", help=description_report)
+
+    description_report_allocations = "Optional: Also trace allocations with tracemalloc and add the peak bytes allocated by each stage to\n" \
+                                     "the --report file. Slows the run down, so its timings are inflated."
+    arg_parser.add_argument("--report-allocations", dest="report_allocations", help=description_report_allocations,
+                            action="store_true")
+
+    description_profile = "Optional: Write a cProfile dump of the run to this file (i.e. for snakeviz or pstats)."
+    arg_parser.add_argument("--profile", dest="profile", help=description_profile)
+
     description_debug = "Optional: Enable debug mode."
     arg_parser.add_argument("-d", "--debug", dest="debug",
                             help=description_debug, action="store_true")
 
     args = arg_parser.parse_args()
-    if args.debug:
-        print(args)
+    configure_logging(args.debug)
+    logger.debug("%s", args)
 
     # Sanity check args
 
@@ -349,11 +852,56 @@ if __name__ == '__main__':
         sys.exit(1)
 
     output_dir = Path(args.output_dir)
-    if not output_dir.is_dir():
+    if not output_dir.is_dir() and not args.archive:
         print("Output dir invalid", file=sys.stderr)
         sys.exit(1)
 
+    if args.watch and args.archive:
+        print("--watch cannot be combined with --archive", file=sys.stderr)
+        sys.exit(1)
+
+    if args.report_allocations and not args.report:
+        print("--report-allocations needs --report", file=sys.stderr)
+        sys.exit(1)
+
     # Launch generator
 
-    footprints_generator = FootprintsGenerator(input_file=input_file, output_dir=output_dir, keysizes_type=args.keysizes_type, family_name=args.family_name,
-                                               unit_width=args.unit_width, unit_height=args.unit_height, debug=args.debug)
+    if args.watch:
+        # Imported here as watch itself imports this module
+        from watch import FamilyWatcher
+        FamilyWatcher([{"template": input_file.resolve(), "keysizes_type": args.keysizes_type,
+                        "family_name": args.family_name, "output_dir": output_dir,
+                        "unit_width": args.unit_width, "unit_height": args.unit_height}], debug=args.debug).run()
+        sys.exit(0)
+
+    output_sink = None
+    if args.archive:
+        # Imported here as sinks itself imports this module
+        from sinks import open_archive_sink
+        try:
+            output_sink = open_archive_sink(Path(args.archive))
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+
+    instrumentation = Instrumentation(args.report_allocations) if args.report else None
+    try:
+        with Profiler(args.profile):
+            footprints_generator = FootprintsGenerator(input_file=input_file, output_dir=output_dir, keysizes_type=args.keysizes_type, family_name=args.family_name,
+                                                       unit_width=args.unit_width, unit_height=args.unit_height, debug=args.debug,
+                                                       deterministic=args.deterministic, instrumentation=instrumentation,
+                                                       output_sink=output_sink)
+    except FootprintParseError as e:
+        if output_sink is not None:
+            output_sink.abort()
+        print(f"Footprint parsing failed: {e}", file=sys.stderr)
+        sys.exit(1)
+    except BaseException:
+        if output_sink is not None:
+            output_sink.abort()
+        raise
+    if output_sink is not None:
+        output_sink.close()
+
+    if instrumentation is not None:
+        instrumentation.write_report(Path(args.report))
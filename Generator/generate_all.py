@@ -0,0 +1,438 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+import families
+from buildcache import BuildCache, hash_file
+from generate import (CompiledTemplate, FootprintEncoder, FootprintParseError, FootprintParser, FootprintsGenerator,
+                      FragmentCache, get_keysizes, logger, parse_footprint_file)
+from instrumentation import NULL_INSTRUMENTATION, Instrumentation, Profiler, configure_logging
+from models import ModelStore, rewrite_models
+from sinks import ARCHIVE_SUFFIXES, MemorySink, open_archive_sink
+
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+DEFAULT_CACHE_FILE = Path(__file__).resolve().parent / ".build-cache.json"
+
+DEFAULT_UNIT_SIZE = 19.05
+
+# Lists whose values differ between otherwise identical generator runs (ignored by --check)
+VOLATILE_NODE_NAMES = frozenset(("uuid", "tstamp"))
+
+
+# Templates parsed and compiled by the parent process, shared with each pool worker once via the initializer
+_worker_templates = {}
+
+# Outline and stabilizer fragments shared by every task a worker (or the in-process build) runs, across families
+_worker_fragment_cache = FragmentCache()
+
+
+def init_worker(templates):
+    global _worker_templates, _worker_fragment_cache
+    _worker_templates = templates
+    _worker_fragment_cache = FragmentCache()
+
+
+# Pool task: generates every variant of a single family/keysize pair
+# Returns the task ID, the written file paths, the stage records (empty unless the task is instrumented)
+# and the buffered writes (empty unless the task is buffered, in which case nothing is written by the task;
+# the parent replays them into its output sink so every footprint goes through a single handle)
+def build_keysize(task):
+    instrumentation = Instrumentation(task["trace_allocations"]) if task["instrumented"] else None
+    output_sink = MemorySink() if task["buffered"] else None
+    footprints_generator = FootprintsGenerator(
+        input_file=None, output_dir=task["output_dir"], keysizes_type=task["keysizes_type"],
+        family_name=task["family_name"], unit_width=task["unit_width"], unit_height=task["unit_height"],
+        debug=task["debug"], footprint=_worker_templates[task["template_key"]],
+        keysize_defs=[task["keysize_def"]], deterministic=task["deterministic"], instrumentation=instrumentation,
+        output_sink=output_sink, fragment_cache=_worker_fragment_cache)
+    return task["id"], footprints_generator.output_paths, instrumentation.rows() if instrumentation else [], \
+        output_sink.writes if output_sink else []
+
+
+# Pool task for --check: renders every variant of a single family/keysize pair in memory and compares
+# each against the committed file, byte for byte first and structurally (ignoring uuid/tstamp) when that fails
+# Returns the task ID, the checked file paths and a list of (file path, "missing" or "drifted") for each mismatch
+def check_keysize(task):
+    footprints_generator = FootprintsGenerator(
+        input_file=None, output_dir=None, keysizes_type=task["keysizes_type"], family_name=task["family_name"],
+        unit_width=task["unit_width"], unit_height=task["unit_height"], debug=task["debug"],
+        footprint=_worker_templates[task["template_key"]], deterministic=True, fragment_cache=_worker_fragment_cache)
+    checked_paths = []
+    mismatches = []
+    for key_variant_name, output_data in footprints_generator.render_keysize(
+            compiled_template=_worker_templates[task["template_key"]], keysize_def=task["keysize_def"],
+            keysizes_type=task["keysizes_type"], unit_width=task["unit_width"], unit_height=task["unit_height"]):
+        committed_path = task["output_dir"] / f"{task['family_name']}-{key_variant_name}.kicad_mod"
+        checked_paths.append(committed_path)
+        try:
+            committed_data = committed_path.read_bytes()
+        except FileNotFoundError:
+            mismatches.append((committed_path, "missing"))
+            continue
+        if committed_data == output_data:
+            continue
+        try:
+            if structural_hash(committed_data) == structural_hash(output_data):
+                continue
+        except FootprintParseError:
+            pass
+        mismatches.append((committed_path, "drifted"))
+    return task["id"], checked_paths, mismatches
+
+
+# Content hash of a footprint that ignores layout and the values of VOLATILE_NODE_NAMES lists
+def structural_hash(footprint_data):
+    footprint = strip_volatile(FootprintParser(footprint_data).processed_list)
+    return hashlib.sha256(FootprintEncoder(footprint=footprint, debug=False).encoded_footprint.encode()).hexdigest()
+
+
+def strip_volatile(node):
+    return [strip_volatile(element) if isinstance(element, list) else element for element in node
+            if not (isinstance(element, list) and element and element[0] in VOLATILE_NODE_NAMES)]
+
+
+# Reads a manifest file with the same schema as families.FAMILIES
+def load_manifest(manifest_path):
+    with manifest_path.open() as manifest_file:
+        return json.load(manifest_file)
+
+
+# Resolves relative paths and unit size defaults of each family definition
+def resolve_families(family_defs, root):
+    resolved = []
+    for family_def in family_defs:
+        resolved.append({
+            "template": (root / family_def["template"]).resolve(),
+            "keysizes_type": family_def["keysizes_type"],
+            "family_name": family_def["family_name"],
+            "output_dir": (root / family_def["output_dir"]).resolve(),
+            "unit_width": family_def.get("unit_width", DEFAULT_UNIT_SIZE),
+            "unit_height": family_def.get("unit_height", DEFAULT_UNIT_SIZE),
+        })
+    return resolved
+
+
+# Splits every family into one task per keysize
+def create_tasks(family_defs, debug, deterministic, instrumented=False, buffered=False, trace_allocations=False):
+    tasks = []
+    for family_def in family_defs:
+        for keysize_def in get_keysizes(family_def["keysizes_type"]):
+            tasks.append({**family_def, "keysize_def": keysize_def, "debug": debug, "deterministic": deterministic,
+                          "instrumented": instrumented, "trace_allocations": trace_allocations, "buffered": buffered,
+                          "id": BuildCache.entry_id(family_def, keysize_def),
+                          "template_key": family_def["template"], "models": {}})
+    return tasks
+
+
+# Parses and compiles each distinct template exactly once
+# tasks: Optional tasks whose model references are rewritten (see apply_model_store); a rewritten copy of
+#        their template is compiled under their template_key
+def parse_templates(template_paths, debug, instrumentation=None, tasks=()):
+    templates = {}
+    for template_path in template_paths:
+        if template_path not in templates:
+            templates[template_path] = CompiledTemplate(parse_footprint_file(
+                input_file=template_path, debug=debug, instrumentation=instrumentation or NULL_INSTRUMENTATION))
+    for task in tasks:
+        if task["template_key"] not in templates:
+            templates[task["template_key"]] = CompiledTemplate(
+                rewrite_models(templates[task["template"]].footprint, task["models"]))
+    return templates
+
+
+# Stores the 3D models of every task's template in model_store and points the task's footprints at the stored
+# copies; tasks sharing a template and the resulting references share one compiled template
+def apply_model_store(tasks, model_store):
+    for task in tasks:
+        task["models"] = model_store.rewrite_references(task["template"], task["output_dir"])
+        if task["models"]:
+            task["template_key"] = (task["template"], tuple(sorted(task["models"].items())))
+
+
+# cache: Optional BuildCache; family/keysize pairs that it reports as fresh are skipped entirely,
+#        and templates that only fresh pairs use are not even parsed
+# instrumentation: Optional instrumentation.Instrumentation; records of pool workers are merged into it
+# output_sink: Optional sinks.OutputSink (i.e. a ZipSink) receiving every footprint, in task order,
+#              instead of files in the output directories; cannot be combined with cache
+# model_store: Optional models.ModelStore the templates' 3D models are stored in and referenced from
+def build_all(family_defs, jobs, debug, deterministic=False, cache=None, instrumentation=None, output_sink=None,
+              model_store=None):
+    if cache is not None and output_sink is not None:
+        raise ValueError("Incremental builds need output directories, not an output sink")
+    tasks = create_tasks(family_defs, debug, deterministic, instrumented=instrumentation is not None,
+                         buffered=output_sink is not None,
+                         trace_allocations=instrumentation is not None and instrumentation.trace_allocations)
+    if model_store is not None:
+        apply_model_store(tasks, model_store)
+
+    if cache is not None:
+        template_hashes = {}
+        for task in tasks:
+            if task["template"] not in template_hashes:
+                template_hashes[task["template"]] = hash_file(task["template"])
+            task["key"] = BuildCache.build_key(template_hashes[task["template"]], task, task["keysize_def"],
+                                               deterministic)
+        tasks = [task for task in tasks if not cache.is_fresh(task["id"], task["key"])]
+
+    if not tasks:
+        return []
+
+    templates = parse_templates([task["template"] for task in tasks], debug, instrumentation, tasks=tasks)
+
+    # Single job = run in-process (simpler to debug, no pool startup)
+    if jobs == 1:
+        init_worker(templates)
+        results = [collect_result(build_keysize(task), output_sink) for task in tasks]
+    else:
+        # Imported here so no-op incremental builds do not pay for loading multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(templates,)) as executor:
+            results = [collect_result(result, output_sink)
+                       for result in executor.map(build_keysize, tasks, chunksize=4)]
+
+    if instrumentation is not None:
+        for _, _, stage_rows, _ in results:
+            instrumentation.merge(stage_rows)
+
+    if cache is not None:
+        for task, (_, output_paths, _, _) in zip(tasks, results):
+            cache.record(task["id"], task["key"], output_paths)
+        cache.save()
+
+    return results
+
+
+# Replays the buffered writes of a build_keysize result (with the digests the worker computed) into output_sink
+# as soon as the result arrives, so only one task's output is held in memory at a time; the result then lists
+# the sink's paths instead
+def collect_result(result, output_sink):
+    task_id, output_paths, stage_rows, buffered_writes = result
+    if output_sink is None:
+        return result
+    output_paths = [output_sink.write(output_dir, file_name, output_data, digest)
+                    for output_dir, file_name, output_data, digest in buffered_writes]
+    return task_id, output_paths, stage_rows, []
+
+
+# Regenerates every family in memory and compares the output with the committed libraries; writes nothing
+# Returns a sorted list of (file path, status) for every footprint that differs:
+#   - missing: generated, but not in the library
+#   - drifted: in the library, but not what the generator produces (hand-edited or stale)
+#   - unexpected: in a generated library, but not produced by any family (left over or hand-made)
+def check_all(family_defs, jobs, debug):
+    tasks = create_tasks(family_defs, debug, deterministic=True)
+    templates = parse_templates([task["template"] for task in tasks], debug)
+
+    if jobs == 1:
+        init_worker(templates)
+        results = [check_keysize(task) for task in tasks]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(templates,)) as executor:
+            results = list(executor.map(check_keysize, tasks, chunksize=4))
+
+    mismatches = [mismatch for _, _, task_mismatches in results for mismatch in task_mismatches]
+
+    # Library files that no family produces
+    checked_paths = {checked_path for _, task_paths, _ in results for checked_path in task_paths}
+    for output_dir in {family_def["output_dir"] for family_def in family_defs}:
+        for library_path in output_dir.glob("*.kicad_mod"):
+            if library_path not in checked_paths:
+                mismatches.append((library_path, "unexpected"))
+
+    return sorted(mismatches)
+
+
+if __name__ == '__main__':
+
+    # Parse args
+
+    description_cmd = "Generates every footprint library listed in a manifest (families.py by default) in a single process pool."
+    arg_parser = argparse.ArgumentParser(
+        description=description_cmd, formatter_class=argparse.RawTextHelpFormatter)
+
+    description_manifest = "Optional: JSON manifest file with the same schema as families.py. Defaults to families.FAMILIES."
+    arg_parser.add_argument(
+        "-m", "--manifest", dest="manifest", help=description_manifest)
+
+    description_root = "Optional: Directory that manifest paths are relative to. Defaults to the repository root."
+    arg_parser.add_argument(
+        "-r", "--root", dest="root", help=description_root, default=str(REPO_ROOT))
+
+    description_jobs = "Optional: Number of worker processes. Defaults to the CPU count; 1 runs in-process."
+    arg_parser.add_argument("-j", "--jobs", dest="jobs",
+                            help=description_jobs, type=int, default=os.cpu_count() or 1)
+
+    description_deterministic = "Optional: Derive element UUIDs from family, variant and element index so unchanged footprints are not rewritten."
+    arg_parser.add_argument("--deterministic", dest="deterministic",
+                            help=description_deterministic, action="store_true")
+
+    description_incremental = "Optional: Skip family/keysize pairs whose inputs and outputs are unchanged since the last incremental build."
+    arg_parser.add_argument("--incremental", dest="incremental",
+                            help=description_incremental, action="store_true")
+
+    description_cache_file = f"Optional: Build-state file used by --incremental. Defaults to {DEFAULT_CACHE_FILE.name} next to this script."
+    arg_parser.add_argument("--cache-file", dest="cache_file",
+                            help=description_cache_file, default=str(DEFAULT_CACHE_FILE))
+
+    description_archive = f"Optional: Write every library into this archive ({', '.join(ARCHIVE_SUFFIXES)}) instead of the output directories,\n" \
+                          "with a manifest listing each footprint. Output directories then only name the library folders."
+    arg_parser.add_argument("-a", "--archive", dest="archive", help=description_archive)
+
+    description_model_store = "Optional: Store the 3D models templates reference once per content in this directory (named by hash)\n" \
+                              "and point the generated footprints at those copies. Unchanged models are not copied again."
+    arg_parser.add_argument("--model-store", dest="model_store", help=description_model_store)
+
+    description_check = "Optional: Regenerate in memory and report committed footprints that differ from the generator output\n" \
+                        "(ignoring uuid/tstamp values) instead of writing anything. Exits with 1 on any difference."
+    arg_parser.add_argument("--check", dest="check", help=description_check, action="store_true")
+
+    description_watch = "Optional: Keep running and regenerate (with deterministic UUIDs) each family whose template\n" \
+                        "or keysizes table changes, keeping templates parsed in between."
+    arg_parser.add_argument("--watch", dest="watch", help=description_watch, action="store_true")
+
+    description_index = "Optional: Also write an index of every footprint (sizes, variants, outline bounds, pads, holes and\n" \
+                        "content hashes) to this directory, one <family>.json per family plus library.json. Needs --deterministic."
+    arg_parser.add_argument("--index", dest="index", help=description_index)
+
+    description_report = "Optional: Write per-stage timings and net memory blocks by family and keysize to this file (.json or .csv)."
+    arg_parser.add_argument("--report", dest="report", help=description_report)
+
+    description_report_allocations = "Optional: Also trace allocations with tracemalloc and add the peak bytes allocated by each stage to\n" \
+                                     "the --report file. Slows the run down, so its timings are inflated."
+    arg_parser.add_argument("--report-allocations", dest="report_allocations", help=description_report_allocations,
+                            action="store_true")
+
+    description_profile = "Optional: Write a cProfile dump of the run to this file. Only covers worker code with --jobs 1."
+    arg_parser.add_argument("--profile", dest="profile", help=description_profile)
+
+    description_debug = "Optional: Enable debug mode."
+    arg_parser.add_argument("-d", "--debug", dest="debug",
+                            help=description_debug, action="store_true")
+
+    args = arg_parser.parse_args()
+    configure_logging(args.debug)
+    logger.debug("%s", args)
+
+    # Sanity check args
+
+    root = Path(args.root)
+    if not root.is_dir():
+        print("Root dir invalid", file=sys.stderr)
+        sys.exit(1)
+
+    if args.manifest:
+        manifest_path = Path(args.manifest)
+        if not manifest_path.is_file():
+            print("Manifest file invalid", file=sys.stderr)
+            sys.exit(1)
+        family_defs = resolve_families(load_manifest(manifest_path), root)
+    else:
+        family_defs = resolve_families(families.FAMILIES, root)
+
+    for family_def in family_defs:
+        if not family_def["template"].is_file():
+            print(f"Input file invalid: {family_def['template']}", file=sys.stderr)
+            sys.exit(1)
+        if not family_def["output_dir"].is_dir() and not args.archive:
+            print(f"Output dir invalid: {family_def['output_dir']}", file=sys.stderr)
+            sys.exit(1)
+
+    if args.jobs < 1:
+        print("Job count invalid", file=sys.stderr)
+        sys.exit(1)
+
+    if args.archive and args.incremental:
+        print("--incremental cannot be combined with --archive", file=sys.stderr)
+        sys.exit(1)
+
+    if args.watch and (args.archive or args.check):
+        print("--watch cannot be combined with --archive or --check", file=sys.stderr)
+        sys.exit(1)
+
+    if args.report_allocations and not args.report:
+        print("--report-allocations needs --report", file=sys.stderr)
+        sys.exit(1)
+
+    if args.index and (args.check or args.watch or not args.deterministic):
+        print("--index needs --deterministic and cannot be combined with --check or --watch", file=sys.stderr)
+        sys.exit(1)
+
+    # Watch templates
+
+    if args.watch:
+        # Imported here so regular builds do not load the watcher
+        from watch import FamilyWatcher
+        FamilyWatcher(family_defs, debug=args.debug).run()
+        sys.exit(0)
+
+    # Check committed libraries
+
+    if args.check:
+        try:
+            mismatches = check_all(family_defs=family_defs, jobs=args.jobs, debug=args.debug)
+        except FootprintParseError as e:
+            print(f"Footprint parsing failed: {e}", file=sys.stderr)
+            sys.exit(1)
+        for library_path, status in mismatches:
+            print(f"{status}: {library_path}")
+        if mismatches:
+            print(f"{len(mismatches)} footprints differ from the generator output; run generate-all.sh to update them",
+                  file=sys.stderr)
+            sys.exit(1)
+        sys.exit(0)
+
+    # Launch generators
+
+    instrumentation = Instrumentation(args.report_allocations) if args.report else None
+    try:
+        cache = BuildCache(Path(args.cache_file)) if args.incremental else None
+        output_sink = open_archive_sink(Path(args.archive)) if args.archive else None
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    model_store = None
+    if args.model_store:
+        model_store = ModelStore(Path(args.model_store).resolve(), output_sink=output_sink)
+        if output_sink is None:
+            model_store.store_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        with Profiler(args.profile):
+            build_all(family_defs=family_defs, jobs=args.jobs, debug=args.debug, deterministic=args.deterministic,
+                      cache=cache, instrumentation=instrumentation, output_sink=output_sink, model_store=model_store)
+    except FootprintParseError as e:
+        if output_sink is not None:
+            output_sink.abort()
+        print(f"Footprint parsing failed: {e}", file=sys.stderr)
+        sys.exit(1)
+    except BaseException:
+        if output_sink is not None:
+            output_sink.abort()
+        raise
+    if output_sink is not None:
+        output_sink.close()
+
+    # Index the footprints, with the same model references as the build
+
+    if args.index:
+        # Imported here so regular builds do not load the indexer
+        from library_index import index_families, write_index
+        index_tasks = create_tasks(family_defs, args.debug, deterministic=True)
+        if model_store is not None:
+            apply_model_store(index_tasks, model_store)
+        templates = parse_templates([task["template"] for task in index_tasks], args.debug, tasks=index_tasks)
+        write_index(index_families(family_defs, templates={
+            task["family_name"]: templates[task["template_key"]] for task in index_tasks}), Path(args.index))
+
+    if model_store is not None:
+        model_store.save_hashes()
+        logger.debug("Models: %d stored, %d already in the store", model_store.copied, model_store.skipped)
+
+    if instrumentation is not None:
+        instrumentation.write_report(Path(args.report))
+        if args.debug:
+            instrumentation.print_summary()
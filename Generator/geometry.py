@@ -0,0 +1,150 @@
+# Keysize geometry engine
+# Computes key outlines and stabilizer hole positions for whole columns of keysizes and pitches in one pass,
+# so large parametric sweeps (i.e. every 0.125U step from 1U to 10U at several pitches) share the same code
+# path as the library tables in keysizes.py
+
+
+# Special key shapes as outline polygons in key units (x in unit widths, y in unit heights), centered on the switch
+# Numerical keysizes are plain rectangles and do not need an entry here
+SPECIAL_SHAPES = {
+    # 1.5U top, 1.25U bottom, 2U tall
+    "ISO": [(-0.875, -1), (0.625, -1), (0.625, 1), (-0.625, 1), (-0.625, 0), (-0.875, 0)],
+    # ISO turned sideways
+    "ISO-Rotated": [(-1, -0.625), (1, -0.625), (1, 0.625), (0, 0.625), (0, 0.875), (-1, 0.875)],
+    # 6U with the switch 0.5U right of center
+    "6U-Offcenter": [(-3.5, -0.5), (2.5, -0.5), (2.5, 0.5), (-3.5, 0.5)],
+    # 1U wide, 2U tall
+    "2U-Vertical": [(-0.5, -1), (0.5, -1), (0.5, 1), (-0.5, 1)],
+}
+
+# MX PCB-mount stabilizer holes for a horizontal, north-facing stabilizer
+# (side of the switch, Y position, hole diameter) - side -1 uses stabilizer_dist, side 1 uses stabilizer_dist_right
+STABILIZER_HOLE_LAYOUT = [
+    (-1, -6.985, 3.048),
+    (1, -6.985, 3.048),
+    (-1, 8.255, 3.9878),
+    (1, 8.255, 3.9878),
+]
+
+# Stabilizer orientations generated for each keysize: (variant name suffix, Y flip)
+STABILIZER_VARIANTS = [
+    (None, 1),
+    ("-ReversedStabilizers", -1),
+]
+
+# Decimal places kept when formatting coordinates (KiCad resolves to 1nm)
+COORDINATE_DECIMALS = 6
+
+
+# Outline polygon of a keysize in key units
+def keysize_polygon(keysize):
+    if isinstance(keysize, (int, float)):
+        return [(keysize / -2, -0.5), (keysize / 2, -0.5), (keysize / 2, 0.5), (keysize / -2, 0.5)]
+    if keysize in SPECIAL_SHAPES:
+        return SPECIAL_SHAPES[keysize]
+    raise ValueError(f"Unknown keysize shape: {keysize}")
+
+
+# Outline polygons (in mm) for columns of keysizes and pitches
+# unit_widths/unit_heights are either one value for every keysize or one value per keysize
+def batch_outlines(keysizes, unit_widths, unit_heights):
+    count = len(keysizes)
+    unit_widths = expand_column(unit_widths, count)
+    unit_heights = expand_column(unit_heights, count)
+    return [
+        [(x * unit_width, y * unit_height) for x, y in keysize_polygon(keysize)]
+        for keysize, unit_width, unit_height in zip(keysizes, unit_widths, unit_heights)
+    ]
+
+
+# Stabilizer holes (in mm) of every keysize definition
+# Returns one entry per definition: None without stabilizers, otherwise a list with one
+# [(x, y, diameter), ...] hole list per STABILIZER_VARIANTS entry
+def batch_stabilizer_holes(keysize_defs):
+    results = []
+    for keysize_def in keysize_defs:
+        stabilizer_dist_left = keysize_def.get("stabilizer_dist")
+        if not stabilizer_dist_left:
+            results.append(None)
+            continue
+        stabilizer_dist_right = keysize_def.get("stabilizer_dist_right") or stabilizer_dist_left
+        stabilizer_vert = keysize_def.get("stabilizer_vert")
+
+        variants = []
+        for _, flip in STABILIZER_VARIANTS:
+            holes = []
+            for side, y, diameter in STABILIZER_HOLE_LAYOUT:
+                x = stabilizer_dist_right if side > 0 else -stabilizer_dist_left
+                y = y * flip
+                # Vertical stabilizers = horizontal layout turned 90 degrees
+                if stabilizer_vert:
+                    x, y = -y, -x
+                holes.append((x, y, diameter))
+            variants.append(holes)
+        results.append(variants)
+    return results
+
+
+# Line segments of a closed polygon as ((start x, start y), (end x, end y))
+def polygon_edges(polygon):
+    return [(polygon[index - 1], polygon[index]) for index in range(1, len(polygon))] + [(polygon[-1], polygon[0])]
+
+
+# Axis-aligned bounds of a polygon as (min x, min y, max x, max y)
+def polygon_bounds(polygon):
+    xs = [x for x, _ in polygon]
+    ys = [y for _, y in polygon]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+# Keysize definitions for every step from start to stop (inclusive), i.e. 1U to 10U in 0.125U steps
+# stabilizer_dist is only set when given, as a function of the keysize
+# Whole sizes are ints, so they are named like the library tables (2U, not 2.0U)
+def sweep_keysizes(start, stop, step, stabilizer_dist=None):
+    keysize_defs = []
+    for index in range(round((stop - start) / step) + 1):
+        keysize = round(start + index * step, COORDINATE_DECIMALS)
+        if keysize.is_integer():
+            keysize = int(keysize)
+        keysize_def = {"keysize": keysize}
+        if stabilizer_dist is not None and stabilizer_dist(keysize):
+            keysize_def["stabilizer_dist"] = stabilizer_dist(keysize)
+        keysize_defs.append(keysize_def)
+    return keysize_defs
+
+
+# Outlines and stabilizer holes for every keysize definition at every pitch, computed in one batched pass
+# pitches: [(unit width, unit height), ...]
+# Returns rows of {"keysize_def", "unit_width", "unit_height", "outline", "stabilizer_holes"}
+def sweep(keysize_defs, pitches):
+    keysizes = [keysize_def.get("keysize") for keysize_def in keysize_defs]
+    stabilizer_holes = batch_stabilizer_holes(keysize_defs)
+    unit_widths = [unit_width for unit_width, _ in pitches for _ in keysizes]
+    unit_heights = [unit_height for _, unit_height in pitches for _ in keysizes]
+    outlines = batch_outlines(keysizes * len(pitches), unit_widths, unit_heights)
+    return [
+        {
+            "keysize_def": keysize_defs[index % len(keysize_defs)],
+            "unit_width": unit_widths[index],
+            "unit_height": unit_heights[index],
+            "outline": outline,
+            "stabilizer_holes": stabilizer_holes[index % len(keysize_defs)],
+        }
+        for index, outline in enumerate(outlines)
+    ]
+
+
+def expand_column(values, count):
+    if isinstance(values, (int, float)):
+        return [values] * count
+    if len(values) != count:
+        raise ValueError(f"Expected {count} values, got {len(values)}")
+    return values
+
+
+# Formats a coordinate for footprint files: rounded to COORDINATE_DECIMALS, no trailing zeros, no negative zero
+def format_number(value):
+    formatted = f"{round(value, COORDINATE_DECIMALS):.{COORDINATE_DECIMALS}f}".rstrip("0").rstrip(".")
+    if formatted == "-0":
+        return "0"
+    return formatted
@@ -0,0 +1,191 @@
+import cProfile
+import csv
+import io
+import json
+import logging
+import sys
+import time
+import tracemalloc
+
+
+# Generation stages, in pipeline order
+STAGES = ("parse", "outlines", "stabilizers", "encode", "write")
+
+REPORT_FIELDS = ("family", "keysize", "stage", "calls", "seconds", "net_blocks")
+
+# Extra report field of instrumentation tracing allocations
+ALLOCATION_FIELDS = ("peak_bytes",)
+
+
+class Instrumentation:
+    # Per-stage wall time and net memory blocks, broken down by family and keysize
+    # net_blocks is the change of sys.getallocatedblocks() across a stage: blocks still held when the stage ends
+    # (i.e. the parsed tree or the rendered footprint), negative when a stage frees more than it keeps. It is not
+    # an allocation count, but costs nothing to sample, so timings stay undisturbed
+    # trace_allocations: Also trace allocations with tracemalloc and report peak_bytes, the most memory a stage
+    #                    allocated on top of what was allocated when it started (largest over its calls), which
+    #                    also covers stages that free everything they allocate. Starts tracemalloc, which slows
+    #                    every allocation down, so timings of such a run are inflated
+    #
+    # Example:
+    #   instrumentation = Instrumentation()
+    #   with instrumentation.stage("encode", "MX-Hotswap", "1U"):
+    #       ...
+    #   instrumentation.write_report(Path("report.json"))
+
+    enabled = True
+
+    def __init__(self, trace_allocations=False):
+        # (family, keysize, stage) -> [calls, seconds, net blocks, peak bytes]
+        self.records = {}
+        self.trace_allocations = trace_allocations
+        if trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stage(self, stage, family, keysize=""):
+        return StageTimer(self.records, (family, keysize, stage), self.trace_allocations)
+
+    # Folds in records collected elsewhere (i.e. by a pool worker), as returned by rows()
+    def merge(self, rows):
+        for row in rows:
+            record = self.records.setdefault((row["family"], row["keysize"], row["stage"]), [0, 0.0, 0, 0])
+            record[0] += row["calls"]
+            record[1] += row["seconds"]
+            record[2] += row["net_blocks"]
+            record[3] = max(record[3], row.get("peak_bytes", 0))
+
+    def fields(self):
+        return REPORT_FIELDS + ALLOCATION_FIELDS if self.trace_allocations else REPORT_FIELDS
+
+    def rows(self):
+        rows = []
+        for (family, keysize, stage), (calls, seconds, net_blocks, peak_bytes) in self.records.items():
+            row = {"family": family, "keysize": keysize, "stage": stage, "calls": calls, "seconds": seconds,
+                   "net_blocks": net_blocks}
+            if self.trace_allocations:
+                row["peak_bytes"] = peak_bytes
+            rows.append(row)
+        return rows
+
+    # Totals per stage over every family and keysize
+    def stage_totals(self):
+        totals = {stage: self.empty_total() for stage in STAGES}
+        for row in self.rows():
+            total = totals.setdefault(row["stage"], self.empty_total())
+            total["calls"] += row["calls"]
+            total["seconds"] += row["seconds"]
+            total["net_blocks"] += row["net_blocks"]
+            if self.trace_allocations:
+                total["peak_bytes"] = max(total["peak_bytes"], row["peak_bytes"])
+        return totals
+
+    def empty_total(self):
+        total = {"calls": 0, "seconds": 0.0, "net_blocks": 0}
+        if self.trace_allocations:
+            total["peak_bytes"] = 0
+        return total
+
+    def to_json(self):
+        return json.dumps({"stages": self.stage_totals(), "records": self.rows()}, indent=4)
+
+    def to_csv(self):
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames=self.fields(), lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(self.rows())
+        return output.getvalue()
+
+    # Report format follows the file extension (.csv, anything else is JSON)
+    def write_report(self, report_path):
+        report_path.write_text(self.to_csv() if report_path.suffix == ".csv" else self.to_json())
+
+    def print_summary(self, file=sys.stderr):
+        peak_header = f" {'peak bytes':>12}" if self.trace_allocations else ""
+        print(f"{'stage':<12} {'calls':>8} {'seconds':>10} {'net blocks':>10}{peak_header}", file=file)
+        for stage, total in self.stage_totals().items():
+            peak_column = f" {total['peak_bytes']:>12}" if self.trace_allocations else ""
+            print(f"{stage:<12} {total['calls']:>8} {total['seconds']:>10.4f} {total['net_blocks']:>10}{peak_column}",
+                  file=file)
+
+
+class StageTimer:
+
+    def __init__(self, records, key, trace_allocations=False):
+        self.records = records
+        self.key = key
+        self.trace_allocations = trace_allocations
+
+    def __enter__(self):
+        if self.trace_allocations:
+            # Stages never nest, so the peak can be reset for each of them
+            tracemalloc.reset_peak()
+            self.start_traced = tracemalloc.get_traced_memory()[0]
+        self.start_blocks = sys.getallocatedblocks()
+        self.start_time = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start_time
+        net_blocks = sys.getallocatedblocks() - self.start_blocks
+        peak_bytes = tracemalloc.get_traced_memory()[1] - self.start_traced if self.trace_allocations else 0
+        record = self.records.get(self.key)
+        if record is None:
+            self.records[self.key] = [1, elapsed, net_blocks, peak_bytes]
+        else:
+            record[0] += 1
+            record[1] += elapsed
+            record[2] += net_blocks
+            record[3] = max(record[3], peak_bytes)
+
+
+class NullInstrumentation:
+    # Stand-in used when instrumentation is off: every stage is the same no-op context manager
+
+    enabled = False
+
+    def stage(self, stage, family, keysize=""):
+        return NULL_STAGE
+
+    def merge(self, rows):
+        pass
+
+    def rows(self):
+        return []
+
+
+class NullStage:
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+NULL_STAGE = NullStage()
+
+NULL_INSTRUMENTATION = NullInstrumentation()
+
+
+class Profiler:
+    # Runs the enclosed block under cProfile and dumps the stats to output_path; does nothing without a path
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.profile = None
+
+    def __enter__(self):
+        if self.output_path:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.profile is not None:
+            self.profile.disable()
+            self.profile.dump_stats(str(self.output_path))
+
+
+# Debug output goes to stderr when enabled; otherwise only warnings and errors are shown
+def configure_logging(debug):
+    logging.basicConfig(level=logging.DEBUG if debug else logging.WARNING, format="%(levelname)s: %(message)s",
+                        stream=sys.stderr)
@@ -0,0 +1,302 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+from pathlib import Path
+import families
+import geometry
+from footprint_tree import child_numbers, find_child, unquote
+from generate import (UUID_SENTINEL, CompiledTemplate, FootprintParseError, FootprintsGenerator, get_keysizes,
+                      keysize_name, parse_footprint_file, write_if_changed)
+from generate_all import REPO_ROOT, load_manifest, resolve_families
+from instrumentation import configure_logging
+
+
+# Index of every generated footprint, so tools can look footprints up by family, size or variant and find their
+# outline bounds and holes without listing or parsing any .kicad_mod file
+# Everything comes from what FootprintsGenerator already holds: keysize tables, outline polygons, generated
+# stabilizer holes, the template's pads and the rendered bytes (hashed, never written). Content hashes are of the
+# deterministic output, i.e. what generate-all.sh writes and generate_all.py --check compares against
+#
+# Index (JSON; <family>.json holds one family entry, library.json all of them):
+# {
+#     "families": [
+#         {
+#             "family": Family name (i.e. MX-Hotswap),
+#             "keysizes_type": Key sizes type,
+#             "library": Library folder name (i.e. MX_Hotswap.pretty),
+#             "template": Template file name,
+#             "unit_width"/"unit_height": Unit size in mm,
+#             "pads": Pads of the template, shared by every footprint of the family:
+#                     [{"number", "type", "shape", "x", "y", "angle", "width", "height", "drill": [w, h] or null}, ...],
+#             "footprints": [
+#                 {
+#                     "name": Footprint name (i.e. MX-Hotswap-2U-ReversedStabilizers; the file is <name>.kicad_mod),
+#                     "keysize": Keysize as in keysizes.py (i.e. 2 or "ISO"),
+#                     "size": Keysize as in footprint names (i.e. 2U),
+#                     "variant": Stabilizer variant (i.e. ReversedStabilizers) or null,
+#                     "bbox": Key outline bounds [min x, min y, max x, max y] in mm,
+#                     "holes": Generated stabilizer holes [[x, y, diameter], ...] in mm,
+#                     "sha256": SHA-256 of the footprint file
+#                 },
+#                 ...
+#             ]
+#         },
+#         ...
+#     ]
+# }
+#
+# The optional SQLite form holds the same data in the tables families, pads (by family), footprints and
+# holes (by footprint name)
+#
+# Example:
+#   library_index = load_index(Path("index/library.json"))
+#   for footprint in find_footprints(library_index, size="2U", variant=""):
+#       ...
+
+
+# JSON file holding every family
+LIBRARY_INDEX_NAME = "library.json"
+
+SQLITE_SCHEMA = """
+CREATE TABLE families (name TEXT PRIMARY KEY, keysizes_type TEXT, library TEXT, template TEXT,
+                       unit_width REAL, unit_height REAL);
+CREATE TABLE pads (family TEXT, number TEXT, type TEXT, shape TEXT, x REAL, y REAL, angle REAL,
+                   width REAL, height REAL, drill_width REAL, drill_height REAL);
+CREATE TABLE footprints (name TEXT PRIMARY KEY, family TEXT, keysize TEXT, size TEXT, variant TEXT,
+                         min_x REAL, min_y REAL, max_x REAL, max_y REAL, sha256 TEXT);
+CREATE TABLE holes (footprint TEXT, x REAL, y REAL, diameter REAL);
+CREATE INDEX footprints_by_size ON footprints (size, variant);
+CREATE INDEX holes_by_footprint ON holes (footprint);
+"""
+
+
+def pad_entries(footprint):
+    entries = []
+    for element in footprint:
+        if not (isinstance(element, list) and element and element[0] == "pad"):
+            continue
+        at = child_numbers(find_child(element, "at"))
+        size = child_numbers(find_child(element, "size"))
+        drill = find_child(element, "drill")
+        drill_size = child_numbers(drill) if drill is not None else None
+        entries.append({
+            "number": unquote(element[1]),
+            "type": element[2],
+            "shape": element[3],
+            "x": at[0],
+            "y": at[1],
+            "angle": at[2] if len(at) > 2 else 0,
+            "width": size[0],
+            "height": size[1],
+            "drill": [drill_size[0], drill_size[-1]] if drill_size else None,
+        })
+    return entries
+
+
+# Index entry of one family (see the comment at the top)
+# compiled_template: Optional CompiledTemplate to use instead of parsing the family's template
+def index_family(family_def, compiled_template=None):
+    if compiled_template is None:
+        compiled_template = CompiledTemplate(parse_footprint_file(input_file=family_def["template"], debug=False))
+    keysizes_type = family_def["keysizes_type"]
+    footprints_generator = FootprintsGenerator(
+        input_file=None, output_dir=None, keysizes_type=keysizes_type, family_name=family_def["family_name"],
+        unit_width=family_def["unit_width"], unit_height=family_def["unit_height"], debug=False,
+        footprint=compiled_template, deterministic=True)
+
+    keysize_defs = get_keysizes(keysizes_type)
+    outlines = geometry.batch_outlines([keysize_def.get("keysize") for keysize_def in keysize_defs],
+                                       family_def["unit_width"], family_def["unit_height"])
+    footprints = []
+    for keysize_def, outline in zip(keysize_defs, outlines):
+        size = keysize_name(keysize_def.get("keysize"))
+        bbox = list(geometry.polygon_bounds(outline))
+        rendered = dict(footprints_generator.render_keysize(
+            compiled_template=compiled_template, keysize_def=keysize_def, keysizes_type=keysizes_type,
+            unit_width=family_def["unit_width"], unit_height=family_def["unit_height"]))
+        for stabilizer_variant in footprints_generator.generate_footprint_stabilizers(
+                keysize_def=keysize_def, keysizes_type=keysizes_type, keysize_name=size,
+                create_uuid_generator=lambda variant_name: lambda: UUID_SENTINEL):
+            variant_name = stabilizer_variant["variant_name"]
+            key_variant_name = f"{size}{variant_name or ''}"
+            footprints.append({
+                "name": f"{family_def['family_name']}-{key_variant_name}",
+                "keysize": keysize_def.get("keysize"),
+                "size": size,
+                "variant": variant_name.lstrip("-") if variant_name else None,
+                "bbox": bbox,
+                "holes": [[pad["x"], pad["y"], pad["width"]] for pad in pad_entries(stabilizer_variant["elements"])],
+                "sha256": hashlib.sha256(rendered[key_variant_name]).hexdigest(),
+            })
+
+    return {
+        "family": family_def["family_name"],
+        "keysizes_type": keysizes_type,
+        "library": family_def["output_dir"].name,
+        "template": family_def["template"].name,
+        "unit_width": family_def["unit_width"],
+        "unit_height": family_def["unit_height"],
+        "pads": pad_entries(compiled_template.footprint),
+        "footprints": footprints,
+    }
+
+
+# Index of every family; families sharing a template share one parsed copy
+# templates: Optional {family name: CompiledTemplate} (i.e. with model references rewritten by a ModelStore)
+def index_families(family_defs, templates=None):
+    templates = dict(templates or {})
+    parsed_templates = {}
+    family_entries = []
+    for family_def in family_defs:
+        compiled_template = templates.get(family_def["family_name"])
+        if compiled_template is None:
+            if family_def["template"] not in parsed_templates:
+                parsed_templates[family_def["template"]] = CompiledTemplate(
+                    parse_footprint_file(input_file=family_def["template"], debug=False))
+            compiled_template = parsed_templates[family_def["template"]]
+        family_entries.append(index_family(family_def, compiled_template))
+    return {"families": family_entries}
+
+
+def encode_index(library_index):
+    return json.dumps(library_index, separators=(",", ":")).encode() + b"\n"
+
+
+# Writes <family>.json for every family and library.json into index_dir; unchanged files are not rewritten
+# Returns the paths of the files that changed
+def write_index(library_index, index_dir):
+    index_dir.mkdir(parents=True, exist_ok=True)
+    changed_paths = []
+    for family_entry in library_index["families"]:
+        family_path = index_dir / f"{family_entry['family']}.json"
+        if write_if_changed(family_path, encode_index({"families": [family_entry]})):
+            changed_paths.append(family_path)
+    library_path = index_dir / LIBRARY_INDEX_NAME
+    if write_if_changed(library_path, encode_index(library_index)):
+        changed_paths.append(library_path)
+    return changed_paths
+
+
+# Writes the index as an SQLite database (replacing any previous one)
+def write_sqlite_index(library_index, database_path):
+    temp_path = database_path.with_name(database_path.name + ".tmp")
+    temp_path.unlink(missing_ok=True)
+    connection = sqlite3.connect(temp_path)
+    try:
+        connection.executescript(SQLITE_SCHEMA)
+        for family_entry in library_index["families"]:
+            family_name = family_entry["family"]
+            connection.execute("INSERT INTO families VALUES (?, ?, ?, ?, ?, ?)", (
+                family_name, family_entry["keysizes_type"], family_entry["library"], family_entry["template"],
+                family_entry["unit_width"], family_entry["unit_height"]))
+            connection.executemany("INSERT INTO pads VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+                (family_name, pad["number"], pad["type"], pad["shape"], pad["x"], pad["y"], pad["angle"],
+                 pad["width"], pad["height"], *(pad["drill"] or (None, None)))
+                for pad in family_entry["pads"]])
+            connection.executemany("INSERT INTO footprints VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+                (footprint["name"], family_name, str(footprint["keysize"]), footprint["size"], footprint["variant"],
+                 *footprint["bbox"], footprint["sha256"])
+                for footprint in family_entry["footprints"]])
+            connection.executemany("INSERT INTO holes VALUES (?, ?, ?, ?)", [
+                (footprint["name"], *hole) for footprint in family_entry["footprints"] for hole in footprint["holes"]])
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(temp_path, database_path)
+
+
+def load_index(index_path):
+    with index_path.open() as index_file:
+        return json.load(index_file)
+
+
+# Footprint entries matching every given filter
+# variant: None for any variant, "" for footprints without a stabilizer variant
+def find_footprints(library_index, family=None, size=None, variant=None):
+    for family_entry in library_index["families"]:
+        if family is not None and family_entry["family"] != family:
+            continue
+        for footprint in family_entry["footprints"]:
+            if size is not None and footprint["size"] != size:
+                continue
+            if variant is not None and (footprint["variant"] or "") != variant:
+                continue
+            yield footprint
+
+
+if __name__ == '__main__':
+
+    # Parse args
+
+    description_cmd = "Writes an index of every generated footprint (sizes, variants, outline bounds, pads, holes and\n" \
+                      "content hashes) without reading the libraries, or looks footprints up in an existing index."
+    arg_parser = argparse.ArgumentParser(
+        description=description_cmd, formatter_class=argparse.RawTextHelpFormatter)
+
+    description_output = f"Specify the directory the index is written to (<family>.json and {LIBRARY_INDEX_NAME})."
+    description_index = f"Specify an existing index file (i.e. {LIBRARY_INDEX_NAME}) to look footprints up in."
+    mode_group = arg_parser.add_mutually_exclusive_group(required=True)
+    mode_group.add_argument("-o", "--output-dir", dest="output_dir", help=description_output)
+    mode_group.add_argument("-i", "--index", dest="index", help=description_index)
+
+    description_sqlite = "Optional: Also write the index to this SQLite database."
+    arg_parser.add_argument("--sqlite", dest="sqlite", help=description_sqlite)
+
+    description_manifest = "Optional: JSON manifest file with the same schema as families.py. Defaults to families.FAMILIES."
+    arg_parser.add_argument("-m", "--manifest", dest="manifest", help=description_manifest)
+
+    description_root = "Optional: Directory that manifest paths are relative to. Defaults to the repository root."
+    arg_parser.add_argument("-r", "--root", dest="root", help=description_root, default=str(REPO_ROOT))
+
+    description_family = "Optional: Only index (or look up) this family."
+    arg_parser.add_argument("-f", "--family", dest="family", help=description_family)
+
+    description_size = "Optional: With --index, only list footprints of this size (i.e. 2U or ISO)."
+    arg_parser.add_argument("-s", "--size", dest="size", help=description_size)
+
+    description_variant = "Optional: With --index, only list footprints of this stabilizer variant (i.e. ReversedStabilizers);\n" \
+                          "an empty string lists footprints without one."
+    arg_parser.add_argument("-v", "--variant", dest="variant", help=description_variant)
+
+    description_debug = "Optional: Enable debug mode."
+    arg_parser.add_argument("-d", "--debug", dest="debug",
+                            help=description_debug, action="store_true")
+
+    args = arg_parser.parse_args()
+    configure_logging(args.debug)
+
+    # Look up footprints
+
+    if args.index:
+        index_path = Path(args.index)
+        if not index_path.is_file():
+            print("Index file invalid", file=sys.stderr)
+            sys.exit(1)
+        for footprint in find_footprints(load_index(index_path), family=args.family, size=args.size,
+                                         variant=args.variant):
+            print(footprint["name"])
+        sys.exit(0)
+
+    # Sanity check args
+
+    family_defs = resolve_families(
+        load_manifest(Path(args.manifest)) if args.manifest else families.FAMILIES, Path(args.root))
+    if args.family:
+        family_defs = [family_def for family_def in family_defs if family_def["family_name"] == args.family]
+        if not family_defs:
+            print(f"Unknown family: {args.family}", file=sys.stderr)
+            sys.exit(1)
+
+    # Build index
+
+    try:
+        library_index = index_families(family_defs)
+    except FootprintParseError as e:
+        print(f"Footprint parsing failed: {e}", file=sys.stderr)
+        sys.exit(1)
+    write_index(library_index, Path(args.output_dir))
+    if args.sqlite:
+        write_sqlite_index(library_index, Path(args.sqlite))
@@ -0,0 +1,181 @@
+import argparse
+import json
+import os
+import re
+import sys
+from pathlib import Path
+from buildcache import hash_file
+from generate import logger
+from footprint_tree import Node, unquote
+
+
+# 3D model file types found in footprint (model ...) references
+MODEL_SUFFIXES = (".step", ".stp", ".wrl")
+
+# (model "path" ...) references, read straight from template bytes without parsing
+MODEL_REFERENCE_REGEX = re.compile(rb'\(model\s+"((?:[^"\\]|\\.)*)"')
+
+# Hex digits of the SHA-256 kept in store file names
+STORE_DIGEST_LENGTH = 16
+
+# Sidecar in the store directory remembering the hash of every model path across runs
+HASHES_NAME = ".model-hashes.json"
+
+
+class ModelStore:
+    # Content-addressed store for the 3D models referenced by templates
+    # Every model is stored once as <store_dir>/<content hash><suffix>, however many templates, copies or names
+    # it has; a model whose hash is already stored is never copied again, so syncing unchanged models only costs
+    # a stat per model (hashes are remembered per path, size and mtime in HASHES_NAME; save_hashes() writes them)
+    # output_sink: Optional sinks.OutputSink receiving the stored models instead of store_dir
+    #              (hashes are then only remembered for the current run)
+    #
+    # Example:
+    #   model_store = ModelStore(Path("3D"))
+    #   references = model_store.rewrite_references(template_path, output_dir)
+    #   # -> {"./MX-Hotswap-Socket.step": "../3D/60c8ce85799f267a.step"}
+
+    def __init__(self, store_dir, output_sink=None):
+        self.store_dir = store_dir
+        self.output_sink = output_sink
+        # Model path -> (size, mtime_ns, SHA-256)
+        self.hashes = {}
+        self.hashes_path = store_dir / HASHES_NAME if store_dir is not None and output_sink is None else None
+        self.hashes_changed = False
+        self.load_hashes()
+        # Store file names written during this run (for output sinks)
+        self.stored = set()
+        # (template path, output dir) -> references, as returned by rewrite_references
+        self.references = {}
+        self.copied = 0
+        self.skipped = 0
+
+    # File format: { model path: [size, mtime_ns, SHA-256], ... }
+    def load_hashes(self):
+        if self.hashes_path is None:
+            return
+        try:
+            with self.hashes_path.open() as hashes_file:
+                hashes_data = json.load(hashes_file)
+        except (FileNotFoundError, ValueError):
+            return
+        self.hashes = {Path(model_path): tuple(entry) for model_path, entry in hashes_data.items()}
+
+    def save_hashes(self):
+        if self.hashes_path is None or not self.hashes_changed:
+            return
+        temp_path = self.hashes_path.with_name(self.hashes_path.name + ".tmp")
+        with temp_path.open(mode='w') as hashes_file:
+            json.dump({str(model_path): list(entry) for model_path, entry in self.hashes.items()}, hashes_file)
+        os.replace(temp_path, self.hashes_path)
+        self.hashes_changed = False
+
+    def hash_model(self, model_path):
+        stat = model_path.stat()
+        cached = self.hashes.get(model_path)
+        if cached is not None and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+            return cached[2]
+        digest = hash_file(model_path)
+        self.hashes[model_path] = (stat.st_size, stat.st_mtime_ns, digest)
+        self.hashes_changed = True
+        return digest
+
+    # Stores a model (unless its content is stored already) and returns its path in the store
+    def add(self, model_path):
+        digest = self.hash_model(model_path)
+        store_name = f"{digest[:STORE_DIGEST_LENGTH]}{model_path.suffix.lower()}"
+        store_path = self.store_dir / store_name
+        if self.output_sink is not None:
+            if store_name in self.stored:
+                self.skipped += 1
+            else:
+                self.output_sink.write(self.store_dir, store_name, model_path.read_bytes(), digest)
+                self.copied += 1
+        elif store_path.is_file():
+            self.skipped += 1
+        else:
+            # Written under a temporary name first so an interrupted copy never looks stored
+            temp_path = store_path.with_name(store_name + ".tmp")
+            temp_path.write_bytes(model_path.read_bytes())
+            os.replace(temp_path, store_path)
+            self.copied += 1
+        self.stored.add(store_name)
+        return store_path
+
+    # Stores every model a template references and maps each reference to its store path, relative to the
+    # directory the generated footprints go to (i.e. {"./MX-Hotswap-Socket.step": "../3D/60c8ce85799f267a.step"})
+    # References relative to the template are resolved from the template's directory; references using path
+    # variables (${KICAD8_3DMODEL_DIR}/...) and references to missing files are left as they are
+    def rewrite_references(self, template_path, output_dir):
+        cache_key = (template_path, output_dir)
+        if cache_key in self.references:
+            return self.references[cache_key]
+        references = {}
+        for match in MODEL_REFERENCE_REGEX.finditer(template_path.read_bytes()):
+            reference = unquote(f'"{match.group(1).decode()}"')
+            if "${" in reference or reference in references:
+                continue
+            model_path = (template_path.parent / reference).resolve()
+            if not model_path.is_file():
+                logger.warning("Model not found, reference kept: %s (%s)", reference, template_path.name)
+                continue
+            store_path = self.add(model_path)
+            references[reference] = Path(os.path.relpath(store_path, output_dir)).as_posix()
+        self.references[cache_key] = references
+        return references
+
+
+# Copy of footprint with its (model ...) references replaced according to references ({old path: new path});
+# only the changed model lists are copied, everything else is shared with footprint
+def rewrite_models(footprint, references):
+    rewritten = Node(footprint)
+    for index, element in enumerate(rewritten):
+        if isinstance(element, list) and element and element[0] == "model" and len(element) > 1:
+            new_reference = references.get(unquote(element[1]))
+            if new_reference is not None:
+                rewritten[index] = Node([element[0], json.dumps(new_reference)] + element[2:])
+    return rewritten
+
+
+# Groups the model files under root by content
+# Returns a list of [path, ...] with one entry per content that exists more than once, largest files first
+def find_duplicate_models(root, model_store=None):
+    model_store = model_store or ModelStore(None)
+    by_digest = {}
+    for model_path in sorted(root.rglob("*")):
+        if model_path.suffix.lower() in MODEL_SUFFIXES and model_path.is_file() and ".git" not in model_path.parts:
+            by_digest.setdefault(model_store.hash_model(model_path), []).append(model_path)
+    duplicates = [model_paths for model_paths in by_digest.values() if len(model_paths) > 1]
+    return sorted(duplicates, key=lambda model_paths: -model_paths[0].stat().st_size)
+
+
+if __name__ == '__main__':
+
+    # Parse args
+
+    description_cmd = "Lists 3D model files stored more than once (by content) and the space the copies take.\n" \
+                      "generate_all.py --model-store moves the models templates use into a content-addressed store."
+    arg_parser = argparse.ArgumentParser(
+        description=description_cmd, formatter_class=argparse.RawTextHelpFormatter)
+
+    description_root = "Optional: Directory to search. Defaults to the repository root."
+    arg_parser.add_argument("-r", "--root", dest="root", help=description_root,
+                            default=str(Path(__file__).resolve().parent.parent))
+
+    args = arg_parser.parse_args()
+
+    root = Path(args.root)
+    if not root.is_dir():
+        print("Root dir invalid", file=sys.stderr)
+        sys.exit(1)
+
+    # Find duplicates
+
+    duplicate_bytes = 0
+    for model_paths in find_duplicate_models(root):
+        size = model_paths[0].stat().st_size
+        duplicate_bytes += size * (len(model_paths) - 1)
+        print(f"{len(model_paths)} copies, {size / 1024:.0f} KiB each:")
+        for model_path in model_paths:
+            print(f"\t{model_path.relative_to(root)}")
+    print(f"{duplicate_bytes / 1024:.0f} KiB in duplicate copies")
@@ -0,0 +1,397 @@
+import argparse
+import copy
+import csv
+import json
+import math
+import sys
+import uuid
+from pathlib import Path
+import families
+from generate import (FootprintEncoder, FootprintParseError, FootprintsGenerator, GENERATOR_UUID_NAMESPACE,
+                      get_keysizes, keysize_name)
+from generate_all import REPO_ROOT, load_manifest, resolve_families
+from spatial import GridIndex, circle, rectangle, shape_bounds, shape_distance, transform_shape
+
+
+# Places generated footprints according to a keyboard-layout-editor (KLE) layout
+#   - parse_layout: KLE JSON (the "raw data" array) -> keys in key units
+#   - place_keys: keys -> placements (footprint name, position in mm, angle)
+#   - find_overlaps: holes and pads of neighbouring keys that overlap, found through a GridIndex
+#   - write_board / write_placements: .kicad_pcb with every footprint embedded, or a .csv/.json placement list
+#
+# Footprint choice per key:
+#   - 1.25U x 2U keys with a 1.5U x 1U upper part are ISO enters, and the mirrored arrangement ISO-Rotated
+#   - 1U x 2U keys are 2U-Vertical; other keys taller than wide use the footprint of their height, turned 90 degrees
+#   - "offcenter" in any legend picks the 6U-Offcenter footprint for a 6U key
+#   - "reversed" in any legend (or --reversed-stabilizers for every key) picks the -ReversedStabilizers variant
+#     where the keysize has stabilizers
+
+
+class LayoutError(Exception):
+    pass
+
+
+# Tokens recognized in key legends (case insensitive)
+OFFCENTER_HINT = "offcenter"
+REVERSED_HINT = "reversed"
+
+# Reference designator prefix of placed switches (SW1, SW2, ...)
+REFERENCE_PREFIX = "SW"
+
+# Pad shapes treated as circles by the overlap check; every other shape is checked as its rectangle
+CIRCULAR_PAD_SHAPES = ("circle",)
+
+# Footprint file header nodes dropped when embedding footprints in a board
+LIBRARY_ONLY_NODE_NAMES = ("version", "generator", "generator_version")
+
+# Grid cell size for the overlap check, about the size of a switch hole
+OVERLAP_CELL_SIZE = 5.0
+
+# Layers of the generated board (KiCad 8 defaults for a two-layer board)
+BOARD_LAYERS = [
+    ["0", '"F.Cu"', "signal"], ["31", '"B.Cu"', "signal"],
+    ["32", '"B.Adhes"', "user", '"B.Adhesive"'], ["33", '"F.Adhes"', "user", '"F.Adhesive"'],
+    ["34", '"B.Paste"', "user"], ["35", '"F.Paste"', "user"],
+    ["36", '"B.SilkS"', "user", '"B.Silkscreen"'], ["37", '"F.SilkS"', "user", '"F.Silkscreen"'],
+    ["38", '"B.Mask"', "user"], ["39", '"F.Mask"', "user"],
+    ["40", '"Dwgs.User"', "user", '"User.Drawings"'], ["41", '"Cmts.User"', "user", '"User.Comments"'],
+    ["42", '"Eco1.User"', "user", '"User.Eco1"'], ["43", '"Eco2.User"', "user", '"User.Eco2"'],
+    ["44", '"Edge.Cuts"', "user"], ["45", '"Margin"', "user"],
+    ["46", '"B.CrtYd"', "user", '"B.Courtyard"'], ["47", '"F.CrtYd"', "user", '"F.Courtyard"'],
+    ["48", '"B.Fab"', "user"], ["49", '"F.Fab"', "user"],
+]
+
+
+# Keys of a KLE layout, following KLE's own serializer rules: properties apply to the next key, x/y are
+# relative offsets, w/h/x2/y2/w2/h2 reset after each key, and r/rx/ry persist and start a new rotated cluster
+# Returns a list of
+# {
+#     "x", "y", "width", "height": Primary rectangle in key units (top left corner),
+#     "x2", "y2", "width2", "height2": Secondary rectangle relative to the primary one (ISO and stepped keys),
+#     "rotation", "rotation_x", "rotation_y": Clockwise rotation in degrees around a point in key units,
+#     "labels": Legend lines
+# }
+def parse_layout(layout_data):
+    if not isinstance(layout_data, list):
+        raise LayoutError("Layout must be a JSON array of rows")
+
+    keys = []
+    current = {"x": 0, "y": 0, "width": 1, "height": 1, "x2": 0, "y2": 0, "width2": 0, "height2": 0,
+               "rotation": 0, "rotation_x": 0, "rotation_y": 0}
+    cluster_x, cluster_y = 0, 0
+    for row_index, row in enumerate(layout_data):
+        if isinstance(row, dict):
+            # Keyboard metadata (name, author, ...)
+            continue
+        if not isinstance(row, list):
+            raise LayoutError(f"Row {row_index + 1} is not an array")
+        for item in row:
+            if isinstance(item, str):
+                keys.append({**current, "width2": current["width2"] or current["width"],
+                             "height2": current["height2"] or current["height"], "labels": item.split("\n")})
+                current["x"] += current["width"]
+                current.update(width=1, height=1, x2=0, y2=0, width2=0, height2=0)
+            elif isinstance(item, dict):
+                if "r" in item:
+                    current["rotation"] = item["r"]
+                if "rx" in item:
+                    current["rotation_x"] = cluster_x = item["rx"]
+                    current["x"], current["y"] = cluster_x, cluster_y
+                if "ry" in item:
+                    current["rotation_y"] = cluster_y = item["ry"]
+                    current["x"], current["y"] = cluster_x, cluster_y
+                current["x"] += item.get("x", 0)
+                current["y"] += item.get("y", 0)
+                if "w" in item:
+                    current["width"] = current["width2"] = item["w"]
+                if "h" in item:
+                    current["height"] = current["height2"] = item["h"]
+                for short_name, name in (("x2", "x2"), ("y2", "y2"), ("w2", "width2"), ("h2", "height2")):
+                    if short_name in item:
+                        current[name] = item[short_name]
+            else:
+                raise LayoutError(f"Unexpected item in row {row_index + 1}: {item!r}")
+        current["y"] += 1
+        current["x"] = current["rotation_x"]
+    return keys
+
+
+# Keysize (number or special shape ID), extra footprint rotation and switch position (relative to the
+# primary rectangle's top left corner, in key units) of a key
+def key_shape(key):
+    width, height, width2, height2 = key["width"], key["height"], key["width2"], key["height2"]
+    hints = " ".join(key["labels"]).lower()
+    if (width, height, width2, height2, key["x2"], key["y2"]) == (1.25, 2, 1.5, 1, -0.25, 0):
+        return "ISO", 0, (0.625, 1)
+    if (width, height, width2, height2, key["x2"], key["y2"]) == (2, 1.25, 1, 1.5, 0, 0):
+        return "ISO-Rotated", 0, (1, 0.625)
+    if (width, height) == (1, 2):
+        return "2U-Vertical", 0, (0.5, 1)
+    if width == 6 and height == 1 and OFFCENTER_HINT in hints:
+        return "6U-Offcenter", 0, (3.5, 0.5)
+    if height > width:
+        return height, 90, (width / 2, height / 2)
+    return width, 0, (width / 2, height / 2)
+
+
+# Footprint and position of every key
+# family_def: Resolved family definition (see generate_all.resolve_families)
+# reversed_stabilizers: Use -ReversedStabilizers variants for every key that has them
+# Returns a list of {"reference", "keysize_def", "name", "x", "y", "angle", "labels"} (mm and KiCad degrees)
+def place_keys(keys, family_def, reversed_stabilizers=False):
+    keysize_defs = {keysize_name(keysize_def.get("keysize")): keysize_def
+                    for keysize_def in get_keysizes(family_def["keysizes_type"])}
+    unit_width, unit_height = family_def["unit_width"], family_def["unit_height"]
+
+    placements = []
+    for index, key in enumerate(keys):
+        keysize, extra_angle, (switch_x, switch_y) = key_shape(key)
+        keysize_def = keysizes_lookup(keysize_defs, keysize, family_def, index)
+
+        reversed_variant = reversed_stabilizers or REVERSED_HINT in " ".join(key["labels"]).lower()
+        variant = "-ReversedStabilizers" if reversed_variant and keysize_def.get("stabilizer_dist") else ""
+
+        # KLE rotates clockwise around (rx, ry); KiCad angles are counterclockwise
+        x, y = rotate_clockwise(key["x"] + switch_x, key["y"] + switch_y, key["rotation_x"], key["rotation_y"],
+                                key["rotation"])
+        angle = (extra_angle - key["rotation"]) % 360
+        placements.append({
+            "reference": f"{REFERENCE_PREFIX}{index + 1}",
+            "keysize_def": keysize_def,
+            "name": f"{family_def['family_name']}-{keysize_name(keysize_def.get('keysize'))}{variant}",
+            "x": round(x * unit_width, 6),
+            "y": round(y * unit_height, 6),
+            "angle": round(angle, 6),
+            "labels": key["labels"],
+        })
+    return placements
+
+
+def keysizes_lookup(keysize_defs, keysize, family_def, index):
+    keysize_def = keysize_defs.get(keysize_name(keysize))
+    if keysize_def is None:
+        raise LayoutError(f"Key {index + 1}: no {keysize_name(keysize)} footprint in {family_def['family_name']} "
+                          f"(available: {', '.join(keysize_defs)})")
+    return keysize_def
+
+
+def rotate_clockwise(x, y, origin_x, origin_y, angle):
+    if not angle:
+        return x, y
+    radians = math.radians(angle)
+    cos, sin = math.cos(radians), math.sin(radians)
+    delta_x, delta_y = x - origin_x, y - origin_y
+    return origin_x + delta_x * cos - delta_y * sin, origin_y + delta_x * sin + delta_y * cos
+
+
+# Footprint tree of every distinct footprint the placements use, by name
+def create_footprints(placements, family_def):
+    footprints_generator = FootprintsGenerator(
+        input_file=family_def["template"], output_dir=None, keysizes_type=family_def["keysizes_type"],
+        family_name=family_def["family_name"], unit_width=family_def["unit_width"],
+        unit_height=family_def["unit_height"], debug=False, deterministic=True)
+    footprints = {}
+    keysize_defs = {}
+    for placement in placements:
+        keysize_defs[keysize_name(placement["keysize_def"].get("keysize"))] = placement["keysize_def"]
+    for name, footprint in footprints_generator.iter_footprints(keysize_defs=keysize_defs.values(), as_tree=True):
+        footprints[name] = footprint
+    return footprints
+
+
+# Holes and pads of a footprint as spatial shapes in footprint coordinates
+def footprint_shapes(footprint):
+    shapes = []
+    for pad in footprint.children("pad"):
+        position = pad.child("at")
+        size = pad.child("size")
+        if position is None or size is None:
+            continue
+        x, y = position.number(0), position.number(1)
+        width, height = size.number(0), size.number(1)
+        pad_angle = position.number(2) if len(position) > 3 else 0
+        shape_name = pad[3] if len(pad) > 3 and isinstance(pad[3], str) else ""
+        if shape_name in CIRCULAR_PAD_SHAPES:
+            shapes.append(circle(x, y, max(width, height) / 2))
+        else:
+            shapes.append(rectangle(x, y, width, height, pad_angle))
+    return shapes
+
+
+# Holes and pads of different keys that overlap (or come closer than clearance)
+# Returns a list of (reference, reference, distance in mm) per conflicting key pair, closest first
+def find_overlaps(placements, footprints, clearance=0.0):
+    local_shapes = {name: footprint_shapes(footprint) for name, footprint in footprints.items()}
+
+    shapes = []
+    owners = []
+    grid_index = GridIndex(cell_size=OVERLAP_CELL_SIZE, margin=clearance)
+    for placement_index, placement in enumerate(placements):
+        for shape in local_shapes[placement["name"]]:
+            board_shape = transform_shape(shape, placement["x"], placement["y"], placement["angle"])
+            grid_index.insert(len(shapes), shape_bounds(board_shape))
+            shapes.append(board_shape)
+            owners.append(placement_index)
+
+    conflicts = {}
+    for shape_a, shape_b in grid_index.candidate_pairs():
+        owner_a, owner_b = owners[shape_a], owners[shape_b]
+        if owner_a == owner_b:
+            continue
+        distance = shape_distance(shapes[shape_a], shapes[shape_b])
+        if distance >= clearance and distance > 0:
+            continue
+        key_pair = (min(owner_a, owner_b), max(owner_a, owner_b))
+        conflicts[key_pair] = min(distance, conflicts.get(key_pair, distance))
+    return sorted(((placements[owner_a]["reference"], placements[owner_b]["reference"], distance)
+                   for (owner_a, owner_b), distance in conflicts.items()), key=lambda conflict: conflict[2])
+
+
+# Board footprint: the library footprint with its board position (and without its file header), a unique reference, absolute text and pad
+# angles (KiCad stores those including the footprint rotation) and UUIDs unique to this placement
+def place_footprint(footprint, placement, library_name):
+    angle = placement["angle"]
+    placed_footprint = copy.deepcopy(footprint)
+    # Version and generator only belong to standalone footprint files
+    placed_footprint[:] = [element for element in placed_footprint
+                           if not (isinstance(element, list) and element and element[0] in LIBRARY_ONLY_NODE_NAMES)]
+    placed_footprint[1] = f'"{library_name}:{placement["name"]}"'
+    at = ["at", format_coordinate(placement["x"]), format_coordinate(placement["y"])]
+    if angle:
+        at.append(format_coordinate(angle))
+    layer_index = next((index for index, element in enumerate(placed_footprint)
+                        if isinstance(element, list) and element and element[0] == "layer"), 1)
+    placed_footprint.insert(layer_index + 1, at)
+
+    element_index = 0
+    stack = [placed_footprint]
+    while stack:
+        node = stack.pop()
+        for index, element in enumerate(node):
+            if not isinstance(element, list) or not element:
+                continue
+            if element[0] in ("uuid", "tstamp"):
+                element_uuid = uuid.uuid5(GENERATOR_UUID_NAMESPACE,
+                                          f"placement/{placement['reference']}/{element_index}")
+                node[index] = [element[0], f'"{element_uuid}"' if element[0] == "uuid" else str(element_uuid)]
+                element_index += 1
+            elif element[0] == "property" and element[1:3] == ['"Reference"', '"REF**"']:
+                element[2] = f'"{placement["reference"]}"'
+                stack.append(element)
+            elif element[0] == "at" and angle and node[0] in ("pad", "property") and len(element) >= 3:
+                element_angle = float(element[3]) if len(element) > 3 else 0
+                node[index] = element[:3] + [format_coordinate((element_angle + angle) % 360)]
+            else:
+                stack.append(element)
+    return placed_footprint
+
+
+def format_coordinate(value):
+    return f"{value:.6f}".rstrip("0").rstrip(".")
+
+
+# Writes a KiCad 8 board holding every placed footprint
+def write_board(board_path, placements, footprints, library_name):
+    board = ["kicad_pcb", ["version", "20240108"], ["generator", '"mx_v2_placement"'],
+             ["generator_version", '"8.0"'], ["general", ["thickness", "1.6"], ["legacy_teardrops", "no"]],
+             ["paper", '"A4"'], ["layers"] + BOARD_LAYERS, ["net", "0", '""']]
+    for placement in placements:
+        board.append(place_footprint(footprints[placement["name"]], placement, library_name))
+    with board_path.open(mode='w') as board_file:
+        FootprintEncoder(footprint=board, debug=False, output_file=board_file)
+
+
+# Writes the placements as CSV (reference, footprint, x, y, angle, labels) or JSON, by file extension
+def write_placements(placements_path, placements, library_name):
+    rows = [{"reference": placement["reference"], "footprint": f"{library_name}:{placement['name']}",
+             "x": placement["x"], "y": placement["y"], "angle": placement["angle"],
+             "labels": " ".join(label for label in placement["labels"] if label)}
+            for placement in placements]
+    if placements_path.suffix == ".csv":
+        with placements_path.open(mode='w', newline="") as placements_file:
+            writer = csv.DictWriter(placements_file, fieldnames=list(rows[0]) if rows else ["reference"])
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        placements_path.write_text(json.dumps(rows, indent=4))
+
+
+if __name__ == '__main__':
+
+    # Parse args
+
+    description_cmd = "Places generated footprints according to a keyboard-layout-editor layout and checks neighbouring\n" \
+                      "keys for overlapping holes and pads."
+    arg_parser = argparse.ArgumentParser(
+        description=description_cmd, formatter_class=argparse.RawTextHelpFormatter)
+
+    description_layout = "Specify the layout file (keyboard-layout-editor raw data, downloaded as JSON)."
+    arg_parser.add_argument("-l", "--layout", dest="layout", help=description_layout, required=True)
+
+    description_output = "Specify the output file: a .kicad_pcb board, or a .csv/.json placement list."
+    arg_parser.add_argument("-o", "--output", dest="output", help=description_output, required=True)
+
+    description_family = "Optional: Footprint family to place (as named in the manifest). Defaults to MX-Hotswap."
+    arg_parser.add_argument("-f", "--family", dest="family", help=description_family, default="MX-Hotswap")
+
+    description_manifest = "Optional: JSON manifest file with the same schema as families.py. Defaults to families.FAMILIES."
+    arg_parser.add_argument("-m", "--manifest", dest="manifest", help=description_manifest)
+
+    description_root = "Optional: Directory that manifest paths are relative to. Defaults to the repository root."
+    arg_parser.add_argument("-r", "--root", dest="root", help=description_root, default=str(REPO_ROOT))
+
+    description_reversed = "Optional: Use the -ReversedStabilizers variant for every key with stabilizers."
+    arg_parser.add_argument("--reversed-stabilizers", dest="reversed_stabilizers",
+                            help=description_reversed, action="store_true")
+
+    description_clearance = "Optional: Minimum distance in mm between holes and pads of different keys. Defaults to 0 (overlaps only)."
+    arg_parser.add_argument("-c", "--clearance", dest="clearance", help=description_clearance, type=float, default=0.0)
+
+    args = arg_parser.parse_args()
+
+    # Sanity check args
+
+    layout_path = Path(args.layout)
+    if not layout_path.is_file():
+        print("Layout file invalid", file=sys.stderr)
+        sys.exit(1)
+
+    output_path = Path(args.output)
+    if output_path.suffix not in (".kicad_pcb", ".csv", ".json"):
+        print("Output file must be a .kicad_pcb, .csv or .json file", file=sys.stderr)
+        sys.exit(1)
+
+    root = Path(args.root)
+    family_defs = resolve_families(load_manifest(Path(args.manifest)) if args.manifest else families.FAMILIES, root)
+    family_def = next((family_def for family_def in family_defs if family_def["family_name"] == args.family), None)
+    if family_def is None:
+        print(f"Unknown family: {args.family}", file=sys.stderr)
+        sys.exit(1)
+
+    # Place keys
+
+    try:
+        with layout_path.open() as layout_file:
+            keys = parse_layout(json.load(layout_file))
+        placements = place_keys(keys, family_def, reversed_stabilizers=args.reversed_stabilizers)
+        footprints = create_footprints(placements, family_def)
+    except (LayoutError, ValueError) as e:
+        print(f"Layout invalid: {e}", file=sys.stderr)
+        sys.exit(1)
+    except FootprintParseError as e:
+        print(f"Footprint parsing failed: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    library_name = family_def["output_dir"].stem
+    if output_path.suffix == ".kicad_pcb":
+        write_board(output_path, placements, footprints, library_name)
+    else:
+        write_placements(output_path, placements, library_name)
+
+    # Check for overlaps
+
+    overlaps = find_overlaps(placements, footprints, clearance=args.clearance)
+    for reference_a, reference_b, distance in overlaps:
+        print(f"Overlap: {reference_a} and {reference_b} ({distance:.3f}mm apart)", file=sys.stderr)
+    if overlaps:
+        sys.exit(1)
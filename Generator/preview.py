@@ -0,0 +1,364 @@
+import argparse
+import math
+import sys
+from html import escape
+from pathlib import Path
+import families
+from footprint_tree import find_child, unquote
+from generate import FootprintParseError, FootprintParser, FootprintsGenerator
+from generate_all import REPO_ROOT, load_manifest, resolve_families
+from geometry import format_number
+from instrumentation import configure_logging
+
+
+# SVG previews of footprints, drawn straight from parsed footprint trees (no KiCad needed)
+#   - render_footprint: one footprint -> SVG elements in footprint coordinates (mm) and their bounds
+#   - write_footprint_svg: a single footprint per file
+#   - write_contact_sheet: every footprint of a family on one sheet, labelled, at the same scale
+# Every file shares STYLE_SHEET, so layers and pad types look the same everywhere
+#
+# Drawn: fp_line, fp_rect, fp_circle, fp_arc and fp_poly on the layers in LAYER_CLASSES, pads (by type),
+# drills and non-plated holes; text is left out
+
+# CSS classes of the drawn graphic layers (other layers are skipped)
+LAYER_CLASSES = {
+    "Dwgs.User": "outline",
+    "Cmts.User": "comment",
+    "F.CrtYd": "courtyard",
+    "B.CrtYd": "courtyard",
+    "F.SilkS": "silkscreen",
+    "F.Silkscreen": "silkscreen",
+    "B.SilkS": "silkscreen-back",
+    "B.Silkscreen": "silkscreen-back",
+    "F.Fab": "fab",
+    "B.Fab": "fab",
+    "Edge.Cuts": "edge",
+}
+
+STYLE_SHEET = """
+svg { background: #001023; }
+.outline, .comment, .courtyard, .silkscreen, .silkscreen-back, .fab, .edge { fill: none; stroke-linecap: round; }
+.outline { stroke: #c2c2c2; }
+.comment { stroke: #5994dc; }
+.courtyard { stroke: #ff26e2; }
+.silkscreen { stroke: #f2eda1; }
+.silkscreen-back { stroke: #e8b2a7; }
+.fab { stroke: #afafaf; }
+.edge { stroke: #d0d2cd; }
+.pad-front { fill: #c83434; fill-opacity: 0.8; }
+.pad-back { fill: #4d7fc4; fill-opacity: 0.8; }
+.pad-through { fill: #c2a23b; fill-opacity: 0.85; }
+.drill { fill: #e3b72e; fill-opacity: 0.35; stroke: #1a1a1a; stroke-width: 0.05; }
+.hole { fill: #001023; stroke: #ffffff; stroke-width: 0.1; }
+.label { fill: #ffffff; font: 2.5px sans-serif; text-anchor: middle; }
+""".strip()
+
+# Stroke width of graphics without one, in mm
+DEFAULT_STROKE_WIDTH = 0.12
+
+# Space around each footprint, in mm
+MARGIN = 2.0
+
+# Contact sheets wrap to a new row of footprints past this width, in mm
+SHEET_ROW_WIDTH = 420.0
+
+# Height of the label under each footprint on contact sheets, in mm
+LABEL_HEIGHT = 4.0
+
+
+def point(element, name):
+    child = find_child(element, name)
+    return float(child[1]), float(child[2])
+
+
+def stroke_width(element):
+    stroke = find_child(element, "stroke")
+    width = find_child(stroke if stroke is not None else element, "width")
+    return float(width[1]) if width is not None else DEFAULT_STROKE_WIDTH
+
+
+# Circle through the start, mid and end points of an arc as an SVG path
+def arc_path(start, mid, end):
+    (start_x, start_y), (mid_x, mid_y), (end_x, end_y) = start, mid, end
+    determinant = 2 * (start_x * (mid_y - end_y) + mid_x * (end_y - start_y) + end_x * (start_y - mid_y))
+    if abs(determinant) < 1e-12:
+        return f"M {format_number(start_x)} {format_number(start_y)} L {format_number(end_x)} {format_number(end_y)}"
+    start_squared, mid_squared, end_squared = start_x ** 2 + start_y ** 2, mid_x ** 2 + mid_y ** 2, end_x ** 2 + end_y ** 2
+    center_x = (start_squared * (mid_y - end_y) + mid_squared * (end_y - start_y) + end_squared * (start_y - mid_y)) \
+        / determinant
+    center_y = (start_squared * (end_x - mid_x) + mid_squared * (start_x - end_x) + end_squared * (mid_x - start_x)) \
+        / determinant
+    radius = math.hypot(start_x - center_x, start_y - center_y)
+    # Clockwise on screen (y down) when start -> mid -> end turns right
+    sweep = 1 if (mid_x - start_x) * (end_y - mid_y) - (mid_y - start_y) * (end_x - mid_x) > 0 else 0
+    # Over 180 degrees when the center lies on the same side of the chord as the mid point
+    chord_side_mid = (end_x - start_x) * (mid_y - start_y) - (end_y - start_y) * (mid_x - start_x)
+    chord_side_center = (end_x - start_x) * (center_y - start_y) - (end_y - start_y) * (center_x - start_x)
+    large_arc = 1 if chord_side_mid * chord_side_center > 0 else 0
+    return f"M {format_number(start_x)} {format_number(start_y)} A {format_number(radius)} {format_number(radius)} " \
+           f"0 {large_arc} {sweep} {format_number(end_x)} {format_number(end_y)}"
+
+
+# Rounded rectangle centered on (x, y), turned by angle (KiCad angles are counterclockwise)
+def rounded_rect(css_class, x, y, width, height, corner_radius, angle):
+    rect = f'<rect class="{css_class}" x="{format_number(x - width / 2)}" y="{format_number(y - height / 2)}" ' \
+           f'width="{format_number(width)}" height="{format_number(height)}"'
+    if corner_radius:
+        rect += f' rx="{format_number(corner_radius)}"'
+    if angle:
+        rect += f' transform="rotate({format_number(-angle)} {format_number(x)} {format_number(y)})"'
+    return rect + "/>"
+
+
+def pad_class(pad):
+    if pad[2] == "smd":
+        layers = find_child(pad, "layers")
+        if layers is not None and any(unquote(layer).startswith("B.") for layer in layers[1:]):
+            return "pad-back"
+        return "pad-front"
+    return "pad-through"
+
+
+# SVG elements of one footprint (in footprint coordinates) and their bounds (min x, min y, max x, max y)
+def render_footprint(footprint):
+    elements = []
+    xs = []
+    ys = []
+
+    def extend_bounds(x, y, reach=0.0):
+        xs.extend((x - reach, x + reach))
+        ys.extend((y - reach, y + reach))
+
+    for element in footprint:
+        if not isinstance(element, list) or not element:
+            continue
+        name = element[0]
+        if name in ("fp_line", "fp_rect", "fp_circle", "fp_arc", "fp_poly"):
+            layer = find_child(element, "layer")
+            css_class = LAYER_CLASSES.get(unquote(layer[1])) if layer is not None else None
+            if css_class is None:
+                continue
+            width = stroke_width(element)
+            style = f'class="{css_class}" stroke-width="{format_number(width)}"'
+            if name == "fp_line":
+                (start_x, start_y), (end_x, end_y) = point(element, "start"), point(element, "end")
+                elements.append(f'<line {style} x1="{format_number(start_x)}" y1="{format_number(start_y)}" '
+                                f'x2="{format_number(end_x)}" y2="{format_number(end_y)}"/>')
+                extend_bounds(start_x, start_y, width / 2)
+                extend_bounds(end_x, end_y, width / 2)
+            elif name == "fp_rect":
+                (start_x, start_y), (end_x, end_y) = point(element, "start"), point(element, "end")
+                elements.append(f'<rect {style} x="{format_number(min(start_x, end_x))}" '
+                                f'y="{format_number(min(start_y, end_y))}" width="{format_number(abs(end_x - start_x))}" '
+                                f'height="{format_number(abs(end_y - start_y))}"/>')
+                extend_bounds(start_x, start_y, width / 2)
+                extend_bounds(end_x, end_y, width / 2)
+            elif name == "fp_circle":
+                (center_x, center_y), (end_x, end_y) = point(element, "center"), point(element, "end")
+                radius = math.hypot(end_x - center_x, end_y - center_y)
+                elements.append(f'<circle {style} cx="{format_number(center_x)}" cy="{format_number(center_y)}" '
+                                f'r="{format_number(radius)}"/>')
+                extend_bounds(center_x, center_y, radius + width / 2)
+            elif name == "fp_arc":
+                start, mid, end = point(element, "start"), point(element, "mid"), point(element, "end")
+                elements.append(f'<path {style} d="{arc_path(start, mid, end)}"/>')
+                for x, y in (start, mid, end):
+                    extend_bounds(x, y, width / 2)
+            else:
+                pts = find_child(element, "pts")
+                points = [(float(xy[1]), float(xy[2])) for xy in pts[1:] if isinstance(xy, list) and xy[0] == "xy"]
+                elements.append(f'<polygon {style} points="'
+                                + " ".join(f"{format_number(x)},{format_number(y)}" for x, y in points) + '"/>')
+                for x, y in points:
+                    extend_bounds(x, y, width / 2)
+
+        elif name == "pad":
+            at = find_child(element, "at")
+            size = find_child(element, "size")
+            if at is None or size is None:
+                continue
+            x, y = float(at[1]), float(at[2])
+            angle = float(at[3]) if len(at) > 3 else 0.0
+            width, height = float(size[1]), float(size[2])
+            shape = element[3]
+            extend_bounds(x, y, max(width, height) / 2)
+
+            if element[2] != "np_thru_hole":
+                css_class = pad_class(element)
+                if shape == "circle":
+                    elements.append(f'<circle class="{css_class}" cx="{format_number(x)}" cy="{format_number(y)}" '
+                                    f'r="{format_number(width / 2)}"/>')
+                else:
+                    corner_radius = 0.0
+                    if shape == "oval":
+                        corner_radius = min(width, height) / 2
+                    elif shape == "roundrect":
+                        ratio = find_child(element, "roundrect_rratio")
+                        corner_radius = min(width, height) * (float(ratio[1]) if ratio is not None else 0.25)
+                    elements.append(rounded_rect(css_class, x, y, width, height, corner_radius, angle))
+
+            drill = find_child(element, "drill")
+            if drill is not None:
+                drill_sizes = [float(atom) for atom in drill[1:] if isinstance(atom, str) and atom != "oval"]
+                drill_width = drill_sizes[0]
+                drill_height = drill_sizes[1] if len(drill_sizes) > 1 else drill_width
+                offset = find_child(drill, "offset")
+                drill_x, drill_y = x, y
+                if offset is not None:
+                    radians = math.radians(angle)
+                    offset_x, offset_y = float(offset[1]), float(offset[2])
+                    drill_x += offset_x * math.cos(radians) + offset_y * math.sin(radians)
+                    drill_y += -offset_x * math.sin(radians) + offset_y * math.cos(radians)
+                css_class = "hole" if element[2] == "np_thru_hole" else "drill"
+                elements.append(rounded_rect(css_class, drill_x, drill_y, drill_width, drill_height,
+                                             min(drill_width, drill_height) / 2, angle))
+
+    if not xs:
+        return elements, (0.0, 0.0, 0.0, 0.0)
+    return elements, (min(xs), min(ys), max(xs), max(ys))
+
+
+def svg_document(width, height, view_box, body):
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{format_number(width)}mm" '
+            f'height="{format_number(height)}mm" viewBox="{view_box}">\n'
+            f'<style>\n{STYLE_SHEET}\n</style>\n' + "\n".join(body) + "\n</svg>\n")
+
+
+# Single footprint, with MARGIN around it
+def footprint_svg(rendered):
+    elements, (min_x, min_y, max_x, max_y) = rendered
+    width, height = max_x - min_x + 2 * MARGIN, max_y - min_y + 2 * MARGIN
+    view_box = f"{format_number(min_x - MARGIN)} {format_number(min_y - MARGIN)} " \
+               f"{format_number(width)} {format_number(height)}"
+    return svg_document(width, height, view_box, elements)
+
+
+# Every footprint of rendered ([(name, (elements, bounds)), ...]) on one sheet, in rows, labelled with its name
+def contact_sheet_svg(rendered):
+    body = []
+    cursor_x = cursor_y = 0.0
+    row_height = 0.0
+    sheet_width = 0.0
+    for name, (elements, (min_x, min_y, max_x, max_y)) in rendered:
+        tile_width = max_x - min_x + 2 * MARGIN
+        tile_height = max_y - min_y + 2 * MARGIN + LABEL_HEIGHT
+        if cursor_x and cursor_x + tile_width > SHEET_ROW_WIDTH:
+            cursor_x = 0.0
+            cursor_y += row_height
+            row_height = 0.0
+        body.append(f'<g transform="translate({format_number(cursor_x + MARGIN - min_x)} '
+                    f'{format_number(cursor_y + MARGIN - min_y)})">')
+        body.extend(elements)
+        body.append(f'<text class="label" x="{format_number((min_x + max_x) / 2)}" '
+                    f'y="{format_number(max_y + LABEL_HEIGHT)}">{escape(name)}</text>')
+        body.append("</g>")
+        cursor_x += tile_width
+        row_height = max(row_height, tile_height)
+        sheet_width = max(sheet_width, cursor_x)
+    sheet_height = cursor_y + row_height
+    return svg_document(sheet_width, sheet_height,
+                        f"0 0 {format_number(sheet_width)} {format_number(sheet_height)}", body)
+
+
+# Renders every footprint once and writes the contact sheet and (optionally) one file per footprint
+# footprints: Iterable of (footprint name, footprint tree)
+# Returns the written paths
+def write_previews(footprints, sheet_path=None, footprint_dir=None):
+    rendered = [(name, render_footprint(footprint)) for name, footprint in footprints]
+    written_paths = []
+    if footprint_dir is not None:
+        footprint_dir.mkdir(parents=True, exist_ok=True)
+        for name, rendered_footprint in rendered:
+            footprint_path = footprint_dir / f"{name}.svg"
+            footprint_path.write_text(footprint_svg(rendered_footprint))
+            written_paths.append(footprint_path)
+    if sheet_path is not None:
+        sheet_path.parent.mkdir(parents=True, exist_ok=True)
+        sheet_path.write_text(contact_sheet_svg(rendered))
+        written_paths.append(sheet_path)
+    return written_paths
+
+
+# Generated footprints of a family as trees, in keysize table order (nothing is written)
+def family_footprints(family_def):
+    footprints_generator = FootprintsGenerator(
+        input_file=family_def["template"], output_dir=None, keysizes_type=family_def["keysizes_type"],
+        family_name=family_def["family_name"], unit_width=family_def["unit_width"],
+        unit_height=family_def["unit_height"], debug=False, deterministic=True)
+    return footprints_generator.iter_footprints(as_tree=True)
+
+
+# Footprints of an existing library folder, by file name
+def library_footprints(library_dir):
+    for footprint_path in sorted(library_dir.glob("*.kicad_mod")):
+        yield footprint_path.stem, FootprintParser(footprint_path.read_bytes()).processed_list
+
+
+if __name__ == '__main__':
+
+    # Parse args
+
+    description_cmd = "Renders SVG previews of generated footprints: a contact sheet per family and, optionally,\n" \
+                      "one file per footprint."
+    arg_parser = argparse.ArgumentParser(
+        description=description_cmd, formatter_class=argparse.RawTextHelpFormatter)
+
+    description_output = "Specify the output directory (contact sheets go to <family>.svg, single footprints to <family>/)."
+    arg_parser.add_argument("-o", "--output-dir", dest="output_dir", help=description_output, required=True)
+
+    description_manifest = "Optional: JSON manifest file with the same schema as families.py. Defaults to families.FAMILIES."
+    arg_parser.add_argument("-m", "--manifest", dest="manifest", help=description_manifest)
+
+    description_root = "Optional: Directory that manifest paths are relative to. Defaults to the repository root."
+    arg_parser.add_argument("-r", "--root", dest="root", help=description_root, default=str(REPO_ROOT))
+
+    description_family = "Optional: Only render these families (as named in the manifest)."
+    arg_parser.add_argument("-f", "--family", dest="family", help=description_family, nargs="+")
+
+    description_library = "Optional: Render these existing .pretty folders instead of generating families (i.e. Switch_Misc.pretty)."
+    arg_parser.add_argument("-l", "--library", dest="library", help=description_library, nargs="+")
+
+    description_per_footprint = "Optional: Also write one SVG file per footprint."
+    arg_parser.add_argument("-p", "--per-footprint", dest="per_footprint",
+                            help=description_per_footprint, action="store_true")
+
+    description_debug = "Optional: Enable debug mode."
+    arg_parser.add_argument("-d", "--debug", dest="debug",
+                            help=description_debug, action="store_true")
+
+    args = arg_parser.parse_args()
+    configure_logging(args.debug)
+
+    # Sanity check args
+
+    output_dir = Path(args.output_dir)
+    sources = []
+    family_defs = []
+    if args.library:
+        for library in args.library:
+            library_dir = Path(library)
+            if not library_dir.is_dir():
+                print(f"Library dir invalid: {library_dir}", file=sys.stderr)
+                sys.exit(1)
+            sources.append((library_dir.stem, library_footprints(library_dir)))
+    else:
+        family_defs = resolve_families(
+            load_manifest(Path(args.manifest)) if args.manifest else families.FAMILIES, Path(args.root))
+        if args.family:
+            unknown_families = set(args.family) - {family_def["family_name"] for family_def in family_defs}
+            if unknown_families:
+                print(f"Unknown families: {', '.join(sorted(unknown_families))}", file=sys.stderr)
+                sys.exit(1)
+            family_defs = [family_def for family_def in family_defs if family_def["family_name"] in args.family]
+
+    # Render previews
+
+    try:
+        # Templates are parsed as soon as a family's generator is created
+        sources += [(family_def["family_name"], family_footprints(family_def)) for family_def in family_defs]
+        for source_name, footprints in sources:
+            write_previews(footprints, sheet_path=output_dir / f"{source_name}.svg",
+                           footprint_dir=output_dir / source_name if args.per_footprint else None)
+    except FootprintParseError as e:
+        print(f"Footprint parsing failed: {e}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,266 @@
+import argparse
+import json
+import math
+import sys
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+import families
+from generate import (CompiledTemplate, FootprintParseError, FootprintsGenerator, FragmentCache, keysize_name,
+                      parse_footprint_file)
+from generate_all import REPO_ROOT, load_manifest, resolve_families
+
+
+class FootprintServer:
+    # Generates footprints of any size on demand for the families of a manifest (families.py by default)
+    # Parsed templates stay warm per family and rendered footprints are kept in a bounded LRU cache
+    # Thread-safe, so a single instance can back the HTTP handler below
+    #
+    # Example:
+    #   server = FootprintServer(resolve_families(families.FAMILIES, REPO_ROOT))
+    #   name, data = server.get_footprint("MX-Hotswap", 1.375)
+    #   name, data = server.get_footprint("MX-Hotswap", 2.5, stabilizer_dist=11.938, variant="-ReversedStabilizers")
+
+    def __init__(self, family_defs, cache_size=1024, debug=False):
+        self.family_defs = {family_def["family_name"]: family_def for family_def in family_defs}
+        self.cache_size = cache_size
+        self.debug = debug
+        self.cache = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.generators = {}
+        self.fragment_cache = FragmentCache()
+        self.lock = threading.Lock()
+        # Held while a family's template is parsed, so first requests to other families are not blocked
+        self.family_locks = {family_name: threading.Lock() for family_name in self.family_defs}
+
+    # Returns (footprint name, encoded footprint bytes)
+    # size: Numerical keysize in units, or a special shape ID (i.e. ISO)
+    # variant: None or a stabilizer variant suffix (i.e. -ReversedStabilizers)
+    # unit_width/unit_height: Optional pitch overrides (default to the family's)
+    def get_footprint(self, family_name, size, stabilizer_dist=None, stabilizer_dist_right=None,
+                      stabilizer_vert=False, variant=None, unit_width=None, unit_height=None):
+        family_def = self.family_defs.get(family_name)
+        if family_def is None:
+            raise KeyError(f"Unknown family: {family_name}")
+        if isinstance(size, (int, float)):
+            check_positive("Size", size)
+        for value_name, value in (("stabilizer_dist", stabilizer_dist), ("stabilizer_dist_right", stabilizer_dist_right),
+                                  ("unit_width", unit_width), ("unit_height", unit_height)):
+            if value is not None:
+                check_positive(value_name, value)
+        unit_width = unit_width or family_def["unit_width"]
+        unit_height = unit_height or family_def["unit_height"]
+
+        cache_key = (family_name, size, stabilizer_dist, stabilizer_dist_right, bool(stabilizer_vert), variant,
+                     unit_width, unit_height)
+        with self.lock:
+            if cache_key in self.cache:
+                self.cache.move_to_end(cache_key)
+                self.cache_hits += 1
+                return self.cache[cache_key]
+            self.cache_misses += 1
+
+        keysize_def = {"keysize": size}
+        if stabilizer_dist:
+            keysize_def["stabilizer_dist"] = stabilizer_dist
+        if stabilizer_dist_right:
+            keysize_def["stabilizer_dist_right"] = stabilizer_dist_right
+        if stabilizer_vert:
+            keysize_def["stabilizer_vert"] = True
+
+        footprints_generator, compiled_template = self.get_generator(family_def)
+        rendered_variants = footprints_generator.render_keysize(
+            compiled_template=compiled_template, keysize_def=keysize_def, keysizes_type=family_def["keysizes_type"],
+            unit_width=unit_width, unit_height=unit_height)
+
+        key_variant_name = f"{keysize_name(size)}{variant or ''}"
+        for rendered_name, output_data in rendered_variants:
+            if rendered_name == key_variant_name:
+                result = (f"{family_name}-{rendered_name}", output_data)
+                break
+        else:
+            raise KeyError(f"Variant {variant} is not generated for {family_name} {keysize_name(size)}")
+
+        with self.lock:
+            self.cache[cache_key] = result
+            self.cache.move_to_end(cache_key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return result
+
+    # Parsed template and generator of a family, created on first use and kept warm afterwards
+    def get_generator(self, family_def):
+        family_name = family_def["family_name"]
+        with self.lock:
+            if family_name in self.generators:
+                return self.generators[family_name]
+        with self.family_locks[family_name]:
+            with self.lock:
+                if family_name in self.generators:
+                    return self.generators[family_name]
+            compiled_template = CompiledTemplate(parse_footprint_file(input_file=family_def["template"],
+                                                                      debug=self.debug))
+            footprints_generator = FootprintsGenerator(
+                input_file=None, output_dir=None, keysizes_type=family_def["keysizes_type"],
+                family_name=family_name, unit_width=family_def["unit_width"],
+                unit_height=family_def["unit_height"], debug=self.debug, footprint=compiled_template,
+                deterministic=True, fragment_cache=self.fragment_cache)
+            with self.lock:
+                self.generators[family_name] = (footprints_generator, compiled_template)
+            return footprints_generator, compiled_template
+
+    def stats(self):
+        with self.lock:
+            return {
+                "families": list(self.family_defs),
+                "warm_families": list(self.generators),
+                "cache_entries": len(self.cache),
+                "cache_size": self.cache_size,
+                "cache_hits": self.cache_hits,
+                "cache_misses": self.cache_misses,
+            }
+
+
+# HTTP front end
+#   GET /footprint?family=MX-Hotswap&size=1.375
+#   GET /footprint?family=MX-Hotswap&size=2.5&stabilizer_dist=11.938&variant=-ReversedStabilizers
+#   GET /footprint?family=Kailh-PG1353-Hotswap&size=ISO&unit_width=18&unit_height=17
+#   GET /stats
+class FootprintRequestHandler(BaseHTTPRequestHandler):
+    footprint_server = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/stats":
+            self.send_data(200, "application/json", json.dumps(self.footprint_server.stats()).encode())
+            return
+        if url.path != "/footprint":
+            self.send_data(404, "text/plain", b"Unknown path\n")
+            return
+
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if not query.get("family") or not query.get("size"):
+            self.send_data(400, "text/plain", b"family and size are required\n")
+            return
+        try:
+            name, output_data = self.footprint_server.get_footprint(
+                family_name=query["family"], size=parse_size(query["size"]),
+                stabilizer_dist=parse_optional_float(query.get("stabilizer_dist")),
+                stabilizer_dist_right=parse_optional_float(query.get("stabilizer_dist_right")),
+                stabilizer_vert=query.get("stabilizer_vert", "").lower() in ("1", "true", "yes"),
+                variant=query.get("variant") or None,
+                unit_width=parse_optional_float(query.get("unit_width")),
+                unit_height=parse_optional_float(query.get("unit_height")))
+        except KeyError as e:
+            self.send_data(404, "text/plain", f"{e.args[0]}\n".encode())
+            return
+        except ValueError as e:
+            self.send_data(400, "text/plain", f"{e}\n".encode())
+            return
+        except FootprintParseError as e:
+            self.send_data(500, "text/plain", f"Footprint parsing failed: {e}\n".encode())
+            return
+        self.send_data(200, "text/plain; charset=utf-8", output_data,
+                       {"Content-Disposition": f'attachment; filename="{name}.kicad_mod"'})
+
+    def send_data(self, status, content_type, data, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.footprint_server.debug:
+            super().log_message(format, *args)
+
+
+# Sizes, pitches and stabilizer distances must be finite and above zero
+def check_positive(value_name, value):
+    if not math.isfinite(value) or value <= 0:
+        raise ValueError(f"{value_name} must be a positive number: {value}")
+
+
+# Numerical sizes become floats (ints when whole, so 2 names the footprint 2U like the library does)
+def parse_size(size):
+    try:
+        value = float(size)
+    except ValueError:
+        return size
+    check_positive("Size", value)
+    return int(value) if value.is_integer() else value
+
+
+# Range checked by get_footprint, which names the offending parameter
+def parse_optional_float(value):
+    if value in (None, ""):
+        return None
+    return float(value)
+
+
+if __name__ == '__main__':
+
+    # Parse args
+
+    description_cmd = "Serves footprints of any size on demand over HTTP, generated from the families in a manifest."
+    arg_parser = argparse.ArgumentParser(
+        description=description_cmd, formatter_class=argparse.RawTextHelpFormatter)
+
+    description_manifest = "Optional: JSON manifest file with the same schema as families.py. Defaults to families.FAMILIES."
+    arg_parser.add_argument(
+        "-m", "--manifest", dest="manifest", help=description_manifest)
+
+    description_root = "Optional: Directory that manifest paths are relative to. Defaults to the repository root."
+    arg_parser.add_argument(
+        "-r", "--root", dest="root", help=description_root, default=str(REPO_ROOT))
+
+    description_host = "Optional: Address to listen on. Defaults to 127.0.0.1."
+    arg_parser.add_argument("--host", dest="host", help=description_host, default="127.0.0.1")
+
+    description_port = "Optional: Port to listen on. Defaults to 8725."
+    arg_parser.add_argument("-p", "--port", dest="port", help=description_port, type=int, default=8725)
+
+    description_cache_size = "Optional: Maximum number of rendered footprints kept in memory. Defaults to 1024."
+    arg_parser.add_argument("--cache-size", dest="cache_size", help=description_cache_size, type=int, default=1024)
+
+    description_debug = "Optional: Enable debug mode."
+    arg_parser.add_argument("-d", "--debug", dest="debug",
+                            help=description_debug, action="store_true")
+
+    args = arg_parser.parse_args()
+
+    # Sanity check args
+
+    root = Path(args.root)
+    if not root.is_dir():
+        print("Root dir invalid", file=sys.stderr)
+        sys.exit(1)
+
+    if args.manifest:
+        manifest_path = Path(args.manifest)
+        if not manifest_path.is_file():
+            print("Manifest file invalid", file=sys.stderr)
+            sys.exit(1)
+        family_defs = resolve_families(load_manifest(manifest_path), root)
+    else:
+        family_defs = resolve_families(families.FAMILIES, root)
+
+    if args.cache_size < 1:
+        print("Cache size invalid", file=sys.stderr)
+        sys.exit(1)
+
+    # Launch server
+
+    FootprintRequestHandler.footprint_server = FootprintServer(family_defs=family_defs, cache_size=args.cache_size,
+                                                               debug=args.debug)
+    http_server = ThreadingHTTPServer((args.host, args.port), FootprintRequestHandler)
+    print(f"Serving footprints on http://{args.host}:{args.port}/footprint", file=sys.stderr)
+    try:
+        http_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
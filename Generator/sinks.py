@@ -0,0 +1,177 @@
+import abc
+import hashlib
+import io
+import json
+import tarfile
+import zipfile
+from pathlib import Path
+from generate import GENERATOR_VERSION, write_if_changed
+
+
+# Name of the manifest stored next to the libraries in archives
+MANIFEST_NAME = "manifest.json"
+
+# Timestamp of every archive member, so identical output produces identical archives
+ARCHIVE_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+class OutputSink(abc.ABC):
+    # Destination of generated footprint files
+    # write(output_dir, file_name, data) stores one footprint and returns where it went
+    # Used as a context manager, the sink is closed when the block succeeds and aborted when it raises
+    #
+    # Example:
+    #   with ZipSink(Path("MX_V2.zip")) as output_sink:
+    #       build_all(family_defs, jobs=4, debug=False, deterministic=True, output_sink=output_sink)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    # digest: Optional sha256 hex digest of data, when the caller already computed it
+    @abc.abstractmethod
+    def write(self, output_dir, file_name, data, digest=None):
+        pass
+
+    # Finishes the output once everything has been written
+    def close(self):
+        pass
+
+    # Discards the output of a failed build, so no partial result is left behind
+    def abort(self):
+        pass
+
+
+class DirectorySink(OutputSink):
+    # Writes each footprint to output_dir / file_name (no manifest); the default sink of FootprintsGenerator
+    # deterministic: Leave files that already hold identical content untouched
+
+    def __init__(self, deterministic=False):
+        self.deterministic = deterministic
+
+    def write(self, output_dir, file_name, data, digest=None):
+        save_path = Path(output_dir) / file_name
+        if self.deterministic:
+            write_if_changed(save_path, data)
+        else:
+            save_path.write_bytes(data)
+        return save_path
+
+
+class ArchiveSink(OutputSink):
+    # Files every footprint as <library folder name>/<file name> (i.e. MX_Hotswap.pretty/MX-Hotswap-1U.kicad_mod)
+    # through write_member and lists them all in a manifest (MANIFEST_NAME) when closed
+
+    def __init__(self):
+        self.manifest = []
+
+    def write(self, output_dir, file_name, data, digest=None):
+        member_name = f"{Path(output_dir).name}/{file_name}"
+        self.write_member(member_name, data)
+        self.manifest.append({"path": member_name, "size": len(data),
+                              "sha256": digest or hashlib.sha256(data).hexdigest()})
+        return member_name
+
+    @abc.abstractmethod
+    def write_member(self, member_name, data):
+        pass
+
+    def close(self):
+        manifest = {"generator_version": GENERATOR_VERSION,
+                    "footprints": sorted(self.manifest, key=lambda entry: entry["path"])}
+        self.write_member(MANIFEST_NAME, json.dumps(manifest, indent=4).encode())
+
+
+class MemorySink(ArchiveSink):
+    # In-memory filesystem: files maps member names (including the manifest once closed) to their content
+    # writes keeps every write call in order along with its digest, so pool workers can hand their output
+    # (hashed in parallel) to the parent's sink without it being hashed again
+
+    def __init__(self):
+        super().__init__()
+        self.files = {}
+        self.writes = []
+
+    def write(self, output_dir, file_name, data, digest=None):
+        digest = digest or hashlib.sha256(data).hexdigest()
+        self.writes.append((output_dir, file_name, data, digest))
+        return super().write(output_dir, file_name, data, digest)
+
+    def write_member(self, member_name, data):
+        self.files[member_name] = data
+
+    def abort(self):
+        self.files.clear()
+        self.writes.clear()
+        self.manifest.clear()
+
+
+class ZipSink(ArchiveSink):
+    # Streams every footprint into one zip archive through a single file handle
+
+    def __init__(self, archive_path, compression=zipfile.ZIP_DEFLATED):
+        super().__init__()
+        self.archive_path = Path(archive_path)
+        self.archive = zipfile.ZipFile(archive_path, mode='w', compression=compression)
+
+    def write_member(self, member_name, data):
+        member_info = zipfile.ZipInfo(member_name, date_time=ARCHIVE_DATE_TIME)
+        member_info.compress_type = self.archive.compression
+        member_info.external_attr = 0o644 << 16
+        self.archive.writestr(member_info, data)
+
+    def close(self):
+        super().close()
+        self.archive.close()
+
+    def abort(self):
+        self.archive.close()
+        self.archive_path.unlink(missing_ok=True)
+
+
+class TarSink(ArchiveSink):
+    # Streams every footprint into one tar archive through a single file handle
+    # compression: "" (plain tar), "gz", "bz2" or "xz"
+
+    def __init__(self, archive_path, compression=""):
+        super().__init__()
+        self.archive_path = Path(archive_path)
+        self.archive = tarfile.open(archive_path, mode=f"w:{compression}", format=tarfile.PAX_FORMAT)
+
+    def write_member(self, member_name, data):
+        member_info = tarfile.TarInfo(member_name)
+        member_info.size = len(data)
+        member_info.mode = 0o644
+        self.archive.addfile(member_info, io.BytesIO(data))
+
+    def close(self):
+        super().close()
+        self.archive.close()
+
+    def abort(self):
+        self.archive.close()
+        self.archive_path.unlink(missing_ok=True)
+
+
+# Archive suffixes accepted by open_archive_sink and the sink each one creates
+ARCHIVE_SUFFIXES = {
+    ".zip": lambda archive_path: ZipSink(archive_path),
+    ".tar": lambda archive_path: TarSink(archive_path),
+    ".tar.gz": lambda archive_path: TarSink(archive_path, "gz"),
+    ".tgz": lambda archive_path: TarSink(archive_path, "gz"),
+    ".tar.bz2": lambda archive_path: TarSink(archive_path, "bz2"),
+    ".tar.xz": lambda archive_path: TarSink(archive_path, "xz"),
+}
+
+
+# Opens the archive sink matching the file name of archive_path (i.e. library.zip, library.tar.xz)
+def open_archive_sink(archive_path):
+    for suffix, create_sink in ARCHIVE_SUFFIXES.items():
+        if archive_path.name.endswith(suffix):
+            return create_sink(archive_path)
+    raise ValueError(f"Unknown archive type: {archive_path.name} (expected one of {', '.join(ARCHIVE_SUFFIXES)})")
@@ -0,0 +1,172 @@
+import math
+
+
+# Planar shapes and a uniform grid index for finding nearby shapes among thousands in near-linear time
+# Coordinates are in mm with KiCad's axes (y grows downwards); angles are in degrees, counterclockwise on screen
+#
+# Shapes:
+#   ("circle", center x, center y, radius)
+#   ("polygon", [(x, y), ...])  - convex, corners in order
+
+
+def circle(center_x, center_y, radius):
+    return ("circle", center_x, center_y, radius)
+
+
+# Rectangle of the given size centered on (center_x, center_y), turned by angle
+def rectangle(center_x, center_y, width, height, angle=0):
+    corners = [(-width / 2, -height / 2), (width / 2, -height / 2), (width / 2, height / 2), (-width / 2, height / 2)]
+    return ("polygon", [(center_x + x, center_y + y) for x, y in (rotate_point(x, y, angle) for x, y in corners)])
+
+
+# Oval (stadium) of the given size, turned by angle; a circle when width and height match
+# The round ends are approximated by arc_points corners each (inscribed, within 2% of the radius at the default)
+def oval(center_x, center_y, width, height, angle=0, arc_points=9):
+    if width == height:
+        return circle(center_x, center_y, width / 2)
+    radius = min(width, height) / 2
+    half_length = abs(width - height) / 2
+    corners = []
+    for end in (1, -1):
+        for point in range(arc_points):
+            arc_angle = math.pi * point / (arc_points - 1) - math.pi / 2
+            x, y = radius * math.cos(arc_angle) * end, radius * math.sin(arc_angle) * end
+            corners.append((x + half_length * end, y) if width > height else (y, -x - half_length * end))
+    return ("polygon", [(center_x + x, center_y + y) for x, y in (rotate_point(x, y, angle) for x, y in corners)])
+
+
+# Rotates a point around the origin the way KiCad rotates footprint contents
+def rotate_point(x, y, angle):
+    if not angle:
+        return x, y
+    radians = math.radians(angle)
+    cos, sin = math.cos(radians), math.sin(radians)
+    return x * cos + y * sin, -x * sin + y * cos
+
+
+# Shape moved to a footprint placed at (offset_x, offset_y) and turned by angle
+def transform_shape(shape, offset_x, offset_y, angle):
+    if shape[0] == "circle":
+        x, y = rotate_point(shape[1], shape[2], angle)
+        return ("circle", x + offset_x, y + offset_y, shape[3])
+    return ("polygon", [(x + offset_x, y + offset_y) for x, y in (rotate_point(x, y, angle) for x, y in shape[1])])
+
+
+# (min x, min y, max x, max y)
+def shape_bounds(shape):
+    if shape[0] == "circle":
+        _, x, y, radius = shape
+        return x - radius, y - radius, x + radius, y + radius
+    xs = [x for x, _ in shape[1]]
+    ys = [y for _, y in shape[1]]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+# Smallest distance between the outlines of two shapes; 0 when they touch or overlap
+def shape_distance(shape_a, shape_b):
+    if shape_a[0] == "circle" and shape_b[0] == "circle":
+        return max(0.0, math.hypot(shape_a[1] - shape_b[1], shape_a[2] - shape_b[2]) - shape_a[3] - shape_b[3])
+    if shape_a[0] == "circle":
+        shape_a, shape_b = shape_b, shape_a
+    if shape_b[0] == "circle":
+        _, x, y, radius = shape_b
+        if point_in_polygon(x, y, shape_a[1]):
+            return 0.0
+        return max(0.0, polygon_point_distance(shape_a[1], x, y) - radius)
+    if polygons_intersect(shape_a[1], shape_b[1]):
+        return 0.0
+    return min(min(polygon_point_distance(shape_b[1], x, y) for x, y in shape_a[1]),
+               min(polygon_point_distance(shape_a[1], x, y) for x, y in shape_b[1]))
+
+
+# Whether two shapes come closer than clearance (with no clearance: whether they touch or overlap)
+def shapes_conflict(shape_a, shape_b, clearance=0.0):
+    distance = shape_distance(shape_a, shape_b)
+    return distance < clearance or distance == 0
+
+
+def point_in_polygon(x, y, polygon):
+    sign = 0
+    for (start_x, start_y), (end_x, end_y) in zip(polygon, polygon[1:] + polygon[:1]):
+        cross = (end_x - start_x) * (y - start_y) - (end_y - start_y) * (x - start_x)
+        if cross:
+            if sign and (cross > 0) != (sign > 0):
+                return False
+            sign = cross
+    return True
+
+
+def polygon_point_distance(polygon, x, y):
+    return min(segment_point_distance(start, end, x, y) for start, end in zip(polygon, polygon[1:] + polygon[:1]))
+
+
+def segment_point_distance(start, end, x, y):
+    delta_x, delta_y = end[0] - start[0], end[1] - start[1]
+    length_squared = delta_x * delta_x + delta_y * delta_y
+    position = 0.0
+    if length_squared:
+        position = max(0.0, min(1.0, ((x - start[0]) * delta_x + (y - start[1]) * delta_y) / length_squared))
+    return math.hypot(start[0] + position * delta_x - x, start[1] + position * delta_y - y)
+
+
+# Separating axis test for convex polygons (touching counts as intersecting)
+def polygons_intersect(polygon_a, polygon_b):
+    for polygon in (polygon_a, polygon_b):
+        for (start_x, start_y), (end_x, end_y) in zip(polygon, polygon[1:] + polygon[:1]):
+            axis_x, axis_y = start_y - end_y, end_x - start_x
+            projections_a = [x * axis_x + y * axis_y for x, y in polygon_a]
+            projections_b = [x * axis_x + y * axis_y for x, y in polygon_b]
+            if max(projections_a) < min(projections_b) or max(projections_b) < min(projections_a):
+                return False
+    return True
+
+
+class GridIndex:
+    # Uniform grid over shape bounds: each item is filed under every cell its bounds touch, so only items
+    # sharing a cell are ever compared. With cells about the size of the typical item, finding every close pair
+    # costs roughly linear time in the number of items
+    # margin: Widens every item's bounds (i.e. by the clearance being checked) so near misses share a cell too
+    #
+    # Example:
+    #   grid_index = GridIndex(cell_size=5)
+    #   for item_id, shape in enumerate(shapes):
+    #       grid_index.insert(item_id, shape_bounds(shape))
+    #   for item_a, item_b in grid_index.candidate_pairs():
+    #       ...
+
+    def __init__(self, cell_size, margin=0.0):
+        self.cell_size = cell_size
+        self.margin = margin
+        self.cells = {}
+
+    def cell_range(self, bounds):
+        min_x, min_y, max_x, max_y = bounds
+        margin = self.margin
+        return (range(math.floor((min_x - margin) / self.cell_size), math.floor((max_x + margin) / self.cell_size) + 1),
+                range(math.floor((min_y - margin) / self.cell_size), math.floor((max_y + margin) / self.cell_size) + 1))
+
+    def insert(self, item_id, bounds):
+        cells = self.cells
+        columns, rows = self.cell_range(bounds)
+        for column in columns:
+            for row in rows:
+                cells.setdefault((column, row), []).append(item_id)
+
+    # IDs of every item whose cells overlap the bounds
+    def query(self, bounds):
+        found = set()
+        columns, rows = self.cell_range(bounds)
+        for column in columns:
+            for row in rows:
+                found.update(self.cells.get((column, row), ()))
+        return found
+
+    # Every (item_a, item_b) pair with item_a < item_b sharing at least one cell
+    def candidate_pairs(self):
+        pairs = set()
+        for cell_items in self.cells.values():
+            if len(cell_items) > 1:
+                for index, item_a in enumerate(cell_items):
+                    for item_b in cell_items[index + 1:]:
+                        pairs.add((item_a, item_b) if item_a < item_b else (item_b, item_a))
+        return pairs
@@ -0,0 +1,39 @@
+import pickle
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+GENERATOR_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(GENERATOR_DIR))
+
+from generate import FootprintParseError
+
+
+class FootprintParseErrorTest(unittest.TestCase):
+
+    def test_pickle_round_trip(self):
+        error = pickle.loads(pickle.dumps(FootprintParseError("Unexpected end of file", 1, 22)))
+        self.assertEqual((error.message, error.line, error.column), ("Unexpected end of file", 1, 22))
+        self.assertEqual(str(error), "Unexpected end of file (line 1, column 22)")
+
+
+class BulkEditMalformedFileTest(unittest.TestCase):
+
+    def test_malformed_file_in_pool(self):
+        with tempfile.TemporaryDirectory() as root:
+            library_path = Path(root) / "Test.pretty"
+            library_path.mkdir()
+            (library_path / "Broken.kicad_mod").write_text('(footprint "Broken" (layer')
+            (library_path / "Fine.kicad_mod").write_text('(footprint "Fine" (layer "F.Cu"))\n')
+            result = subprocess.run([sys.executable, str(GENERATOR_DIR / "bulk_edit.py"), "-q", "layer", "-j", "2",
+                                     "-r", root], capture_output=True, text=True)
+        self.assertEqual(result.returncode, 1)
+        self.assertIn("Footprint parsing failed", result.stderr)
+        self.assertIn("Broken.kicad_mod: Unexpected end of file (line 1, column 27)", result.stderr)
+        self.assertNotIn("BrokenProcessPool", result.stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import sys
+import tracemalloc
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from instrumentation import Instrumentation
+
+
+class TraceAllocationsTest(unittest.TestCase):
+
+    def tearDown(self):
+        tracemalloc.stop()
+
+    def test_peak_bytes_of_stage_freeing_what_it_allocates(self):
+        instrumentation = Instrumentation(trace_allocations=True)
+        with instrumentation.stage("encode", "MX-Hotswap", "1U"):
+            buffers = [bytes(64) for _ in range(1000)]
+            del buffers
+        row, = instrumentation.rows()
+        self.assertGreater(row["peak_bytes"], 64 * 1000)
+        self.assertIn("peak_bytes", instrumentation.to_csv().splitlines()[0])
+
+    def test_untraced_rows_keep_report_fields(self):
+        instrumentation = Instrumentation()
+        with instrumentation.stage("encode", "MX-Hotswap", "1U"):
+            pass
+        row, = instrumentation.rows()
+        self.assertNotIn("peak_bytes", row)
+        self.assertFalse(tracemalloc.is_tracing())
+
+
+if __name__ == '__main__':
+    unittest.main()
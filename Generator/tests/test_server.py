@@ -0,0 +1,62 @@
+import sys
+import threading
+import unittest
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import families
+from generate_all import REPO_ROOT, resolve_families
+from server import FootprintRequestHandler, FootprintServer
+
+
+class FootprintServerTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.footprint_server = FootprintServer(resolve_families(families.FAMILIES, REPO_ROOT))
+        FootprintRequestHandler.footprint_server = cls.footprint_server
+        cls.http_server = ThreadingHTTPServer(("127.0.0.1", 0), FootprintRequestHandler)
+        threading.Thread(target=cls.http_server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.http_server.shutdown()
+        cls.http_server.server_close()
+
+    def request(self, query):
+        try:
+            with urlopen(f"http://127.0.0.1:{self.http_server.server_port}/footprint?{query}") as response:
+                return response.status, response.read()
+        except HTTPError as e:
+            return e.code, e.read()
+
+    def test_footprint(self):
+        status, data = self.request("family=MX-Hotswap&size=1.5")
+        self.assertEqual(status, 200)
+        self.assertIn(b'(footprint "MX-Hotswap-1.5U"', data)
+
+    def test_rejects_non_positive_sizes(self):
+        for size in ("0", "-3", "nan", "inf"):
+            with self.subTest(size=size):
+                self.assertEqual(self.request(f"family=MX-Hotswap&size={size}")[0], 400)
+
+    def test_rejects_non_positive_parameters(self):
+        for parameter in ("unit_width", "unit_height", "stabilizer_dist", "stabilizer_dist_right"):
+            for value in ("0", "-19.05", "nan"):
+                with self.subTest(parameter=parameter, value=value):
+                    self.assertEqual(self.request(f"family=MX-Hotswap&size=2&{parameter}={value}")[0], 400)
+
+    def test_rejected_requests_are_not_cached(self):
+        with self.assertRaises(ValueError):
+            self.footprint_server.get_footprint("MX-Hotswap", -3)
+        with self.assertRaises(ValueError):
+            self.footprint_server.get_footprint("MX-Hotswap", 1, unit_width=0)
+        self.assertFalse(any(cache_key[1] == -3 for cache_key in self.footprint_server.cache))
+
+
+if __name__ == '__main__':
+    unittest.main()
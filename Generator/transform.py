@@ -0,0 +1,351 @@
+import argparse
+import copy
+import math
+import sys
+from pathlib import Path
+import families
+from footprint_tree import find_child, unquote
+from generate import (FootprintEncoder, FootprintParseError, FootprintParser, FootprintsGenerator, get_keysizes,
+                      write_if_changed)
+from generate_all import REPO_ROOT, load_manifest, resolve_families
+from geometry import format_number
+from instrumentation import configure_logging
+
+
+# Rotated, mirrored and scaled copies of footprints, with every coordinate transformed in one pass
+# FootprintTransformer walks a footprint once and collects every coordinate-bearing list (at, start, end, center,
+# mid, xy) into flat columns; each transform is then a single affine matrix applied to the whole column and
+# written back into the same tree, so a set of angled variants (i.e. every 5 degrees) costs one walk per footprint
+#
+# Conventions (same as KiCad and spatial.rotate_point): y grows downwards, angles are counterclockwise on screen.
+# A transform mirrors left to right first, then scales, then rotates around the footprint origin
+#   - Pad and text angles are turned along (and negated when mirrored); text is kept upright and unmirrored,
+#     with left/right (and top/bottom) justification swapped so it stays on the same side of its anchor
+#   - Coordinates local to a pad (drill offsets, custom pad primitives) only follow the mirroring, as the pad's
+#     own angle already carries the rotation
+#   - fp_rect is axis-aligned in KiCad, so rectangles become fp_poly for angles that are not a multiple of 90
+#   - 3D model offsets and rotations are turned along; mirrored models get a negative x scale
+#   - Scaling only moves things: pad, drill, stroke and text sizes are kept
+#
+# Example:
+#   transformer = FootprintTransformer(footprint, convert_rectangles=True)
+#   for angle in step_angles(5):
+#       output_data = encode_variant(transformer.apply(angle=angle), variant_suffix(angle))
+
+
+# Lists holding a point as (name x y ...)
+POINT_NODE_NAMES = frozenset(("at", "start", "end", "center", "mid", "xy"))
+
+# Lists holding text whose angle is kept readable
+TEXT_NODE_NAMES = frozenset(("property", "fp_text"))
+
+# Stand-in for the variant suffix in footprint names while transforming (cannot occur in footprint files)
+NAME_SUFFIX_SENTINEL = "\x02"
+
+JUSTIFY_SWAPS = {"left": "right", "right": "left", "top": "bottom", "bottom": "top"}
+
+
+# Affine matrix (a, b, c, d, offset x, offset y) mapping (x, y) to (a x + b y + offset x, c x + d y + offset y)
+def affine_matrix(angle=0, mirror=False, scale=1, offset_x=0, offset_y=0):
+    radians = math.radians(angle)
+    cos, sin = scale * math.cos(radians), scale * math.sin(radians)
+    if mirror:
+        return -cos, sin, sin, cos, offset_x, offset_y
+    return cos, sin, -sin, cos, offset_x, offset_y
+
+
+# Applies matrix to columns of x and y values; returns the new columns
+def transform_points(matrix, xs, ys):
+    a, b, c, d, offset_x, offset_y = matrix
+    return [a * x + b * y + offset_x for x, y in zip(xs, ys)], [c * x + d * y + offset_y for x, y in zip(xs, ys)]
+
+
+def normalize_angle(angle):
+    return round(angle, 6) % 360
+
+
+# fp_poly with the corners of an fp_rect (and its stroke, fill, layer and uuid)
+def rectangle_polygon(rectangle):
+    start, end = find_child(rectangle, "start"), find_child(rectangle, "end")
+    corners = [(start[1], start[2]), (end[1], start[2]), (end[1], end[2]), (start[1], end[2])]
+    polygon = type(rectangle)(["fp_poly", ["pts"] + [["xy", x, y] for x, y in corners]])
+    polygon.extend(element for element in rectangle[1:] if element is not start and element is not end)
+    return polygon
+
+
+class FootprintTransformer:
+    # Transforms a footprint tree in place, any number of times; every apply starts from the original coordinates,
+    # so the same tree can be transformed, encoded and transformed again without copying it
+    # convert_rectangles: Replace fp_rect with fp_poly (needed for angles that are not a multiple of 90)
+
+    def __init__(self, footprint, convert_rectangles=False):
+        self.footprint = footprint
+        self.convert_rectangles = convert_rectangles
+        # Point lists in footprint coordinates, and in pad coordinates (mirrored only); x is at 1, y at 2
+        self.points = []
+        self.local_points = []
+        # (at list, base angle, whether the angle was written, justify list or None, base justify atoms)
+        self.pad_angles = []
+        self.text_angles = []
+        # (offset xyz, scale xyz, rotate xyz, base values of each)
+        self.models = []
+        self.collect(footprint, local=False)
+        self.base_xs = [float(point[1]) for point in self.points]
+        self.base_ys = [float(point[2]) for point in self.points]
+        self.base_local_xs = [float(point[1]) for point in self.local_points]
+
+    def collect(self, node, local):
+        for index, element in enumerate(node):
+            if not isinstance(element, list) or not element:
+                continue
+            name = element[0]
+            if name == "fp_rect" and self.convert_rectangles and not local:
+                element = node[index] = rectangle_polygon(element)
+                name = element[0]
+
+            if name in POINT_NODE_NAMES and len(element) >= 3:
+                (self.local_points if local else self.points).append(element)
+            elif name == "model":
+                self.collect_model(element)
+                continue
+            elif name == "pad":
+                at = find_child(element, "at")
+                if at is not None:
+                    self.pad_angles.append((at, float(at[3]) if len(at) > 3 else 0.0, len(at) > 3, None, None))
+                drill = find_child(element, "drill")
+                offset = find_child(drill, "offset") if drill is not None else None
+                if offset is not None:
+                    self.local_points.append(offset)
+                primitives = find_child(element, "primitives")
+                if primitives is not None:
+                    self.collect(primitives, local=True)
+                self.collect([child for child in element if child is not primitives], local=local)
+                continue
+            elif name in TEXT_NODE_NAMES:
+                at = find_child(element, "at")
+                effects = find_child(element, "effects")
+                justify = find_child(effects, "justify") if effects is not None else None
+                if at is not None:
+                    self.text_angles.append((at, float(at[3]) if len(at) > 3 else 0.0, len(at) > 3, justify,
+                                             list(justify[1:]) if justify is not None else None))
+            self.collect(element, local)
+
+    def collect_model(self, model):
+        xyz_lists = []
+        for name in ("offset", "scale", "rotate"):
+            transform_list = find_child(model, name)
+            xyz = find_child(transform_list, "xyz") if transform_list is not None else None
+            xyz_lists.append(xyz)
+        if any(xyz is None or len(xyz) < 4 for xyz in xyz_lists):
+            return
+        self.models.append((*xyz_lists, [[float(value) for value in xyz[1:4]] for xyz in xyz_lists]))
+
+    # Transforms the footprint (see affine_matrix) and returns it
+    def apply(self, angle=0, mirror=False, scale=1, offset_x=0, offset_y=0):
+        matrix = affine_matrix(angle, mirror, scale, offset_x, offset_y)
+        xs, ys = transform_points(matrix, self.base_xs, self.base_ys)
+        for point, x, y in zip(self.points, xs, ys):
+            point[1] = format_number(x)
+            point[2] = format_number(y)
+        for point, x in zip(self.local_points, self.base_local_xs):
+            point[1] = format_number(-x if mirror else x)
+
+        for at, base_angle, had_angle, _, _ in self.pad_angles:
+            self.write_angle(at, normalize_angle(angle + (-base_angle if mirror else base_angle)), had_angle)
+
+        for at, base_angle, had_angle, justify, base_justify in self.text_angles:
+            text_angle = normalize_angle(angle + (-base_angle if mirror else base_angle))
+            upside_down = 90 < text_angle <= 270
+            if upside_down:
+                text_angle = normalize_angle(text_angle - 180)
+            self.write_angle(at, text_angle, had_angle)
+            if justify is not None:
+                justify[1:] = [JUSTIFY_SWAPS[atom] if (atom in ("left", "right") and mirror != upside_down)
+                               or (atom in ("top", "bottom") and upside_down) else atom for atom in base_justify]
+
+        for offset, model_scale, rotate, (base_offset, base_scale, base_rotate) in self.models:
+            # Model offsets point up (y grows upwards)
+            (x,), (y,) = transform_points(matrix, [base_offset[0]], [-base_offset[1]])
+            offset[1:3] = [format_number(x), format_number(-y)]
+            model_scale[1] = format_number(-base_scale[0] if mirror else base_scale[0])
+            rotate[2:4] = [format_number(-value if mirror else value) for value in base_rotate[1:3]]
+            model_angle = (-base_rotate[2] if mirror else base_rotate[2]) + angle
+            rotate[3] = format_number(model_angle - 360 if model_angle > 180 else model_angle)
+        return self.footprint
+
+    @staticmethod
+    def write_angle(at, angle, had_angle):
+        del at[3:]
+        if had_angle or angle:
+            at.append(format_number(angle))
+
+
+# Copy of footprint, transformed (see FootprintTransformer.apply)
+def transform_footprint(footprint, angle=0, mirror=False, scale=1, offset_x=0, offset_y=0):
+    transformer = FootprintTransformer(copy.deepcopy(footprint), convert_rectangles=bool(angle % 90))
+    return transformer.apply(angle=angle, mirror=mirror, scale=scale, offset_x=offset_x, offset_y=offset_y)
+
+
+# Every multiple of step below 360, without 0 (i.e. 5 -> 5, 10, ..., 355)
+def step_angles(step):
+    angles = [normalize_angle(step * index) for index in range(1, int(360 / step + 1e-9) + 1)]
+    return [angle for angle in angles if angle]
+
+
+# Name suffix of a transformed variant (i.e. -Rot15, -Mirrored-Rot15, -Scaled0.9)
+def variant_suffix(angle=0, mirror=False, scale=1):
+    suffix = "-Mirrored" if mirror else ""
+    if angle:
+        suffix += f"-Rot{format_number(angle)}"
+    if scale != 1:
+        suffix += f"-Scaled{format_number(scale)}"
+    return suffix
+
+
+# Appends NAME_SUFFIX_SENTINEL to the footprint's name wherever it appears as a whole token (the footprint
+# itself and properties holding the name), so encode_variant can give each variant its own name
+def mark_name(footprint):
+    name = unquote(footprint[1])
+    stack = [footprint]
+    while stack:
+        node = stack.pop()
+        for index, element in enumerate(node):
+            if isinstance(element, list):
+                stack.append(element)
+            elif unquote(element) == name:
+                node[index] = f'"{name}{NAME_SUFFIX_SENTINEL}"'
+    return footprint
+
+
+# Encoded footprint with NAME_SUFFIX_SENTINEL replaced by suffix
+def encode_variant(footprint, suffix):
+    return FootprintEncoder(footprint=footprint, debug=False,
+                            replacements={NAME_SUFFIX_SENTINEL: suffix}).encoded_footprint.encode()
+
+
+# Yields (footprint name, encoded footprint) for every variant in variants ([(angle, mirror), ...]) of every
+# footprint in footprints ([(footprint name, footprint with a marked name), ...])
+def iter_variants(footprints, variants, scale=1):
+    convert_rectangles = any(angle % 90 for angle, _ in variants)
+    for name, footprint in footprints:
+        transformer = FootprintTransformer(footprint, convert_rectangles=convert_rectangles)
+        for angle, mirror in variants:
+            suffix = variant_suffix(angle, mirror, scale)
+            yield f"{name}{suffix}", encode_variant(transformer.apply(angle=angle, mirror=mirror, scale=scale), suffix)
+
+
+# Generated footprints of a family with marked names (see mark_name), one at a time
+def family_footprints(family_def):
+    footprints_generator = FootprintsGenerator(
+        input_file=family_def["template"], output_dir=None, keysizes_type=family_def["keysizes_type"],
+        family_name=family_def["family_name"], unit_width=family_def["unit_width"],
+        unit_height=family_def["unit_height"], debug=False, deterministic=True)
+    for keysize_def in get_keysizes(family_def["keysizes_type"]):
+        for key_variant_name, elements in footprints_generator.create_keysize_variants(
+                keysize_def=keysize_def, keysizes_type=family_def["keysizes_type"],
+                unit_width=family_def["unit_width"], unit_height=family_def["unit_height"]):
+            yield f"{family_def['family_name']}-{key_variant_name}", footprints_generator.compiled_template.instantiate(
+                name=key_variant_name + NAME_SUFFIX_SENTINEL, elements=elements)
+
+
+def file_footprints(file_paths):
+    for file_path in file_paths:
+        yield file_path.stem, mark_name(FootprintParser(file_path.read_bytes()).processed_list)
+
+
+if __name__ == '__main__':
+
+    # Parse args
+
+    description_cmd = "Writes rotated, mirrored or scaled copies of footprints (i.e. every 5 degrees for a split board),\n" \
+                      "with pads, text, outlines and 3D models transformed together."
+    arg_parser = argparse.ArgumentParser(
+        description=description_cmd, formatter_class=argparse.RawTextHelpFormatter)
+
+    description_output = "Specify the output directory (i.e. an empty .pretty folder)."
+    arg_parser.add_argument("-o", "--output-dir", dest="output_dir", help=description_output, required=True)
+
+    description_angles = "Specify the angles (degrees, counterclockwise) to write variants for."
+    description_step = "Specify an angle step; variants are written for every multiple of it below 360 (i.e. 5)."
+    angles_group = arg_parser.add_mutually_exclusive_group()
+    angles_group.add_argument("-a", "--angles", dest="angles", help=description_angles, nargs="+", type=float)
+    angles_group.add_argument("-s", "--step", dest="step", help=description_step, type=float)
+
+    description_mirror = "Optional: Also write a mirrored (left to right) copy of every variant, and of the unrotated footprint."
+    arg_parser.add_argument("--mirror", dest="mirror", help=description_mirror, action="store_true")
+
+    description_scale = "Optional: Scale every coordinate by this factor (sizes are kept). Defaults to 1."
+    arg_parser.add_argument("--scale", dest="scale", help=description_scale, type=float, default=1)
+
+    description_input = "Optional: Transform these footprint files instead of generating families."
+    arg_parser.add_argument("-i", "--input-files", dest="input_files", help=description_input, nargs="+")
+
+    description_manifest = "Optional: JSON manifest file with the same schema as families.py. Defaults to families.FAMILIES."
+    arg_parser.add_argument("-m", "--manifest", dest="manifest", help=description_manifest)
+
+    description_root = "Optional: Directory that manifest paths are relative to. Defaults to the repository root."
+    arg_parser.add_argument("-r", "--root", dest="root", help=description_root, default=str(REPO_ROOT))
+
+    description_family = "Optional: Only transform these families (as named in the manifest)."
+    arg_parser.add_argument("-f", "--family", dest="family", help=description_family, nargs="+")
+
+    description_debug = "Optional: Enable debug mode."
+    arg_parser.add_argument("-d", "--debug", dest="debug",
+                            help=description_debug, action="store_true")
+
+    args = arg_parser.parse_args()
+    configure_logging(args.debug)
+
+    # Sanity check args
+
+    output_dir = Path(args.output_dir)
+    if not output_dir.is_dir():
+        print("Output dir invalid", file=sys.stderr)
+        sys.exit(1)
+
+    if args.step is not None and not 0 < args.step < 360:
+        print("Angle step invalid", file=sys.stderr)
+        sys.exit(1)
+
+    if args.scale <= 0:
+        print("Scale invalid", file=sys.stderr)
+        sys.exit(1)
+
+    angles = step_angles(args.step) if args.step else [normalize_angle(angle) for angle in args.angles or []]
+    variants = [(angle, False) for angle in angles]
+    if args.mirror:
+        variants += [(angle, True) for angle in [0.0] + [angle for angle in angles if angle]]
+    if args.scale != 1 and not any(angle == 0 and not mirror for angle, mirror in variants):
+        variants.insert(0, (0.0, False))
+    if not variants:
+        print("Nothing to write: give --angles, --step, --mirror or --scale", file=sys.stderr)
+        sys.exit(1)
+
+    if args.input_files:
+        file_paths = [Path(input_file) for input_file in args.input_files]
+        for file_path in file_paths:
+            if not file_path.is_file():
+                print(f"Input file invalid: {file_path}", file=sys.stderr)
+                sys.exit(1)
+        footprints = file_footprints(file_paths)
+    else:
+        family_defs = resolve_families(
+            load_manifest(Path(args.manifest)) if args.manifest else families.FAMILIES, Path(args.root))
+        if args.family:
+            unknown_families = set(args.family) - {family_def["family_name"] for family_def in family_defs}
+            if unknown_families:
+                print(f"Unknown families: {', '.join(sorted(unknown_families))}", file=sys.stderr)
+                sys.exit(1)
+            family_defs = [family_def for family_def in family_defs if family_def["family_name"] in args.family]
+        footprints = (footprint for family_def in family_defs for footprint in family_footprints(family_def))
+
+    # Write variants
+
+    written = 0
+    try:
+        for name, output_data in iter_variants(footprints, variants, scale=args.scale):
+            written += write_if_changed(output_dir / f"{name}.kicad_mod", output_data)
+    except FootprintParseError as e:
+        print(f"Footprint parsing failed: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"{written} footprints written to {output_dir}")
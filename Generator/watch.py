@@ -0,0 +1,203 @@
+import importlib
+import os
+import sys
+import time
+from pathlib import Path
+import generate
+import keysizes
+from generate import CompiledTemplate, FootprintParseError, FootprintsGenerator, FragmentCache, SpanParser, logger
+
+
+# Seconds between two checks of the watched files
+DEFAULT_POLL_INTERVAL = 0.2
+
+KEYSIZES_PATH = Path(keysizes.__file__).resolve()
+
+
+class IncrementalTemplate:
+    # Parsed template that re-parses only the top-level elements an edit touched
+    # The bytes shared by the old and new file at both ends are located first; top-level elements entirely
+    # inside them are kept as they are (elements after the edit just move), and only the elements overlapping
+    # the edited range are parsed again. Edits reaching the footprint's own header fall back to a full parse
+    #
+    # Example:
+    #   template = IncrementalTemplate(template_path.read_bytes())
+    #   if template.update(template_path.read_bytes()):
+    #       compiled_template = CompiledTemplate(template.footprint)
+
+    def __init__(self, data):
+        self.full_parses = 0
+        self.partial_parses = 0
+        self.parse(data)
+
+    def parse(self, data):
+        self.data = data
+        self.footprint = SpanParser(data).processed_list
+        # Byte ranges of the top-level elements in self.data (nested spans go stale after partial parses)
+        self.spans = list(self.footprint.spans)
+        self.full_parses += 1
+
+    # Returns whether the template changed
+    def update(self, data):
+        old_data = self.data
+        if data == old_data:
+            return False
+
+        prefix_length = len(os.path.commonprefix([old_data, data]))
+        max_suffix = min(len(old_data), len(data)) - prefix_length
+        suffix_length = 0
+        while suffix_length < max_suffix and old_data[-1 - suffix_length] == data[-1 - suffix_length]:
+            suffix_length += 1
+        old_end = len(old_data) - suffix_length
+        delta = len(data) - len(old_data)
+
+        # Top-level elements overlapping (or bordering) the edited range [prefix_length, old_end)
+        touched = [index for index, (start, end) in enumerate(self.spans)
+                   if start <= old_end and end >= prefix_length]
+        first_child = next((index for index, element in enumerate(self.footprint) if isinstance(element, list)), None)
+        if not touched or first_child is None or touched[0] < first_child:
+            self.parse(data)
+            return True
+
+        # Range of whole elements (and the whitespace between them) covering the edit, in the new data
+        start = min(self.spans[touched[0]][0], prefix_length)
+        end = max(self.spans[touched[-1]][1], old_end)
+        if start < self.spans[first_child][0] or end > self.footprint.end - 1:
+            self.parse(data)
+            return True
+        try:
+            wrapper = SpanParser(b"(" + data[start:end + delta] + b")").processed_list
+        except FootprintParseError:
+            # i.e. an edit that moved a parenthesis across element boundaries
+            self.parse(data)
+            return True
+        if any(not isinstance(element, list) for element in wrapper):
+            self.parse(data)
+            return True
+
+        new_spans = [(element_start + start - 1, element_end + start - 1)
+                     for element_start, element_end in wrapper.spans]
+        self.footprint[touched[0]:touched[-1] + 1] = wrapper
+        self.spans[touched[0]:touched[-1] + 1] = new_spans
+        for index in range(touched[0] + len(wrapper), len(self.spans)):
+            self.spans[index] = (self.spans[index][0] + delta, self.spans[index][1] + delta)
+        self.footprint.end += delta
+        self.data = data
+        self.partial_parses += 1
+        return True
+
+
+class FamilyWatcher:
+    # Warm generator for template authors: keeps every template parsed and compiled and the keysizes tables
+    # loaded, polls the template files and keysizes.py, and regenerates only the families a change affects
+    # Footprints are always generated with deterministic UUIDs, so unchanged files are not rewritten and
+    # KiCad only reloads what actually changed
+    # family_defs: Resolved family definitions (see generate_all.resolve_families)
+    #
+    # Example:
+    #   FamilyWatcher(family_defs, debug=False).run()
+
+    def __init__(self, family_defs, debug, poll_interval=DEFAULT_POLL_INTERVAL, output=sys.stdout):
+        self.family_defs = family_defs
+        self.debug = debug
+        self.poll_interval = poll_interval
+        self.output = output
+        self.fragment_cache = FragmentCache()
+        # Template path -> [stat signature, IncrementalTemplate or None, CompiledTemplate or None]
+        self.templates = {family_def["template"]: [None, None, None] for family_def in family_defs}
+        self.keysizes_signature = self.stat_signature(KEYSIZES_PATH)
+
+    @staticmethod
+    def stat_signature(file_path):
+        try:
+            stat = file_path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    # Re-reads templates whose stat changed; returns the paths of the templates that now parse differently
+    def poll_templates(self):
+        changed_paths = []
+        for template_path, template_state in self.templates.items():
+            signature = self.stat_signature(template_path)
+            if signature is None or signature == template_state[0]:
+                continue
+            template_state[0] = signature
+            data = template_path.read_bytes()
+            try:
+                if template_state[1] is None:
+                    template_state[1] = IncrementalTemplate(data)
+                elif not template_state[1].update(data):
+                    continue
+                template_state[2] = CompiledTemplate(template_state[1].footprint)
+            except (FootprintParseError, ValueError) as e:
+                # Keep watching: the template is probably being edited
+                print(f"Footprint parsing failed: {template_path.name}: {e}", file=sys.stderr)
+                template_state[1] = None
+                template_state[2] = None
+                continue
+            changed_paths.append(template_path)
+        return changed_paths
+
+    # Reloads keysizes.py when it changed; returns the keysizes types whose table changed
+    def poll_keysizes(self):
+        signature = self.stat_signature(KEYSIZES_PATH)
+        if signature == self.keysizes_signature:
+            return []
+        self.keysizes_signature = signature
+        old_tables = dict(generate.KEYSIZES_TYPES)
+        try:
+            importlib.reload(keysizes)
+        except Exception as e:
+            print(f"Reloading keysizes.py failed: {e}", file=sys.stderr)
+            return []
+        changed_types = []
+        for keysizes_type, table_name in generate.KEYSIZES_TABLE_NAMES.items():
+            new_table = getattr(keysizes, table_name, None)
+            if new_table is None:
+                continue
+            generate.KEYSIZES_TYPES[keysizes_type] = new_table
+            if new_table != old_tables[keysizes_type]:
+                changed_types.append(keysizes_type)
+        return changed_types
+
+    def regenerate(self, family_def):
+        compiled_template = self.templates[family_def["template"]][2]
+        if compiled_template is None:
+            return
+        start_time = time.perf_counter()
+        footprints_generator = FootprintsGenerator(
+            input_file=None, output_dir=family_def["output_dir"], keysizes_type=family_def["keysizes_type"],
+            family_name=family_def["family_name"], unit_width=family_def["unit_width"],
+            unit_height=family_def["unit_height"], debug=self.debug, footprint=compiled_template,
+            deterministic=True, fragment_cache=self.fragment_cache)
+        elapsed = time.perf_counter() - start_time
+        print(f"Regenerated {family_def['family_name']} ({len(footprints_generator.output_paths)} footprints) "
+              f"in {elapsed * 1000:.1f} ms", file=self.output, flush=True)
+
+    # One round of checks; returns the names of the regenerated families
+    def poll(self):
+        changed_templates = set(self.poll_templates())
+        changed_types = set(self.poll_keysizes())
+        regenerated = []
+        for family_def in self.family_defs:
+            if family_def["template"] in changed_templates or family_def["keysizes_type"] in changed_types:
+                self.regenerate(family_def)
+                regenerated.append(family_def["family_name"])
+        return regenerated
+
+    # Generates every family once, then regenerates on changes until interrupted (Ctrl+C)
+    def run(self):
+        self.poll()
+        print(f"Watching {len(self.templates)} templates and {KEYSIZES_PATH.name} (Ctrl+C to stop)",
+              file=self.output, flush=True)
+        try:
+            while True:
+                time.sleep(self.poll_interval)
+                self.poll()
+        except KeyboardInterrupt:
+            pass
+        for template_state in self.templates.values():
+            if template_state[1] is not None:
+                logger.debug("Template parses: %d full, %d partial",
+                             template_state[1].full_parses, template_state[1].partial_parses)